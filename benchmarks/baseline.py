@@ -0,0 +1,297 @@
+"""Callbacks of the AccountSpider before the compiled extraction plans, kept
+as the baseline of bench_extraction.py. Every cell is read with its own css
+selector through an ItemLoader, which translates the selector to XPath and
+evaluates it against the whole document.
+"""
+
+from scrapy.loader import ItemLoader
+from eutl_scraper.items import AccountItem, ContactItem
+from eutl_scraper.items import InstallationItem, ComplianceItem
+from eutl_scraper.spiders.AccountSpider import AccountSpider
+
+
+class BaselineAccountSpider(AccountSpider):
+    name = "accounts_baseline"
+
+    def parse_accountDetails(self, response):
+        accountID = (
+            response.css("input[name='accountID']::attr(value)").get() or ""
+        ).strip()
+        if self.is_completed("account", accountID):
+            return
+
+        # get table headers
+        headers = list(
+            map(
+                lambda x: x.strip(),
+                response.css(
+                    "table#tblAccountGeneralInfo>tr:nth-child(2)>td>span.titlelist::text"
+                ).getall(),
+            )
+        )
+
+        map_headers = {
+            "Account Type": "accountType",
+            "National Administrator": "registry",
+            "Related Installation/Aircraft Operator/Maritime Operator ID": "installationID",
+            "Account Holder Name": "accountHolderName",
+            "Account Status": "status",
+            "Account Opening Date": "openingDate",
+            "Account Closing Date": "closingDate",
+            "Commitment Period": "commitmentPeriod",
+            "Company Registration No": "companyRegistrationNumber",
+            "Authorised trading venue or central counterparty": "authorizedTradingVenue",
+        }
+        # parse account details
+        l = ItemLoader(item=AccountItem(), response=response)
+        l.add_value("accountURL", response.url)
+        l.add_css("accountID", "input[name='accountID']::attr(value)")
+        l.add_css("accountName", "font.bordertbheadfont::text")
+        l.add_css("registryCode", "input[name='registryCode']::attr(value)")
+        for i, h in enumerate(headers):
+            item_name = map_headers[h]
+            if item_name == "installationID":
+                l.add_css(
+                    item_name,
+                    f"table#tblAccountGeneralInfo>tr:nth-child({i+1})>td:nth-child(3)>a>span::text",
+                )
+                l.add_css(
+                    "installationURL",
+                    f"table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child({i+1})>a::attr(href)",
+                )
+            else:
+                l.add_css(
+                    item_name,
+                    f"table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child({i+1})>span.classictext::text",
+                )
+        yield l.load_item()
+
+        # parse contact details
+        columns = [
+            "accountID",
+            "contactType",
+            "name",
+            "legalEntityIdentifier",
+            "mainAddress",
+            "secondaryAddress",
+            "postalCode",
+            "city",
+            "country",
+            "telephone1",
+            "telephone2",
+            "eMail",
+        ]
+        l = ItemLoader(item=ContactItem(), response=response)
+        l.add_value("accountURL", response.url)
+        l.add_css("accountID", "input[name='accountID']::attr(value)")
+        for i, c in enumerate(columns[1:]):
+            l.add_css(
+                c,
+                "table#tblAccountContactInfo>tr:nth-child(3)>td:nth-child(%d)>span.classictext::text"
+                % (i + 1),
+            )
+        yield l.load_item()
+
+        # in case of operator account, parse installation information
+        installationURL = response.css(
+            "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(3)>a::attr(href)"
+        ).get()
+
+        if not installationURL:
+            self.mark_completed("account", accountID)
+        else:
+            installationURL = response.urljoin(installationURL.strip())
+            registryCode = (
+                response.css("input[name='registryCode']::attr(value)").get().strip()
+            )
+            installationID = (
+                response.css(
+                    "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(3)>a>span::text"
+                )
+                .get()
+                .strip()
+            )
+            installationID = registryCode + "_" + installationID
+            yield response.follow(
+                installationURL,
+                callback=self.parse_installation,
+                dont_filter=self.is_recovering,
+                meta={
+                    "accountID": accountID,
+                    "registryCode": registryCode,
+                    "installationID": installationID,
+                },
+            )
+
+    def parse_installation(self, response):
+        if self.delta_index is not None:
+            self.parsed_installations.add(response.meta.get("installationID"))
+        # installations are linked from all their (former) operator accounts
+        # and parsed for each account, so completion is recorded per page
+        if self.is_completed("installation", response.url):
+            self.mark_completed("account", response.meta.get("accountID"))
+            return
+
+        # determine whether it is an aircraft or maritime account
+        isAircraft = (
+            "Aircraft" in response.css("span.bordertbheadfont::text").get().strip()
+        )
+        isMaritime = (
+            "Maritime" in response.css("span.bordertbheadfont::text").get().strip()
+        )
+
+        # get tables with installation details
+        tables = response.css("table#tblChildDetails")
+
+        # Installation details: general
+        l = ItemLoader(item=InstallationItem(), selector=tables[0], response=response)
+        l.add_value("installationURL", response.url)
+        l.add_value(
+            "installationID", response.meta.get("installationID")
+        )  # already combined with registry code, i.e., unique in EUTL
+        l.add_value("registryCode", response.meta.get("registryCode"))
+        l.add_value("isAircraftOperator", str(isAircraft))
+        l.add_value("isMaritimeOperator", str(isMaritime))
+
+        # Installation details: installation details
+        if isAircraft:
+            cols = [
+                "installationID",
+                "ec7482009ID",
+                "monitoringPlanId",
+                "monitoringPlanFirstYear",
+                "monitoringPlanExpiry",
+                "subsidiary",
+                "parent",
+                "eprtrID",
+                "icaoID",
+                "firstYearOfEmissions",
+                "lastYearOfEmissions",
+            ]
+        elif isMaritime:
+            cols = [
+                "installationID",
+                "imo_id",
+                "shippingCompany",
+                "shippingCompanyType",
+                "shippingCompanyCountry",
+                "firstYearOfEmissions",
+                "lastYearOfEmissions",
+            ]
+        else:
+            cols = [
+                "installationID",
+                "name",
+                "permitID",
+                "permitEntryDate",
+                "permitExpiry",
+                "subsidiary",
+                "parent",
+                "eprtrID",
+                "firstYearOfEmissions",
+                "lastYearOfEmissions",
+            ]
+        for i, c in enumerate(cols[1:]):
+            l.add_css(
+                c,
+                "tr>td>table:nth-child(1)>tr:nth-child(3)>td:nth-child(%i)>span.classictext::text"
+                % (i + 2),
+            )
+
+        # Installation details: address
+        if isMaritime:
+            cols = [
+                "mainAddress",
+                "secondaryAddress",
+                "postalCode",
+                "city",
+                "country",
+                "region",
+                "activity",
+            ]
+        else:
+            cols = [
+                "mainAddress",
+                "secondaryAddress",
+                "postalCode",
+                "city",
+                "country",
+                "latitude",
+                "longitude",
+                "activity",
+            ]
+        for i, c in enumerate(cols):
+            l.add_css(
+                c,
+                "tr>td>table:nth-child(2)>tr:nth-child(3)>td:nth-child(%i)>span.classictext::text"
+                % (i + 1),
+            )
+        yield l.load_item()
+
+        # Compliance information
+        # need to take care of possible compliance over CHETS
+        complianceTables = tables[1].css("tr>td>div>table")
+        etsSystems = ["EUETS", "CHETS"]
+        for i, table in enumerate(complianceTables):
+            rows = table.css("tr")
+            for row in rows[2:]:
+                try:
+                    year = (
+                        row.css("td:nth-child(2)>span.classictext::text").get().strip()
+                    )
+                    year = int(year)
+                except:
+                    continue
+                l = ItemLoader(item=ComplianceItem(), selector=row, response=response)
+                l.add_value("installationID", response.meta.get("installationID"))
+                l.add_value("installationURL", response.url)
+                l.add_value("reportedInSystem", etsSystems[i])
+                l.add_css("phase", "td:nth-child(1)>span.classictext::text")
+                l.add_css("year", "td:nth-child(2)>span.classictext::text")
+                # extract the different allocation values
+                for td in row.css("td:nth-child(3)>span.classictext"):
+                    stars = td.css("sup::text").get()
+                    if stars == "****":
+                        l.add_value("allocation10c", td.css("::text").get().strip())
+                    elif stars == "*****":
+                        l.add_value(
+                            "allocationNewEntrance", td.css("::text").get().strip()
+                        )
+                    else:
+                        l.add_value("allocationFree", td.css("::text").get())
+                l.add_css("verified", "td:nth-child(4)>span.classictext::text")
+                l.add_css("surrendered", "td:nth-child(5)>span.classictext::text")
+                l.add_css(
+                    "surrenderedCumulative", "td:nth-child(6)>span.classictext::text"
+                )
+                l.add_css(
+                    "verifiedCumulative", "td:nth-child(7)>span.classictext::text"
+                )
+                l.add_css("complianceCode", "td:nth-child(8)>span.classictext::text")
+                l.add_css(
+                    "complianceCodeUpdated", "td:nth-child(8)>span.classictext::text"
+                )
+                yield l.load_item()
+
+            # Extract surrendering details but not for the CH table (links to same information)
+            if i > 0:
+                continue
+            links = table.css("a.listlink")
+            for link in links:
+                text = link.css("span::text").get().strip()
+                if text.startswith("Details on Surrendered Units"):
+                    url = response.urljoin(link.attrib["href"])
+                    yield response.follow(
+                        url,
+                        callback=self.parse_surrendered_details,
+                        meta={
+                            "accountID": response.meta.get("accountID"),
+                            "registryCode": response.meta.get("registryCode"),
+                            "installationID": response.meta.get("installationID"),
+                            "reportedInSystem": etsSystems[i],
+                            "installationURL": response.url,
+                        },
+                    )
+
+        self.mark_completed("installation", response.url)
+        self.mark_completed("account", response.meta.get("accountID"))
@@ -0,0 +1,134 @@
+"""CPU time per page of the AccountSpider detail and installation callbacks
+and of the tabular ESD compliance overview.
+
+Parses the fixture pages in benchmarks/fixtures repeatedly and reports the
+CPU time and document size per page, for the complete pages and for the pages
+sliced to the tables read by the callbacks (TableSliceMiddleware). The CPU
+time of sliced pages includes the slicing. The account and installation pages
+are also parsed with the callbacks before the compiled extraction plans
+(benchmarks/baseline.py) for comparison. Run from the project root:
+    python benchmarks/bench_extraction.py [number of repetitions]
+Extracted items are printed with (compare both to check the slicing):
+    python benchmarks/bench_extraction.py dump [sliced | baseline]
+The output of a run is kept in benchmarks/bench_extraction_output.txt.
+"""
+
+import json
+import os
+import sys
+import time
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from eutl_scraper.middlewares import get_table_slices
+from eutl_scraper.spiders.AccountSpider import AccountSpider
+from eutl_scraper.spiders.EsdSpider import EsdComplianceSpider
+from benchmarks.baseline import BaselineAccountSpider
+
+DIR_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PAGES = [
+    (
+        AccountSpider,
+        "account.html",
+        "parse_accountDetails",
+        "https://ec.europa.eu/clima/ets/singleAccount.do?accountID=90574&action=details&languageCode=en",
+        {},
+    ),
+    (
+        AccountSpider,
+        "installation.html",
+        "parse_installation",
+        "https://ec.europa.eu/clima/ets/ohaDetails.do?accountID=90574&action=all&languageCode=en",
+        {"accountID": "90574", "registryCode": "DE", "installationID": "DE_202"},
+    ),
+    (
+        EsdComplianceSpider,
+        "esd_compliance.html",
+        "parse_overview",
+        "https://ec.europa.eu/clima/ets/transactionsCompliance.do?languageCode=en&esdRegistry=-1&esdYear=&currentSortSettings=&resultList.currentPageNumber=1&nextList=Next%3E",
+        {},
+    ),
+]
+
+# account and installation pages parsed with the ItemLoader callbacks
+BASELINE_PAGES = [
+    (BaselineAccountSpider,) + page[1:] for page in PAGES if page[0] is AccountSpider
+]
+
+
+def get_response(fn, url, meta, slice_tables=None):
+    """Response for a fixture page
+    :param fn: <string> file name of the fixture
+    :param url: <string> url of the page
+    :param meta: <dict> request meta as set by the spider
+    :param slice_tables: <list> ids of tables the page is sliced to, None for the complete page
+    :return: <scrapy.http.HtmlResponse>
+    """
+    with open(os.path.join(DIR_FIXTURES, fn), "rb") as f:
+        body = f.read()
+    if slice_tables:
+        body = get_table_slices(body, tuple(slice_tables)) or body
+    return HtmlResponse(
+        url=url, body=body, encoding="utf-8", request=Request(url, meta=meta)
+    )
+
+
+def run(repetitions=200, sliced=False, pages=PAGES):
+    """Benchmark the spider callbacks
+    :param repetitions: <int> number of times each page is parsed
+    :param sliced: <boolean> parse pages sliced to the tables of the spider
+    :param pages: <list> pages to parse, PAGES or BASELINE_PAGES
+    :return: <dict> callback name: (CPU milliseconds, bytes) per page
+    """
+    results = {}
+    for spider_cls, fn, callback, url, meta in pages:
+        spider = spider_cls()
+        slice_tables = spider.slice_tables if sliced else None
+        start = time.process_time()
+        # parse fresh responses to include slicing and document parsing
+        for _ in range(repetitions):
+            response = get_response(fn, url, meta, slice_tables)
+            for _ in getattr(spider, callback)(response):
+                pass
+        results["%s.%s" % (spider_cls.__name__, callback)] = (
+            (time.process_time() - start) / repetitions * 1000,
+            len(response.body),
+        )
+    return results
+
+
+def dump(sliced=False, pages=PAGES):
+    """Print the extracted items of the fixture pages as json lines
+    :param sliced: <boolean> parse pages sliced to the tables of the spider
+    :param pages: <list> pages to parse, PAGES or BASELINE_PAGES
+    """
+    for spider_cls, fn, callback, url, meta in pages:
+        spider = spider_cls()
+        slice_tables = spider.slice_tables if sliced else None
+        response = get_response(fn, url, meta, slice_tables)
+        for x in getattr(spider, callback)(response):
+            if isinstance(x, Request):
+                print(json.dumps({"request": x.url, "meta": x.meta}))
+            else:
+                print(
+                    json.dumps({type(x).__name__: ItemAdapter(x).asdict()}, default=str)
+                )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "dump":
+        if sys.argv[2:] == ["baseline"]:
+            dump(pages=BASELINE_PAGES)
+        else:
+            dump(sliced=sys.argv[2:] == ["sliced"])
+    else:
+        repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+        for pages, sliced in [(BASELINE_PAGES, False), (PAGES, False), (PAGES, True)]:
+            for callback, (ms, size) in run(repetitions, sliced, pages).items():
+                print(
+                    "%s%s: %.2f ms CPU per page, %d bytes"
+                    % (callback, " (sliced)" if sliced else "", ms, size)
+                )
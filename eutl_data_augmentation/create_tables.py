@@ -10,7 +10,14 @@ from .mappings import (
 )
 import os
 import glob
+import json
+import sqlite3
 
+# sinks of the crawl that wrote each table last, written by the scraper
+# (eutl_scraper.shards.record_sources)
+FN_SOURCES = "shards/sources.json"
+# sources of parsed data in order of preference
+SOURCES = ["staging", "parquet", "csv"]
 
 # account information added by hand
 NEW_ACC = [
@@ -49,6 +56,174 @@ NEW_ACC = [
 ]
 
 
+def get_staging(dir_in, tables=()):
+    """Connection to the staging database of the scraper (EutlSqlitePipeline)
+    :param dir_in: <string> directory with parsed data
+    :param tables: <list: string> tables that have to be in the database
+    :return: <sqlite3.Connection> or None if the database or a table is missing
+    """
+    fn = dir_in + "staging.db"
+    if not os.path.exists(fn):
+        return None
+    conn = sqlite3.connect(fn)
+    existing = [
+        x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    ]
+    if any(t not in existing for t in tables):
+        conn.close()
+        return None
+    # registry names to registry codes, e.g., to join entitlements to installations
+    conn.create_function("registry_code", 1, map_registryCode_inv.get)
+    return conn
+
+
+def read_staging(conn, sql, params=(), **kwargs):
+    """Query the staging database
+    Columns declared as BOOLEAN are returned as booleans, columns declared
+    as TIMESTAMP as datetime
+    :param conn: <sqlite3.Connection> as returned by get_staging
+    :param sql: <string> query
+    :param params: <tuple> parameters of the query
+    :param kwargs: na_values and parse_dates as for pd.read_csv
+    :return: <pd.DataFrame>
+    """
+    cursor = conn.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    df = pd.DataFrame(cursor.fetchall(), columns=columns)
+    # the declared types of the query columns are only known for the tables
+    bools = set()
+    dates = set()
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"):
+        for x in conn.execute('PRAGMA table_info("%s")' % table):
+            if x[2] == "BOOLEAN":
+                bools.add(x[1])
+            elif x[2] == "TIMESTAMP":
+                dates.add(x[1])
+    for c in columns:
+        if c in bools:
+            df[c] = df[c].map({1: True, 0: False})
+        elif c in dates:
+            df[c] = pd.to_datetime(df[c], format="ISO8601")
+    return convert_parsed(df, **kwargs)
+
+
+def convert_parsed(df, na_values=None, parse_dates=None, **kwargs):
+    """Apply the csv options of read_parsed to typed data
+    :param df: <pd.DataFrame> from parquet files or the staging database
+    :param na_values: <list> values set to missing
+    :param parse_dates: <list: string> columns with dates
+    :param kwargs: further options of pd.read_csv, not used for typed data
+    :return: <pd.DataFrame>
+    """
+    if na_values is not None:
+        df = df.replace(na_values, np.nan)
+    for c in parse_dates or []:
+        df[c] = to_datetime(df[c])
+    return df
+
+
+def to_datetime(x):
+    """Convert parsed dates to datetime
+    The scraper writes dates in ISO format, data parsed by earlier versions
+    show them as in the EUTL, i.e., day first. Files appended to across
+    versions contain both formats.
+    :param x: <pd.Series> dates as text or datetime
+    :return: <pd.Series> of datetime
+    """
+    try:
+        return pd.to_datetime(x, format="ISO8601")
+    except ValueError:
+        return pd.to_datetime(x, format="mixed", dayfirst=True)
+
+
+def read_sources(dir_in):
+    """Sinks of the crawl that wrote each table last
+    :param dir_in: <string> directory with parsed data
+    :return: <dict> name of the data: list of sources ("staging", "parquet", "csv")
+    """
+    fn = dir_in + FN_SOURCES
+    if not os.path.isfile(fn):
+        return {}
+    with open(fn, encoding="utf-8") as f:
+        return {name: x["sinks"] for name, x in json.load(f).items()}
+
+
+def has_source(dir_in, name, source):
+    """Check whether parsed data exist in a source
+    :param dir_in: <string> directory with parsed data
+    :param name: <string> name of the data without extension, e.g., "compliance"
+    :param source: <string> "staging", "parquet", or "csv"
+    :return: <boolean>
+    """
+    if source == "staging":
+        conn = get_staging(dir_in, [name])
+        if conn is None:
+            return False
+        conn.close()
+        return True
+    if source == "parquet":
+        return len(glob.glob(dir_in + name + ".parquet/part-*.parquet")) > 0
+    return os.path.exists(dir_in + name + ".csv")
+
+
+def get_parsed_source(dir_in, names, source=None):
+    """Source to read parsed data from
+    By default a source written by the crawl that wrote the data last, typed
+    sources preferred. Data without record of the crawl (i.e., parsed by
+    earlier versions of the scraper) are read from the csv files.
+    :param dir_in: <string> directory with parsed data
+    :param names: <list: string> names of the data to read from the same source
+    :param source: <string> "staging", "parquet", or "csv" to force a source,
+                None for a source with the current data of all names
+    :return: <string> source
+    """
+    if source is not None:
+        return source
+    written = read_sources(dir_in)
+    available = [
+        x
+        for x in SOURCES
+        if all(
+            x in written.get(name, ["csv"]) and has_source(dir_in, name, x)
+            for name in names
+        )
+    ]
+    if not available:
+        raise FileNotFoundError(
+            "No source with the current data of %s in %s" % (names, dir_in)
+        )
+    print("Read %s from %s" % (", ".join(names), available[0]))
+    return available[0]
+
+
+def read_parsed(dir_in, name, columns=None, source=None, **kwargs):
+    """Read data as provided by the scraper.
+    Uses the staging database, the typed parquet output, or the csv file of
+    the scraper, whichever was written by the last crawl (see get_parsed_source)
+    :param dir_in: <string> directory with parsed data
+    :param name: <string> name of the data without extension, e.g., "compliance"
+    :param columns: <list: string> columns to read. If None, all columns are read
+    :param source: <string> "staging", "parquet", or "csv" to force a source
+    :param kwargs: further arguments passed to pd.read_csv. Of these, na_values
+                and parse_dates are also applied to typed data
+    :return: <pd.DataFrame>
+    """
+    source = get_parsed_source(dir_in, [name], source=source)
+    if source == "staging":
+        conn = get_staging(dir_in, [name])
+        cols = "*" if columns is None else ", ".join('"%s"' % c for c in columns)
+        df = read_staging(conn, 'SELECT %s FROM "%s"' % (cols, name), **kwargs)
+        conn.close()
+        return df
+    if source == "csv":
+        parse_dates = kwargs.pop("parse_dates", None)
+        df = pd.read_csv(dir_in + name + ".csv", usecols=columns, **kwargs)
+        return convert_parsed(df, parse_dates=parse_dates)
+    return convert_parsed(
+        pd.read_parquet(dir_in + name + ".parquet", columns=columns), **kwargs
+    )
+
+
 def create_csv_tables(
     dir_in,
     dir_out,
@@ -103,9 +278,9 @@ def create_esd_tables(dir_in, dir_out, save_data=True):
     fn_trans_blocks = dir_in + "esdTransactionBlocks.csv"
     fn_compliance = dir_in + "esdCompliance.csv"
 
-    df_t = pd.read_csv(fn_trans, parse_dates=["transactionDate"])
-    df_tb = pd.read_csv(fn_trans_blocks, parse_dates=["transactionDate"])
-    df_c = pd.read_csv(fn_compliance)
+    df_t = read_parsed(dir_in, "esdTransactions", parse_dates=["transactionDate"])
+    df_tb = read_parsed(dir_in, "esdTransactionBlocks", parse_dates=["transactionDate"])
+    df_c = read_parsed(dir_in, "esdCompliance")
     df_acc_euets = pd.read_csv(dir_out + "accounts.csv", low_memory=False)
     df_acc_holder_euets = pd.read_csv(dir_out + "accountHolders.csv")
     df_projects_euets = pd.read_csv(dir_out + "offset_projects.csv")
@@ -425,20 +600,38 @@ def create_table_installation(dir_in, dir_out, fn_coordinates=None, fn_nace=None
     """
     # get data: installation data together with addresses with updated coordinates
     #           and entitlements
-    df_inst = pd.read_csv(
-        dir_in + "installations.csv",
-    )
-    df_enti = pd.read_csv(
-        dir_in + "entitlements.csv", na_values=["Not Applicable", "Not Set"]
-    )
-    df_enti["installationID_new"] = df_enti.registry.map(
-        lambda x: map_registryCode_inv.get(x)
-    )
-    df_enti["installationID"] = (
-        df_enti["installationID_new"] + "_" + df_enti["installationID"].map(str)
-    )
-    df_enti = df_enti[["installationID", "euEntitlement", "chEntitlement"]].copy()
-    df_inst = df_inst.merge(df_enti, on="installationID", how="left")
+    source = get_parsed_source(dir_in, ["installations", "entitlements"])
+    if source == "staging":
+        conn = get_staging(dir_in, ["installations", "entitlements"])
+        # join in the staging database using the index on the installation
+        # identifier of entitlements (identifier without registry code)
+        df_inst = read_staging(
+            conn,
+            """SELECT i.*, e.euEntitlement, e.chEntitlement
+            FROM installations i LEFT JOIN entitlements e
+            ON e.installationID = substr(i.installationID, instr(i.installationID, '_') + 1)
+            AND registry_code(e.registry) || '_' || e.installationID = i.installationID""",
+        )
+        conn.close()
+        for c in ["euEntitlement", "chEntitlement"]:
+            df_inst[c] = df_inst[c].replace(["Not Applicable", "Not Set"], np.nan)
+    else:
+        df_inst = read_parsed(dir_in, "installations", source=source)
+        df_enti = read_parsed(
+            dir_in,
+            "entitlements",
+            source=source,
+            columns=["registry", "installationID", "euEntitlement", "chEntitlement"],
+            na_values=["Not Applicable", "Not Set"],
+        )
+        df_enti["installationID_new"] = df_enti.registry.map(
+            lambda x: map_registryCode_inv.get(x)
+        )
+        df_enti["installationID"] = (
+            df_enti["installationID_new"] + "_" + df_enti["installationID"].map(str)
+        )
+        df_enti = df_enti[["installationID", "euEntitlement", "chEntitlement"]].copy()
+        df_inst = df_inst.merge(df_enti, on="installationID", how="left")
 
     # add the trading system information
     df_inst["tradingSystem"] = "euets"
@@ -553,9 +746,6 @@ def create_table_compliance(dir_in, dir_out):
     :param dir_in: <string> directory with parsed data
     :param dir_out: <string> output directory
     """
-    # get data
-    df_comp = pd.read_csv(dir_in + "compliance.csv")
-
     # transform dataframe to be consistent with Installation object
     cols_comp = {
         "installationID": "installation_id",
@@ -574,6 +764,13 @@ def create_table_compliance(dir_in, dir_out):
         "reportedInSystem": "reportedInSystem",
     }
 
+    # get data
+    df_comp = read_parsed(
+        dir_in,
+        "compliance",
+        columns=[c for c in cols_comp.keys() if c != "allocationTotal"],
+    )
+
     # calculate total allocation
     df_comp["allocationTotal"] = (
         df_comp["allocationNewEntrance"].fillna(0)
@@ -605,7 +802,20 @@ def create_table_surrender(dir_in, dir_out):
     :param dir_out: <string> output directory
     """
     # get data
-    df_surr = pd.read_csv(dir_in + "surrendering.csv")
+    df_surr = read_parsed(
+        dir_in,
+        "surrendering",
+        columns=[
+            "installationID",
+            "year",
+            "unitType",
+            "amount",
+            "originatingRegistry",
+            "projectID",
+            "track",
+            "reportedInSystem",
+        ],
+    )
 
     # create offset project table
     df_proj = (
@@ -661,7 +871,7 @@ def create_table_accountHolder(dir_in, dir_out):
     :param dir_in: <string> directory with parsed data
     :param dir_out: <string> output directory
     """
-    df = pd.read_csv(dir_in + "/contacts.csv", na_values=["-", "na", ".", "0", "XXX"])
+    df = read_parsed(dir_in, "contacts", na_values=["-", "na", ".", "0", "XXX"])
 
     # Create a unique account holder ID that identifies duplicates
     def get_duplicate_matching(df, cols_duplication, col_id):
@@ -740,10 +950,14 @@ def create_table_account(dir_in, dir_out, useOrbis=True):
     :param useOrbis: <boolean> use orbis data"""
     # get account data and mapping for account types
     if useOrbis:
-        fn = dir_in + "accounts_w_orbis.csv"
+        df_acc = convert_parsed(
+            pd.read_csv(dir_in + "accounts_w_orbis.csv"),
+            parse_dates=["closingDate", "openingDate"],
+        )
     else:
-        fn = dir_in + "accounts.csv"
-    df_acc = pd.read_csv(fn, parse_dates=["closingDate", "openingDate"])
+        df_acc = read_parsed(
+            dir_in, "accounts", parse_dates=["closingDate", "openingDate"]
+        )
 
     # impute account id used in transactions
     # note that we deviate from ids used in the EUTL system (i.e., the links
@@ -864,8 +1078,9 @@ def create_table_transaction(
     # created project table to (eventually) add further projects.
     # Finally, unit type mappings to map to unitType_id
     # merge information from main transaction table to blocks
-    df = pd.read_csv(
-        dir_in + "transactionBlocks.csv",
+    df = read_parsed(
+        dir_in,
+        "transactionBlocks",
         low_memory=False,
         parse_dates=["transactionDate"],
     )
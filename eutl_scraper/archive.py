@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+from scrapy.responsetypes import responsetypes
+
+
+class PageArchive:
+    """Content-addressed archive of raw pages.
+
+    Page bodies are stored gzip compressed under their sha256 hash, i.e.,
+    identical pages are only stored once:
+        <dir>/objects/<first two characters of hash>/<hash>.gz
+    An sqlite index (<dir>/index.db) maps each url to the hash of the latest
+    archived body together with the status and content type of the response.
+    """
+
+    def __init__(self, dir_archive, commit_every=100):
+        """
+        :param dir_archive: <string> archive directory
+        :param commit_every: <int> number of stored pages after which the index
+                            is committed to disk
+        """
+        self.dir_archive = dir_archive
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        os.makedirs(os.path.join(dir_archive, "objects"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(dir_archive, "index.db"))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages "
+            "(url TEXT PRIMARY KEY, hash TEXT, status INTEGER, "
+            "contentType TEXT, fetched TEXT)"
+        )
+        self.conn.commit()
+
+    def get_object_path(self, page_hash):
+        """Path to the archived body
+        :param page_hash: <string> sha256 hash of body
+        :return: <string>
+        """
+        return os.path.join(
+            self.dir_archive, "objects", page_hash[:2], page_hash + ".gz"
+        )
+
+    def store(self, url, body, status=200, content_type=None):
+        """Archive a page
+        :param url: <string> url of the page
+        :param body: <bytes> page body
+        :param status: <int> http status of the response
+        :param content_type: <string> content type of the response
+        :return: <boolean> True if the body was new to the archive
+        """
+        page_hash = hashlib.sha256(body).hexdigest()
+        fn = self.get_object_path(page_hash)
+        is_new = not os.path.isfile(fn)
+        if is_new:
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            # write to temporary file first to never leave a truncated object
+            fn_tmp = "%s.%d.tmp" % (fn, os.getpid())
+            with gzip.open(fn_tmp, "wb") as f:
+                f.write(body)
+            os.replace(fn_tmp, fn)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            (url, page_hash, status, content_type, datetime.now().isoformat()),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+        return is_new
+
+    def get(self, url):
+        """Get an archived page
+        :param url: <string> url of the page
+        :return: <dict> with body, status, and contentType or None if not archived
+        """
+        row = self.conn.execute(
+            "SELECT hash, status, contentType FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        with gzip.open(self.get_object_path(row[0]), "rb") as f:
+            body = f.read()
+        return {"body": body, "status": row[1], "contentType": row[2]}
+
+    def get_response(self, request):
+        """Archived page as response to a request
+        :param request: <scrapy.Request> request for the page
+        :return: <scrapy.http.Response> flagged as "archived" or None if not archived
+        """
+        page = self.get(request.url)
+        if page is None:
+            return None
+        headers = {"Content-Type": page["contentType"]} if page["contentType"] else {}
+        respcls = responsetypes.from_args(
+            headers=headers, url=request.url, body=page["body"]
+        )
+        return respcls(
+            url=request.url,
+            status=page["status"],
+            headers=headers,
+            body=page["body"],
+            request=request,
+            flags=["archived"],
+        )
+
+    def get_urls(self):
+        """All archived urls
+        :return: <list> of urls
+        """
+        return [row[0] for row in self.conn.execute("SELECT url FROM pages")]
+
+    def commit(self):
+        """Write the index to disk"""
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
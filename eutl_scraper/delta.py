@@ -0,0 +1,161 @@
+import csv
+import os
+from datetime import date, datetime
+
+# columns of the account overview table and the corresponding account field
+OVERVIEW_COLUMNS = {
+    "Account Type": "accountType",
+    "Account Holder Name": "accountHolderName",
+    "Installation/Aircraft ID": "installationID",
+    "Account Status": "status",
+    "Company Registration No": "companyRegistrationNumber",
+}
+# overview column with the compliance code of the latest reported year
+LATEST_COMPLIANCE_CODE = "Latest Compliance Code"
+
+
+def normalize(x):
+    """Normalize text for comparison, i.e., collapse whitespace
+    :param x: <string> text to normalize
+    :return: <string>
+    """
+    if x is None:
+        return ""
+    return " ".join(x.split())
+
+
+def read_rows(fn):
+    """Stream rows of a parsed csv file
+    :param fn: <string> path to csv file
+    :return: <generator> of row dictionaries
+    """
+    if not os.path.isfile(fn):
+        return
+    with open(fn, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+class DeltaIndex:
+    """Index of the account data parsed in a previous crawl.
+
+    The index holds the previous account data and, per installation, whether
+    it has an open compliance year. A compliance year is open if its
+    compliance deadline had not passed when the previous data were parsed,
+    i.e., reported emissions or surrendered units may have changed since.
+    Rows of unchanged accounts and installations are streamed from the
+    previous files when they are carried forward into the new output.
+    """
+
+    def __init__(self, dir_in, compliance_deadline="09-30", today=None):
+        """
+        :param dir_in: <string> directory with previously parsed data
+        :param compliance_deadline: <string> month-day of the compliance deadline
+                            for the emissions of the previous year
+        :param today: <datetime.date> date of the current crawl
+        """
+        self.dir_in = dir_in
+        today = today or date.today()
+        fn_compliance = self.get_file_name("compliance.csv")
+        if not os.path.isfile(self.get_file_name("accounts.csv")):
+            raise ValueError("No previous account data in %s" % dir_in)
+
+        # previous accounts
+        self.accounts = {
+            row["accountID"]: row
+            for row in read_rows(self.get_file_name("accounts.csv"))
+        }
+
+        # installations parsed in the previous crawl
+        self.installations = set(
+            row["installationID"]
+            for row in read_rows(self.get_file_name("installations.csv"))
+        )
+
+        # latest compliance code and open compliance years per installation
+        snapshot = (
+            datetime.fromtimestamp(os.path.getmtime(fn_compliance)).date()
+            if os.path.isfile(fn_compliance)
+            else today
+        )
+        month, day = map(int, compliance_deadline.split("-"))
+        self.latest_compliance = {}
+        self.open_installations = set()
+        for row in read_rows(fn_compliance):
+            if row["reportedInSystem"] != "EUETS":
+                continue
+            try:
+                year = int(row["year"])
+            except ValueError:
+                continue
+            installationID = row["installationID"]
+            if year < today.year and snapshot < date(year + 1, month, day):
+                self.open_installations.add(installationID)
+            if row["complianceCode"]:
+                latest = self.latest_compliance.get(installationID)
+                if latest is None or latest[0] < year:
+                    self.latest_compliance[installationID] = (
+                        year,
+                        row["complianceCode"],
+                    )
+
+    def get_file_name(self, name):
+        """Path to file with previously parsed data
+        :param name: <string> name of the file, e.g., "accounts.csv"
+        :return: <string>
+        """
+        return os.path.join(self.dir_in, name)
+
+    def get_installation_id(self, account):
+        """Installation identifier of an account as used in the installation data
+        :param account: <dict> previous account row
+        :return: <string> installation identifier or None if no installation
+        """
+        if not account["installationID"]:
+            return None
+        return account["registryCode"] + "_" + account["installationID"]
+
+    def is_changed(self, accountID, overview):
+        """Compare account shown in the overview to previous data
+        Accounts without any column to compare are treated as changed
+        :param accountID: <string> account identifier
+        :param overview: <dict> column name: value of the account's overview row
+        :return: <boolean> True if account is new or has changed
+        """
+        account = self.accounts.get(accountID)
+        if account is None:
+            return True
+        compared = False
+        for column, value in overview.items():
+            if column in OVERVIEW_COLUMNS:
+                previous = account.get(OVERVIEW_COLUMNS[column])
+            elif column == LATEST_COMPLIANCE_CODE:
+                installationID = self.get_installation_id(account)
+                previous = self.latest_compliance.get(installationID, (None, ""))[1]
+            else:
+                continue
+            compared = True
+            if normalize(previous) != normalize(value):
+                return True
+        return not compared
+
+    def is_open(self, installationID):
+        """Check whether an installation has to be refreshed, i.e., it has an
+        open compliance year or has not been parsed before
+        :param installationID: <string> installation identifier incl. registry code
+        :return: <boolean>
+        """
+        return (
+            installationID in self.open_installations
+            or installationID not in self.installations
+        )
+
+    def iter_rows(self, name, key, values):
+        """Stream previous rows with selected keys
+        :param name: <string> name of the file, e.g., "accounts.csv"
+        :param key: <string> column to select rows on
+        :param values: <set> keys of rows to return
+        :return: <generator> of row dictionaries
+        """
+        for row in read_rows(self.get_file_name(name)):
+            if row[key] in values:
+                yield row
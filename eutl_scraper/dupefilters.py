@@ -0,0 +1,78 @@
+import os
+import tempfile
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+from eutl_scraper.hashset import HashSet64
+
+# initial number of fingerprint slots (8 bytes each), grows when half full
+DUPEFILTER_CAPACITY = 1 << 22
+
+
+def get_fingerprint64(fingerprint):
+    """64 bit integer of a request fingerprint
+    :param fingerprint: <bytes> fingerprint as returned by the request fingerprinter
+    :return: <int> non-zero unsigned 64 bit integer
+    """
+    # zero marks empty slots of the hash set
+    return int.from_bytes(fingerprint[:8], "little") or 1
+
+
+class DiskDupeFilter(RFPDupeFilter):
+    """Duplicate filter storing request fingerprints in a memory mapped
+    HashSet64 instead of a python set of hex strings.
+
+    Each fingerprint takes 8 to 16 bytes in a file that the operating system
+    pages in and out as needed, so the process memory stays flat with
+    millions of requests. With a job directory the file is "fingerprints.bin"
+    in that directory and the filter persists across resumed runs;
+    fingerprints of a previous run with scrapy's filter ("requests.seen") are
+    taken over. Without a job directory a temporary file is used.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        debug=False,
+        *,
+        fingerprinter=None,
+        capacity=DUPEFILTER_CAPACITY
+    ):
+        """
+        :param path: <string> job directory or None
+        :param debug: <boolean> log all filtered requests
+        :param fingerprinter: request fingerprinter of the crawler
+        :param capacity: <int> initial number of slots of the hash set
+        """
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.tmp_dir = None
+        if path:
+            fn = os.path.join(path, "fingerprints.bin")
+        else:
+            self.tmp_dir = tempfile.TemporaryDirectory(prefix="eutl_dupefilter_")
+            fn = os.path.join(self.tmp_dir.name, "fingerprints.bin")
+        is_new = not os.path.isfile(fn)
+        self.fingerprints = HashSet64(capacity, fn=fn)
+        fn_seen = os.path.join(path, "requests.seen") if path else None
+        if is_new and fn_seen and os.path.isfile(fn_seen):
+            with open(fn_seen, encoding="utf-8") as f:
+                for x in f:
+                    self.fingerprints.add(get_fingerprint64(bytes.fromhex(x.strip())))
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None):
+        return cls(
+            job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=fingerprinter,
+            capacity=settings.getint("DUPEFILTER_CAPACITY", DUPEFILTER_CAPACITY),
+        )
+
+    def request_seen(self, request):
+        fp = get_fingerprint64(self.fingerprinter.fingerprint(request))
+        return not self.fingerprints.add(fp)
+
+    def close(self, reason):
+        self.fingerprints.flush()
+        if self.tmp_dir is not None:
+            del self.fingerprints
+            self.tmp_dir.cleanup()
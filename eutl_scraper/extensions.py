@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from eutl_scraper.middlewares import get_callback_name, is_overloaded
+from eutl_scraper.own_settings import DIR_TELEMETRY
+
+logger = logging.getLogger(__name__)
+
+
+class AimdThrottle:
+    """Adapts the download concurrency to overload signals of the EUTL server.
+
+    The EUTL answers with pages containing "Service temporarily unavailable"
+    or "An error occurred during execution of the request" if it is overloaded.
+    On such a page the concurrency is cut multiplicatively. After a number of
+    clean responses equal to the current concurrency, i.e., about one round of
+    requests, the concurrency is raised additively (AIMD). After a cut, further
+    overload pages are ignored until the requests sent before the cut have
+    been answered.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("AIMD_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.min_concurrency = settings.getint("AIMD_MIN_CONCURRENCY", 1)
+        self.max_concurrency = settings.getint(
+            "AIMD_MAX_CONCURRENCY", settings.getint("CONCURRENT_REQUESTS")
+        )
+        self.increase = settings.getint("AIMD_INCREASE", 1)
+        self.decrease_factor = settings.getfloat("AIMD_DECREASE_FACTOR", 0.5)
+        self.concurrency = min(
+            self.max_concurrency,
+            settings.getint("AIMD_START_CONCURRENCY", self.max_concurrency),
+        )
+        self.clean_responses = 0  # clean responses since last change
+        self.responses_since_decrease = self.concurrency
+        crawler.signals.connect(
+            self.response_downloaded, signal=signals.response_downloaded
+        )
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.crawler.stats.set_value("aimd/concurrency", self.concurrency)
+
+    def response_downloaded(self, response, request, spider):
+        # responses are inspected before the retry middleware replaces
+        # overload pages by retry requests
+        slot = self.crawler.engine.downloader.slots.get(
+            request.meta.get("download_slot")
+        )
+        self.responses_since_decrease += 1
+        if is_overloaded(response):
+            self.crawler.stats.inc_value("aimd/overload_count")
+            if self.responses_since_decrease >= self.concurrency:
+                self.set_concurrency(
+                    int(self.concurrency * self.decrease_factor), "overload"
+                )
+                self.responses_since_decrease = 0
+        else:
+            self.clean_responses += 1
+            if self.clean_responses >= self.concurrency:
+                self.set_concurrency(self.concurrency + self.increase, "clean")
+        if slot is not None:
+            slot.concurrency = self.concurrency
+
+    def set_concurrency(self, concurrency, reason):
+        """Change the download concurrency within the configured bounds
+        :param concurrency: <int> new concurrency
+        :param reason: <string> reason of the change for logging
+        """
+        self.clean_responses = 0
+        concurrency = max(self.min_concurrency, min(self.max_concurrency, concurrency))
+        if concurrency == self.concurrency:
+            return
+        logger.info(
+            "AIMD concurrency %d -> %d (%s)", self.concurrency, concurrency, reason
+        )
+        self.crawler.stats.inc_value(
+            "aimd/increases" if concurrency > self.concurrency else "aimd/decreases"
+        )
+        self.crawler.stats.set_value("aimd/concurrency", concurrency)
+        self.concurrency = concurrency
+
+
+class CrawlTelemetry:
+    """Periodically exports crawl metrics to see where crawl time goes.
+
+    Recorded are per spider callback the number of responses, download
+    latency, response size, and parse CPU time (measured by the
+    TelemetrySpiderMiddleware), the size of the raw pages and the CPU time
+    to slice them if the TableSliceMiddleware reduces pages to the tables
+    read by the callback, the number and rate of scraped items per
+    item type, retries, and the number of requests waiting in the scheduler
+    and being downloaded.
+    Every TELEMETRY_INTERVAL seconds and when the spider closes, a snapshot
+    is appended to "<spider>.jsonl" and the file "<spider>.prom" is replaced
+    with the metrics in the Prometheus text format (e.g., for the textfile
+    collector of node_exporter). Files are written to TELEMETRY_DIR.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("TELEMETRY_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.interval = settings.getfloat("TELEMETRY_INTERVAL", 60)
+        self.dir_out = settings.get("TELEMETRY_DIR") or DIR_TELEMETRY
+        self.callbacks = defaultdict(Counter)
+        self.items = Counter()
+        self.items_last = Counter()
+        self.time_last = None
+        self.task = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(
+            self.response_received, signal=signals.response_received
+        )
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        os.makedirs(self.dir_out, exist_ok=True)
+        self.fn_jsonl = os.path.join(self.dir_out, "%s.jsonl" % spider.name)
+        self.fn_prom = os.path.join(self.dir_out, "%s.prom" % spider.name)
+        self.time_last = time.time()
+        self.task = task.LoopingCall(self.export, spider)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.export(spider)
+
+    def response_received(self, response, request, spider):
+        metrics = self.callbacks[get_callback_name(request)]
+        latency = request.meta.get("download_latency", 0)
+        metrics["responses"] += 1
+        metrics["latency_seconds"] += latency
+        metrics["latency_max_seconds"] = max(metrics["latency_max_seconds"], latency)
+        metrics["response_bytes"] += len(response.body)
+        # size before the TableSliceMiddleware reduced the page to its tables
+        metrics["raw_response_bytes"] += request.meta.get(
+            "raw_bytes", len(response.body)
+        )
+
+    def item_scraped(self, item, response, spider):
+        self.items[type(item).__name__] += 1
+
+    def get_snapshot(self, spider):
+        """Current crawl metrics
+        :param spider: <scrapy.Spider> crawled spider
+        :return: <dict>
+        """
+        stats = self.crawler.stats
+        now = time.time()
+        elapsed = max(now - self.time_last, 1e-9)
+        callbacks = {}
+        for callback, metrics in self.callbacks.items():
+            callbacks[callback] = {
+                "responses": metrics["responses"],
+                "latency_mean_seconds": metrics["latency_seconds"]
+                / max(metrics["responses"], 1),
+                "latency_max_seconds": metrics["latency_max_seconds"],
+                "response_bytes": metrics["response_bytes"],
+                "raw_response_bytes": metrics["raw_response_bytes"],
+                "cpu_seconds": stats.get_value(
+                    "telemetry/cpu_seconds/%s" % callback, 0.0
+                ),
+                "slice_cpu_seconds": stats.get_value(
+                    "telemetry/slice_cpu_seconds/%s" % callback, 0.0
+                ),
+            }
+        items = {
+            name: {
+                "total": total,
+                "per_second": (total - self.items_last[name]) / elapsed,
+            }
+            for name, total in self.items.items()
+        }
+        self.items_last = Counter(self.items)
+        self.time_last = now
+
+        engine = self.crawler.engine
+        scheduler = engine.slot.scheduler if engine and engine.slot else None
+        return {
+            "time": datetime.now().isoformat(),
+            "spider": spider.name,
+            "callbacks": callbacks,
+            "items": items,
+            "retries": stats.get_value("retry/count", 0),
+            "retries_delayed": stats.get_value("retry/delayed_count", 0),
+            "retries_exhausted": stats.get_value("retry/max_reached", 0),
+            "queue_depth": len(scheduler) if scheduler is not None else 0,
+            "downloading": len(engine.downloader.active) if engine else 0,
+        }
+
+    def export(self, spider):
+        """Append snapshot to json lines file and write Prometheus file
+        :param spider: <scrapy.Spider> crawled spider
+        """
+        snapshot = self.get_snapshot(spider)
+        with open(self.fn_jsonl, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot) + "\n")
+        # replace the Prometheus file at once such that it is never read partially
+        fn_tmp = self.fn_prom + ".tmp"
+        with open(fn_tmp, "w", encoding="utf-8") as f:
+            f.write(self.format_prometheus(snapshot))
+        os.replace(fn_tmp, self.fn_prom)
+
+    def format_prometheus(self, snapshot):
+        """Metrics in the Prometheus text format
+        :param snapshot: <dict> as returned by get_snapshot
+        :return: <string>
+        """
+        spider = snapshot["spider"]
+        metrics = [
+            (
+                "eutl_responses_total",
+                "counter",
+                "Responses per callback",
+                "callbacks",
+                "responses",
+            ),
+            (
+                "eutl_download_latency_seconds_mean",
+                "gauge",
+                "Mean download latency per callback",
+                "callbacks",
+                "latency_mean_seconds",
+            ),
+            (
+                "eutl_download_latency_seconds_max",
+                "gauge",
+                "Maximum download latency per callback",
+                "callbacks",
+                "latency_max_seconds",
+            ),
+            (
+                "eutl_response_bytes_total",
+                "counter",
+                "Size of responses per callback",
+                "callbacks",
+                "response_bytes",
+            ),
+            (
+                "eutl_raw_response_bytes_total",
+                "counter",
+                "Size of responses before slicing per callback",
+                "callbacks",
+                "raw_response_bytes",
+            ),
+            (
+                "eutl_parse_cpu_seconds_total",
+                "counter",
+                "Parse CPU time per callback",
+                "callbacks",
+                "cpu_seconds",
+            ),
+            (
+                "eutl_slice_cpu_seconds_total",
+                "counter",
+                "CPU time to slice responses per callback",
+                "callbacks",
+                "slice_cpu_seconds",
+            ),
+            (
+                "eutl_items_total",
+                "counter",
+                "Scraped items per item type",
+                "items",
+                "total",
+            ),
+            (
+                "eutl_items_per_second",
+                "gauge",
+                "Scraped items per second per item type",
+                "items",
+                "per_second",
+            ),
+        ]
+        lines = []
+        for name, kind, description, group, key in metrics:
+            label = "callback" if group == "callbacks" else "item"
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for value_name, values in snapshot[group].items():
+                lines.append(
+                    '%s{spider="%s",%s="%s"} %s'
+                    % (name, spider, label, value_name, values[key])
+                )
+        for name, kind, description, key in [
+            ("eutl_retries_total", "counter", "Retried requests", "retries"),
+            (
+                "eutl_retries_delayed_total",
+                "counter",
+                "Retries delayed by backoff",
+                "retries_delayed",
+            ),
+            (
+                "eutl_retries_exhausted_total",
+                "counter",
+                "Requests given up after retries",
+                "retries_exhausted",
+            ),
+            (
+                "eutl_scheduler_queue_depth",
+                "gauge",
+                "Requests waiting in the scheduler",
+                "queue_depth",
+            ),
+            ("eutl_downloading", "gauge", "Requests being downloaded", "downloading"),
+        ]:
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, kind))
+            lines.append('%s{spider="%s"} %s' % (name, spider, snapshot[key]))
+        return "\n".join(lines) + "\n"
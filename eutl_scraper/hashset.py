@@ -0,0 +1,112 @@
+import hashlib
+import os
+import numpy as np
+
+
+def get_hash64(values):
+    """64 bit hash of a sequence of strings
+    :param values: <list> of strings, None is treated as empty string
+    :return: <int> non-zero unsigned 64 bit integer
+    """
+    data = "\x1f".join("" if x is None else str(x) for x in values)
+    h = int.from_bytes(
+        hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+    # zero marks empty slots
+    return h or 1
+
+
+class HashSet64:
+    """Set of 64 bit hashes in a flat array with open addressing.
+
+    Each hash takes 8 bytes (at most twice that with the array half full)
+    compared to about 100 bytes for python objects in a set, i.e., tens of
+    millions of hashes fit in a few hundred MB. Hashes are compared exactly,
+    with 64 bit hashes of 50 million distinct values the probability of any
+    collision is below 1e-4.
+
+    With a file name, the array is memory mapped to that file. The set then
+    persists across runs and its pages are kept in the operating system's
+    file cache instead of the process memory.
+    """
+
+    def __init__(self, capacity=1 << 20, max_load=0.5, fn=None):
+        """
+        :param capacity: <int> initial number of slots, rounded up to a power of two
+        :param max_load: <float> share of filled slots before the array is doubled
+        :param fn: <string> file to store the set, an existing set is opened
+        """
+        self.max_load = max_load
+        self.fn = fn
+        if fn is not None and os.path.isfile(fn):
+            self.slots = np.memmap(fn, dtype=np.uint64, mode="r+")
+            self.count = int(np.count_nonzero(self.slots))
+            return
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.slots = self.new_slots(size, fn)
+        self.count = 0
+
+    def new_slots(self, size, fn=None):
+        """Empty array of slots
+        :param size: <int> number of slots
+        :param fn: <string> file of a memory mapped array, None for an array in memory
+        :return: <np.ndarray>
+        """
+        if fn is None:
+            return np.zeros(size, dtype=np.uint64)
+        # the file is created sparse, i.e., empty slots take no disk space
+        return np.memmap(fn, dtype=np.uint64, mode="w+", shape=(size,))
+
+    def __len__(self):
+        return self.count
+
+    def find(self, h):
+        """Slot of a hash or of the empty slot where it would be inserted
+        :param h: <int> non-zero hash
+        :return: <int> slot position
+        """
+        mask = len(self.slots) - 1
+        i = h & mask
+        slots = self.slots
+        while True:
+            x = int(slots[i])
+            if x == 0 or x == h:
+                return i
+            i = (i + 1) & mask
+
+    def __contains__(self, h):
+        return int(self.slots[self.find(h)]) == h
+
+    def add(self, h):
+        """Add hash to the set
+        :param h: <int> non-zero hash, e.g., from get_hash64
+        :return: <boolean> True if the hash was not in the set before
+        """
+        i = self.find(h)
+        if int(self.slots[i]) == h:
+            return False
+        self.slots[i] = h
+        self.count += 1
+        if self.count > self.max_load * len(self.slots):
+            self.grow()
+        return True
+
+    def grow(self):
+        """Double the number of slots and re-insert all hashes
+        A file is replaced only once all hashes have been re-inserted
+        """
+        old = np.array(self.slots[self.slots != 0])
+        fn_tmp = None if self.fn is None else self.fn + ".tmp"
+        self.slots = self.new_slots(2 * len(self.slots), fn_tmp)
+        for h in old:
+            self.slots[self.find(int(h))] = h
+        if fn_tmp is not None:
+            self.slots.flush()
+            os.replace(fn_tmp, self.fn)
+
+    def flush(self):
+        """Write changes of a memory mapped set to its file"""
+        if isinstance(self.slots, np.memmap):
+            self.slots.flush()
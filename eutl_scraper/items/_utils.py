@@ -1,3 +1,10 @@
+import re
+from datetime import date, datetime
+
+# dates as shown in the EUTL, e.g., "01/05/2008" or "01/05/2008 12:30:00"
+DATE_PATTERN = re.compile(
+    r'(\d{1,2})/(\d{1,2})/(\d{4})(?:\s+(\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+
 
 def strip_values(x):
     if x:
@@ -6,3 +13,100 @@ def strip_values(x):
 
 def convert_relative_url(url, loader_context):
     return loader_context['response'].urljoin(url)
+
+
+def to_int(x):
+    """Convert scraped text to integer, ignoring thousand separators
+    :param x: <string> scraped text or integer
+    :return: <int> or None if the text is no number, e.g., "Excluded"
+    """
+    if isinstance(x, int) and not isinstance(x, bool):
+        return x
+    x = str(x).replace(',', '').replace(' ', '').replace('\xa0', '')
+    try:
+        return int(x)
+    except ValueError:
+        return None
+
+
+def to_float(x):
+    """Convert scraped text to float
+    :param x: <string> scraped text or number
+    :return: <float> or None if the text is no number
+    """
+    if isinstance(x, float):
+        return x
+    try:
+        return float(str(x).replace(' ', '').replace('\xa0', ''))
+    except ValueError:
+        return None
+
+
+def to_bool(x):
+    """Convert scraped text to boolean
+    :param x: <string> scraped text, e.g., "True" or "false", or boolean
+    :return: <boolean> or None if the text is no boolean
+    """
+    if isinstance(x, bool):
+        return x
+    return {'true': True, 'false': False}.get(str(x).strip().lower())
+
+
+def to_datetime(x):
+    """Convert scraped date in format dd/mm/yyyy (with optional time) to datetime
+    Dates already converted, i.e., in ISO format, are accepted as well
+    :param x: <string> scraped text or datetime
+    :return: <datetime> or None if the text is no date
+    """
+    if isinstance(x, datetime):
+        return x
+    if isinstance(x, date):
+        return datetime(x.year, x.month, x.day)
+    x = str(x).strip()
+    m = DATE_PATTERN.match(x)
+    try:
+        if m is None:
+            return datetime.fromisoformat(x)
+        day, month, year, hour, minute, second = m.groups()
+        return datetime(int(year), int(month), int(day), int(hour or 0),
+                        int(minute or 0), int(second or 0))
+    except ValueError:
+        return None
+
+
+# converters for the dtype declared in the item field definitions
+TYPE_CONVERTERS = {
+    'int64': to_int,
+    'float64': to_float,
+    'bool': to_bool,
+    'datetime': to_datetime,
+}
+
+
+def convert_typed(x, dtype):
+    """Convert value to the python type of the dtype declared for its field
+    :param x: scraped value or value read from csv
+    :param dtype: <string> dtype of the field, e.g., "int64"
+    :return: converted value or None if missing or not convertible
+    """
+    if x is None or x == '':
+        return None
+    if dtype == 'string':
+        return str(x)
+    return TYPE_CONVERTERS[dtype](x)
+
+
+def get_typed_item(item_class, row):
+    """Item from a row of parsed data, e.g., as read from a previous csv file
+    Values of typed fields are converted as by their input processors
+    :param item_class: <scrapy.Item> class of the item
+    :param row: <dict> field name: value
+    :return: <scrapy.Item>
+    """
+    values = {}
+    for k, v in row.items():
+        if k not in item_class.fields:
+            continue
+        dtype = item_class.fields[k].get('dtype', 'string')
+        values[k] = v if dtype == 'string' else convert_typed(v, dtype)
+    return item_class(**values)
@@ -1,6 +1,6 @@
 import scrapy
 from itemloaders.processors import TakeFirst, MapCompose
-from ._utils import strip_values, convert_relative_url
+from ._utils import strip_values, to_datetime, convert_relative_url
 
 
 def clean_account_name(x):
@@ -38,10 +38,14 @@ class AccountItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     openingDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     closingDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     commitmentPeriod = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -1,6 +1,6 @@
 import scrapy
 from itemloaders.processors import TakeFirst, MapCompose
-from ._utils import strip_values, convert_relative_url
+from ._utils import strip_values, to_datetime, to_int, convert_relative_url
 
 
 class EsdTransactionItem(scrapy.Item):
@@ -9,13 +9,13 @@ class EsdTransactionItem(scrapy.Item):
     transactionType = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     transactionDate = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_datetime), output_processor=TakeFirst(), dtype="datetime")
     transferringRegistry = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     transferringMemberState = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst())
     transferringYear = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     transferringAccountIdentifier = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst())
     acquiringRegistry = scrapy.Field(input_processor=MapCompose(
@@ -23,18 +23,18 @@ class EsdTransactionItem(scrapy.Item):
     acquiringMemberState = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     acquiringYear = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     acquiringAccountIdentifier = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst())
     amount = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
 
 
 class EsdTransactionBlockItem(scrapy.Item):
     transactionID = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     transactionDate = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_datetime), output_processor=TakeFirst(), dtype="datetime")
     transactionType = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     transactionBlock = scrapy.Field(input_processor=MapCompose(
@@ -46,7 +46,7 @@ class EsdTransactionBlockItem(scrapy.Item):
     unitType = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     amount = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     originalCommitmentPeriod = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst())
     transferringAccountIdentifier = scrapy.Field(
@@ -64,43 +64,43 @@ class EsdTransactionBlockItem(scrapy.Item):
     projectTrack = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     expiryDate = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_datetime), output_processor=TakeFirst(), dtype="datetime")
 
 
 class EsdAllocationItem(scrapy.Item):
     memberState = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     year = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     accountStatus = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     accountIdentifier = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     allocated = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
 
 
 class EsdComplianceItem(scrapy.Item):
     memberState = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     year = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     accountStatus = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     accountIdentifier = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     allocated = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     verified = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     penalty = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     surrenderedAea = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     surrenderedCredits = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     balance = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     compliance = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
 
@@ -111,16 +111,16 @@ class EsdEntitlementItem(scrapy.Item):
     transactionType = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     transactionDate = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_datetime), output_processor=TakeFirst(), dtype="datetime")
     transferringMemberState = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     transferringYear = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     acquiringMemberState = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     acquiringYear = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
     transactionStatus = scrapy.Field(input_processor=MapCompose(
         strip_values), output_processor=TakeFirst())
     amount = scrapy.Field(input_processor=MapCompose(
-        strip_values), output_processor=TakeFirst())
+        strip_values, to_int), output_processor=TakeFirst(), dtype="int64")
@@ -1,7 +1,7 @@
 import scrapy
 from itemloaders.processors import TakeFirst, MapCompose
 
-from ._utils import strip_values
+from ._utils import strip_values, to_bool, to_datetime, to_float, to_int
 
 
 def get_compliance_status(x):
@@ -24,7 +24,9 @@ class InstallationItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     isAircraftOperator = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_bool),
+        output_processor=TakeFirst(),
+        dtype="bool",
     )
     name = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -33,10 +35,14 @@ class InstallationItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     permitEntryDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     permitExpiry = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     subsidiary = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -69,10 +75,14 @@ class InstallationItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     latitude = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_float),
+        output_processor=TakeFirst(),
+        dtype="float64",
     )
     longitude = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_float),
+        output_processor=TakeFirst(),
+        dtype="float64",
     )
     activity = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -113,7 +123,9 @@ class InstallationItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     isMaritimeOperator = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_bool),
+        output_processor=TakeFirst(),
+        dtype="bool",
     )
 
 
@@ -125,28 +137,44 @@ class ComplianceItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     year = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     allocationFree = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     allocation10c = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     allocationNewEntrance = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     verified = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     surrendered = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     verifiedCumulative = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     surrenderedCumulative = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     complianceCode = scrapy.Field(
         input_processor=MapCompose(strip_values, get_compliance_status),
@@ -155,6 +183,7 @@ class ComplianceItem(scrapy.Item):
     complianceCodeUpdated = scrapy.Field(
         input_processor=MapCompose(strip_values, get_compliance_status_update),
         output_processor=TakeFirst(),
+        dtype="bool",
     )
     installationURL = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -185,7 +214,9 @@ class SurrenderingDetailsItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     amount = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     originalCommitmentPeriod = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -194,7 +225,9 @@ class SurrenderingDetailsItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     year = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     lulucfActivity = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -206,7 +239,9 @@ class SurrenderingDetailsItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     expiryDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     installationURL = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -230,8 +265,12 @@ class EntitlementItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     euEntitlement = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     chEntitlement = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
@@ -1,6 +1,6 @@
 import scrapy
 from itemloaders.processors import TakeFirst, MapCompose
-from ._utils import strip_values, convert_relative_url
+from ._utils import strip_values, to_datetime, to_int, convert_relative_url
 
 
 class TransactionItem(scrapy.Item):
@@ -11,7 +11,9 @@ class TransactionItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     transactionDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     transactionStatus = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -47,7 +49,9 @@ class TransactionItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     amount = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
 
 
@@ -56,7 +60,9 @@ class TransactionBlockItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     transactionDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
     transactionType = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -74,7 +80,9 @@ class TransactionBlockItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     amount = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_int),
+        output_processor=TakeFirst(),
+        dtype="int64",
     )
     originalCommitmentPeriod = scrapy.Field(
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
@@ -115,5 +123,7 @@ class TransactionBlockItem(scrapy.Item):
         input_processor=MapCompose(strip_values), output_processor=TakeFirst()
     )
     expiryDate = scrapy.Field(
-        input_processor=MapCompose(strip_values), output_processor=TakeFirst()
+        input_processor=MapCompose(strip_values, to_datetime),
+        output_processor=TakeFirst(),
+        dtype="datetime",
     )
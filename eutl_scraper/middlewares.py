@@ -3,18 +3,257 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+import os
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.http import HtmlResponse
 from scrapy.utils.response import response_status_message
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredSemaphore
+import json
+import random
+import re
 import time
+from functools import lru_cache
+from eutl_scraper.archive import PageArchive
+from eutl_scraper.own_settings import DIR_ARCHIVE, DIR_STATE
+from eutl_scraper.state import FailureLedger
+
+# body markers of pages returned by an overloaded EUTL server
+SERVICE_UNAVAILABLE = b"Service temporarily unavailable. Please try again later."
+EXECUTION_ERROR = b"An error occurred during execution of the request"
+OVERLOAD_SIGNATURES = (SERVICE_UNAVAILABLE, EXECUTION_ERROR)
+# markup kept in pages sliced to the tables read by the spider callbacks
+TABLE_TAG = re.compile(rb"<(/?)table\b", re.I)
+INPUT_TAG = re.compile(rb"<input\b[^>]*>", re.I)
+META_TAG = re.compile(rb"<meta\b[^>]*>", re.I)
+HEADING = re.compile(
+    rb"<(font|span)\b[^>]*\bbordertbheadfont\b[^>]*>.*?</\1\s*>", re.I | re.S
+)
+# meta keys only valid for one download of a request
+TRANSIENT_META = ("retry_times", "global_slot", "failure_retry", "raw_bytes")
+
+
+def get_callback_name(request):
+    """Name of the spider callback of a request
+    :param request: <scrapy.Request>
+    :return: <string> e.g., "parse_installation"
+    """
+    if request is None or request.callback is None:
+        return "parse"
+    return getattr(request.callback, "__name__", str(request.callback))
+
+
+def get_failure_ledger_file(settings):
+    """Path of the failure ledger
+    :param settings: <scrapy.settings.Settings>
+    :return: <string> FAILURE_LEDGER_FILE, defaults to failures.db in DIR_STATE
+    """
+    fn = settings.get("FAILURE_LEDGER_FILE") or os.path.join(DIR_STATE, "failures.db")
+    os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+    return fn
+
+
+def record_failure(ledger, request, reason, spider):
+    """Record a failed request in the failure ledger
+    :param ledger: <FailureLedger>
+    :param request: <scrapy.Request>
+    :param reason: <string> reason of the failure
+    :param spider: <scrapy.Spider>
+    """
+    ledger.record(
+        spider.name,
+        request.url,
+        get_callback_name(request),
+        reason,
+        errback=getattr(request.errback, "__name__", None),
+        meta=get_json_values(request.meta),
+        cb_kwargs=get_json_values(request.cb_kwargs),
+        priority=request.priority,
+    )
+
+
+def get_json_values(values):
+    """Entries of a dictionary that can be stored as json, i.e., without
+    objects set by scrapy and entries only valid for one download
+    :param values: <dict> e.g., request meta data
+    :return: <dict>
+    """
+    res = {}
+    for k, v in values.items():
+        if k in TRANSIENT_META or k.startswith("download_"):
+            continue
+        try:
+            json.dumps(v)
+        except (TypeError, ValueError):
+            continue
+        res[k] = v
+    return res
+
+
+@lru_cache(maxsize=None)
+def get_table_pattern(table_ids):
+    """Regular expression matching the start tags of tables
+    :param table_ids: <tuple> of table ids
+    :return: <re.Pattern>
+    """
+    ids = b"|".join(re.escape(x.encode("ascii")) for x in table_ids)
+    return re.compile(rb"<table\b[^>]*\bid\s*=\s*[\"']?(?:" + ids + rb")[\"'\s>]", re.I)
+
+
+def get_table_end(body, start):
+    """End of a table including nested tables
+    :param body: <bytes> raw page
+    :param start: <int> position of the start tag of the table
+    :return: <int> position after the end tag of the table
+    """
+    depth = 0
+    for m in TABLE_TAG.finditer(body, start):
+        depth += -1 if m.group(1) else 1
+        if depth == 0:
+            end = body.find(b">", m.end())
+            return len(body) if end < 0 else end + 1
+    return len(body)
+
+
+def get_headings(body):
+    """Positions of the headings of a page, e.g., the account name
+    :param body: <bytes> raw page
+    :return: <generator> of (start, end) positions
+    """
+    # searching the class name first is much faster than matching all spans
+    pos = body.find(b"bordertbheadfont")
+    while pos >= 0:
+        m = HEADING.match(body, body.rfind(b"<", 0, pos))
+        if m is None:
+            pos = body.find(b"bordertbheadfont", pos + 1)
+            continue
+        yield m.span()
+        pos = body.find(b"bordertbheadfont", m.end())
+
+
+def get_table_slices(body, table_ids):
+    """Document with the tables of given ids, the inputs (e.g., hidden fields
+    with the accountID), and headings of a page in the order of the page
+    :param body: <bytes> raw page
+    :param table_ids: <tuple> of table ids
+    :return: <bytes> sliced page or None if the page has none of the tables
+    """
+    tables = [
+        (m.start(), get_table_end(body, m.start()))
+        for m in get_table_pattern(table_ids).finditer(body)
+    ]
+    if not tables:
+        return None
+    slices = list(tables)
+    slices += [m.span() for m in INPUT_TAG.finditer(body)]
+    slices += get_headings(body)
+    parts = []
+    end = 0
+    for start, stop in sorted(slices):
+        # skip markup in tables already kept
+        if start >= end:
+            parts.append(body[start:stop])
+            end = stop
+    head = b"".join(m.group(0) for m in META_TAG.finditer(body, 0, tables[0][0]))
+    return b"<html><head>%s</head><body>\n%s\n</body></html>" % (
+        head,
+        b"\n".join(parts),
+    )
+
+
+def is_overloaded(response):
+    """Check whether the page signals an overloaded server
+    :param response: <scrapy.http.Response>
+    :return: <boolean>
+    """
+    return any(signature in response.body for signature in OVERLOAD_SIGNATURES)
+
+
+class RetryDelayed(IgnoreRequest):
+    """Request dropped by the CustomRetryMiddleware as its retry is scheduled later"""
 
 
 class CustomRetryMiddleware(RetryMiddleware):
-    # Custom middleware to retry if empty responses and implement
-    # 1 second delay for retry
+    # Custom middleware to retry if the server is temporarily unavailable.
+    # These retries are delayed with exponential backoff and jitter. The
+    # original request is dropped (RetryDelayed) and its retry is handed to
+    # the engine once the delay has passed, such that the delay does not
+    # occupy a download slot and other requests continue meanwhile.
+    # Retries still waiting when the crawl stops are neither in the scheduler
+    # nor in the job directory. They are recorded in the failure ledger and
+    # can be requested with FAILURE_REPLAY.
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.backoff_base = settings.getfloat("RETRY_BACKOFF_BASE", 5)
+        self.backoff_max = settings.getfloat("RETRY_BACKOFF_MAX", 120)
+        self.fn_ledger = (
+            get_failure_ledger_file(settings)
+            if settings.getbool("FAILURE_LEDGER_ENABLED")
+            else None
+        )
+        self.delayed = {}  # retry request: delayed call handing it to the engine
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler.settings)
+        crawler.signals.connect(s.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_idle(self, spider):
+        """Keep the spider open while retries wait for their delay"""
+        if self.delayed:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        """Record the retries still waiting for their delay as failed"""
+        if not self.delayed:
+            return
+        ledger = FailureLedger(self.fn_ledger) if self.fn_ledger else None
+        for request, call in self.delayed.items():
+            call.cancel()
+            if ledger is not None:
+                record_failure(
+                    ledger, request, "Delayed retry pending at shutdown", spider
+                )
+            else:
+                spider.logger.warning(
+                    "Delayed retry of %s dropped at shutdown" % request
+                )
+        spider.crawler.stats.inc_value(
+            "retry/delayed_dropped", len(self.delayed), spider=spider
+        )
+        if ledger is not None:
+            ledger.close()
+            spider.logger.warning(
+                "Recorded %d delayed retries pending at shutdown in the failure "
+                "ledger, request them with FAILURE_REPLAY" % len(self.delayed)
+            )
+        self.delayed = {}
+
+    def crawl_delayed(self, request, spider):
+        """Hand a delayed retry to the engine
+        :param request: <scrapy.Request> retry request
+        :param spider: <scrapy.Spider>
+        """
+        del self.delayed[request]
+        spider.crawler.engine.crawl(request)
+
+    def get_backoff_delay(self, retry_times):
+        """Delay before the next retry of a request
+        :param retry_times: <int> number of retries including the next one
+        :return: <float> delay in seconds
+        """
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (retry_times - 1))
+        # keep half of the delay and randomize the other half to avoid that
+        # requests failing at the same time are also retried at the same time
+        return delay / 2 + random.uniform(0, delay / 2)
+
     def process_response(self, request, response, spider):
         if request.meta.get("dont_retry", False):
             return response
@@ -22,13 +261,306 @@ class CustomRetryMiddleware(RetryMiddleware):
         if response.status in self.retry_http_codes:
             reason = response_status_message(response.status)
             return self._retry(request, reason, spider) or response
-        if b"Service temporarily unavailable. Please try again later." in response.body:
-            time.sleep(5)
-            reason = response_status_message("Server is timed outed")
-            return self._retry(request, reason, spider) or response
+        if is_overloaded(response):
+            reason = "Service temporarily unavailable"
+            retry_request = self._retry(request, reason, spider)
+            if retry_request is None:
+                return response
+            delay = self.get_backoff_delay(retry_request.meta["retry_times"])
+            spider.crawler.stats.inc_value("retry/delayed_count", spider=spider)
+            self.delayed[retry_request] = reactor.callLater(
+                delay, self.crawl_delayed, retry_request, spider
+            )
+            raise RetryDelayed("Retry of %s delayed by %.1fs" % (request, delay))
         return response
 
 
+class ArchiveMiddleware:
+    # Stores the raw body of every successfully downloaded page in a
+    # content-addressed archive (see eutl_scraper.archive.PageArchive) such
+    # that pages can be parsed again without downloading them. Pages of the
+    # overloaded server are not archived.
+    # With ARCHIVE_REPLAY, archived pages are served from the archive instead
+    # of being downloaded.
+    def __init__(self, archive, replay=False):
+        self.archive = archive
+        self.replay = replay
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ARCHIVE_ENABLED"):
+            raise NotConfigured
+        archive = PageArchive(
+            crawler.settings.get("ARCHIVE_DIR") or DIR_ARCHIVE,
+            commit_every=crawler.settings.getint("ARCHIVE_COMMIT_PAGES", 100),
+        )
+        s = cls(archive, replay=crawler.settings.getbool("ARCHIVE_REPLAY"))
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_request(self, request, spider):
+        if not self.replay:
+            return None
+        response = self.archive.get_response(request)
+        if response is not None:
+            spider.crawler.stats.inc_value("archive/replayed", spider=spider)
+        return response
+
+    def process_response(self, request, response, spider):
+        if (
+            "archived" in response.flags
+            or response.status != 200
+            or is_overloaded(response)
+        ):
+            return response
+        content_type = response.headers.get("Content-Type")
+        is_new = self.archive.store(
+            request.url,
+            response.body,
+            status=response.status,
+            content_type=content_type.decode("latin-1") if content_type else None,
+        )
+        spider.crawler.stats.inc_value("archive/stored", spider=spider)
+        if not is_new:
+            spider.crawler.stats.inc_value("archive/deduplicated", spider=spider)
+        return response
+
+    def spider_closed(self, spider):
+        self.archive.close()
+
+
+class TableSliceMiddleware:
+    # Replaces the body of a page by the tables read by the spider callbacks
+    # (spider attribute slice_tables), its inputs, and headings such that the
+    # selectors build and evaluate a much smaller document without the layout
+    # and navigation markup. Pages without any of the tables (e.g., overload
+    # pages) or that would not get smaller are left untouched. For the crawl
+    # telemetry, the size of the raw page is kept in the request meta
+    # ("raw_bytes") and the CPU time of the slicing is added to the stats
+    # "telemetry/slice_cpu_seconds/<callback>".
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("TABLE_SLICE_ENABLED"):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    def process_response(self, request, response, spider):
+        table_ids = getattr(spider, "slice_tables", None)
+        if not table_ids or not isinstance(response, HtmlResponse):
+            return response
+        start = time.process_time()
+        body = get_table_slices(response.body, tuple(table_ids))
+        if body is not None and len(body) >= len(response.body):
+            body = None  # nothing to cut, e.g., an error page
+        self.stats.inc_value(
+            "telemetry/slice_cpu_seconds/%s" % get_callback_name(request),
+            time.process_time() - start,
+            start=0.0,
+        )
+        if body is None:
+            self.stats.inc_value("table_slice/untouched", spider=spider)
+            return response
+        self.stats.inc_value("table_slice/sliced", spider=spider)
+        request.meta["raw_bytes"] = len(response.body)
+        # the encoding of the raw page is kept by replace
+        return response.replace(body=body)
+
+
+class GlobalConcurrencyMiddleware:
+    # Limits the number of requests downloaded at the same time by all
+    # crawlers running in one process (see eutl_scraper.runner). Each crawler
+    # has its own downloader, so CONCURRENT_REQUESTS only limits one spider.
+    # Requests wait for one of GLOBAL_CONCURRENT_REQUESTS slots shared by
+    # the crawlers before being downloaded and free it with the response.
+    semaphores = {}  # shared semaphore per limit
+
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        limit = crawler.settings.getint("GLOBAL_CONCURRENT_REQUESTS", 0)
+        if limit <= 0:
+            raise NotConfigured
+        if limit not in cls.semaphores:
+            cls.semaphores[limit] = DeferredSemaphore(limit)
+        return cls(cls.semaphores[limit])
+
+    def process_request(self, request, spider):
+        spider.crawler.stats.max_value(
+            "global_concurrency/waiting", len(self.semaphore.waiting), spider=spider
+        )
+
+        def acquired(_):
+            request.meta["global_slot"] = True
+
+        return self.semaphore.acquire().addCallback(acquired)
+
+    def release(self, request):
+        if request.meta.pop("global_slot", False):
+            self.semaphore.release()
+
+    def process_response(self, request, response, spider):
+        self.release(request)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self.release(request)
+
+
+class FailureLedgerMiddleware:
+    # Records requests that failed after all retries (server errors, overload
+    # pages, download errors) in a FailureLedger (eutl_scraper.state) instead
+    # of dropping them silently. Once the crawl has drained, the requests
+    # failed in the run are requested again in up to FAILURE_SWEEP_ROUNDS
+    # sweeps. Requests that still fail stay in the ledger and can be requested
+    # in a later run with FAILURE_REPLAY (see FailureReplayMiddleware).
+    # Requests succeeding in a sweep or replay are removed from the ledger.
+    def __init__(self, crawler, ledger, sweep_rounds=1):
+        self.crawler = crawler
+        self.ledger = ledger
+        self.sweep_rounds = sweep_rounds
+        self.sweeps = 0
+        self.failed = {}  # requests failed in this run by (url, callback)
+        self.retry_http_codes = set(
+            int(x) for x in crawler.settings.getlist("RETRY_HTTP_CODES")
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("FAILURE_LEDGER_ENABLED"):
+            raise NotConfigured
+        s = cls(
+            crawler,
+            FailureLedger(get_failure_ledger_file(crawler.settings)),
+            sweep_rounds=crawler.settings.getint("FAILURE_SWEEP_ROUNDS", 1),
+        )
+        crawler.signals.connect(s.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def record(self, request, reason, spider):
+        """Record a request that failed after all retries
+        :param request: <scrapy.Request>
+        :param reason: <string> reason of the failure
+        :param spider: <scrapy.Spider>
+        """
+        record_failure(self.ledger, request, reason, spider)
+        self.failed[(request.url, get_callback_name(request))] = request
+        spider.crawler.stats.inc_value("failures/recorded", spider=spider)
+
+    def process_response(self, request, response, spider):
+        if response.status in self.retry_http_codes:
+            self.record(request, response_status_message(response.status), spider)
+        elif is_overloaded(response):
+            self.record(request, "Service temporarily unavailable", spider)
+        elif request.meta.get("failure_retry") and self.ledger.resolve(
+            spider.name, request.url, get_callback_name(request)
+        ):
+            spider.crawler.stats.inc_value("failures/recovered", spider=spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, IgnoreRequest):
+            reason = "%s: %s" % (exception.__class__.__name__, exception)
+            self.record(request, reason, spider)
+
+    def spider_idle(self, spider):
+        """Request failed requests again once the crawl has drained"""
+        if not self.failed or self.sweeps >= self.sweep_rounds:
+            return
+        has_pending_work = getattr(spider, "has_pending_work", None)
+        if self.crawler.engine.slot.scheduler.has_pending_requests() or (
+            has_pending_work is not None and has_pending_work()
+        ):
+            # requests added by the spider come first
+            raise DontCloseSpider
+        self.sweeps += 1
+        requests = list(self.failed.values())
+        self.failed = {}
+        spider.logger.info(
+            "Sweep %d: request %d failed requests again" % (self.sweeps, len(requests))
+        )
+        spider.crawler.stats.inc_value("failures/swept", len(requests), spider=spider)
+        for request in requests:
+            meta = {k: v for k, v in request.meta.items() if k not in TRANSIENT_META}
+            meta["failure_retry"] = True
+            self.crawler.engine.crawl(request.replace(meta=meta, dont_filter=True))
+        raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        self.ledger.close()
+
+
+class FailureReplayMiddleware:
+    # With FAILURE_REPLAY, the spider requests the failed requests recorded
+    # for it in the failure ledger instead of its start requests. Items are
+    # appended to the existing output.
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("FAILURE_REPLAY"):
+            raise NotConfigured
+        return cls(FailureLedger(get_failure_ledger_file(crawler.settings)))
+
+    def get_request(self, failure, spider):
+        """Request of a failure recorded in the ledger
+        :param failure: <dict> as returned by FailureLedger.get_failures
+        :param spider: <scrapy.Spider>
+        :return: <scrapy.Request>
+        """
+        return Request(
+            failure["url"],
+            callback=getattr(spider, failure["callback"]),
+            errback=getattr(spider, failure["errback"]) if failure["errback"] else None,
+            meta=dict(failure["meta"], failure_retry=True),
+            cb_kwargs=failure["cb_kwargs"],
+            priority=failure["priority"],
+            dont_filter=True,
+        )
+
+    def process_start_requests(self, start_requests, spider):
+        failures = self.ledger.get_failures(spider.name)
+        self.ledger.close()
+        spider.append_output = True
+        spider.logger.info("Replay %d failed requests" % len(failures))
+        spider.crawler.stats.set_value("failures/replayed", len(failures))
+        return [self.get_request(failure, spider) for failure in failures]
+
+
+class TelemetrySpiderMiddleware:
+    # Measures the CPU time spent in each spider callback. The time is added
+    # to the stats "telemetry/cpu_seconds/<callback>" exported by the
+    # CrawlTelemetry extension.
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("TELEMETRY_ENABLED"):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    def process_spider_output(self, response, result, spider):
+        callback = get_callback_name(response.request)
+        key = "telemetry/cpu_seconds/%s" % callback
+        result = iter(result)
+        while True:
+            start = time.process_time()
+            try:
+                x = next(result)
+            except StopIteration:
+                self.stats.inc_value(key, time.process_time() - start, start=0.0)
+                return
+            self.stats.inc_value(key, time.process_time() - start, start=0.0)
+            yield x
+
+
 class EutlScraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
     # scrapy acts as if the spider middleware does not modify the
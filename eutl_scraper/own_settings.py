@@ -2,4 +2,7 @@ import os
 
 __MYPATH = os.path.dirname(os.path.abspath(__file__)) # path to current file
 
-DIR_PARSED = os.path.join(__MYPATH, "../data/parsed/")  # directory with parsed data (relative path to current file's location)
\ No newline at end of file
+DIR_PARSED = os.path.join(__MYPATH, "../data/parsed/")  # directory with parsed data (relative path to current file's location)
+DIR_ARCHIVE = os.path.join(__MYPATH, "../data/archive/")  # directory with archived raw pages
+DIR_TELEMETRY = os.path.join(__MYPATH, "../data/telemetry/")  # directory with crawl metrics
+DIR_STATE = os.path.join(__MYPATH, "../data/state/")  # directory with crawl state kept across runs
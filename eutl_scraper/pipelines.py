@@ -1,5 +1,14 @@
 import csv
+import glob
+import io
+import sqlite3
+import weakref
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.job import job_dir
 from eutl_scraper.items import (
     AccountItem,
     ContactItem,
@@ -16,9 +25,92 @@ from eutl_scraper.items import (
     EsdComplianceItem,
 )
 from eutl_scraper.items.esdItems import EsdEntitlementItem
+from eutl_scraper.items._utils import convert_typed
+from eutl_scraper.hashset import HashSet64, get_hash64
+from eutl_scraper.shards import (
+    ShardRun,
+    adopt_output,
+    consolidate_shards,
+    get_run_id,
+    record_sources,
+)
 from eutl_scraper.own_settings import DIR_PARSED
 import os.path
 
+# arrow types for the dtype declared in the item field definitions
+ARROW_TYPES = {
+    "string": pa.string(),
+    "int64": pa.int64(),
+    "float64": pa.float64(),
+    "bool": pa.bool_(),
+    "datetime": pa.timestamp("s"),
+}
+
+# sqlite column types for the dtype declared in the item field definitions
+SQLITE_TYPES = {
+    "string": "TEXT",
+    "int64": "INTEGER",
+    "float64": "REAL",
+    "bool": "BOOLEAN",  # stored as 0/1, declared to read them back as booleans
+    "datetime": "TIMESTAMP",  # stored as ISO text, read back as dates
+}
+# columns indexed in the staging database to join and filter item types
+STAGING_INDEX_COLUMNS = [
+    "accountID",
+    "installationID",
+    "accountIdentifier",
+    "transactionID",
+]
+# identifier of the crawl of each spider, shared by the pipelines (sinks)
+_crawl_ids = weakref.WeakKeyDictionary()
+
+
+def get_crawl_id(spider):
+    """Identifier of the crawl of a spider, used by all pipelines to record
+    the sinks of the crawl (see eutl_scraper.shards.record_sources)
+    :param spider: <scrapy.Spider>
+    :return: <string> as created by eutl_scraper.shards.get_run_id
+    """
+    if spider not in _crawl_ids:
+        _crawl_ids[spider] = get_run_id(spider.name)
+    return _crawl_ids[spider]
+
+
+def get_arrow_schema(item_class):
+    """Arrow schema for an item type
+    Column types are taken from the "dtype" of the item fields which
+    defaults to string
+    :param item_class: <scrapy.Item> class of the item
+    :return: <pa.Schema>
+    """
+    return pa.schema(
+        [
+            pa.field(name, ARROW_TYPES[field.get("dtype", "string")])
+            for name, field in item_class.fields.items()
+        ]
+    )
+
+
+def get_spider_arguments(spider):
+    """Arguments of a spider as recorded in the manifest of its output
+    :param spider: <scrapy.Spider>
+    :return: <dict> attributes of the spider instance with simple values
+    """
+    return {
+        k: v
+        for k, v in vars(spider).items()
+        if not k.startswith("_") and isinstance(v, (str, int, float, bool))
+    }
+
+
+def get_sqlite_value(x):
+    """Value as stored in the staging database, i.e., timestamps as ISO text
+    :param x: value converted by convert_typed
+    """
+    if isinstance(x, datetime):
+        return x.isoformat(" ")
+    return x
+
 
 class EutlScraperPipeline:
     # all items to process
@@ -26,127 +118,531 @@ class EutlScraperPipeline:
     itemsToProcess = [
         {
             "item": AccountItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "accounts.csv",
             "appendExisting": False,
         },
         {
             "item": ContactItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "contacts.csv",
             "appendExisting": False,
         },
         {
             "item": InstallationItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "installations.csv",
             "appendExisting": False,
         },
         {
             "item": ComplianceItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "compliance.csv",
             "appendExisting": False,
         },
         {
             "item": SurrenderingDetailsItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "surrendering.csv",
             "appendExisting": False,
         },
         {
             "item": TransactionItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "transactions.csv",
             "appendExisting": True,
         },
         {
             "item": TransactionBlockItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "transactionBlocks.csv",
             "appendExisting": True,
         },
         {
             "item": AccountIDMapItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "accountIdMap.csv",
             "appendExisting": False,
         },
         {
             "item": EsdTransactionItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "esdTransactions.csv",
             "appendExisting": False,
         },
         {
             "item": EsdTransactionBlockItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "esdTransactionBlocks.csv",
             "appendExisting": False,
         },
         {
             "item": EsdAllocationItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "esdAllocation.csv",
             "appendExisting": False,
         },
         {
             "item": EsdComplianceItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "esdCompliance.csv",
             "appendExisting": False,
         },
         {
             "item": EntitlementItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "entitlements.csv",
             "appendExisting": False,
         },
         {
             "item": EsdEntitlementItem,
-            "rows": [],
-            "header": [],
             "output_file_name": DIR_PARSED + "esdEntitlement.csv",
             "appendExisting": True,
         },
     ]
 
+    def __init__(self, flush_rows=1000, shards=False, consolidate=True):
+        """
+        :param flush_rows: <int> number of rows buffered per item type before
+                            they are written to disk
+        :param shards: <boolean> write each run to its own shards which are
+                            merged into the output files (see eutl_scraper.shards)
+        :param consolidate: <boolean> merge the shards when the spider closes
+        """
+        self.flush_rows = flush_rows
+        self.shards = shards
+        self.consolidate = consolidate
+        self.resumable = False
+        self.outputs = {}  # open output per item type
+        self.runs = {}  # shard run per output directory
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(
+            flush_rows=crawler.settings.getint("CSV_FLUSH_ROWS", 1000),
+            shards=crawler.settings.getbool("SHARD_OUTPUT", True),
+            consolidate=crawler.settings.getbool("SHARD_CONSOLIDATE", True),
+        )
+        pipeline.resumable = bool(job_dir(crawler.settings))
+        return pipeline
+
+    def get_output_file_name(self, it, spider):
+        """Output file for an item type
+        Spiders can write to another directory than DIR_PARSED using
+        the argument output_dir, e.g., -a output_dir=data/parsed/2020
+        :param it: <dict> entry of itemsToProcess
+        :param spider: <scrapy.Spider> spider producing the items
+        :return: <string> path to output file
+        """
+        output_dir = getattr(spider, "output_dir", None)
+        if not output_dir:
+            return it["output_file_name"]
+        os.makedirs(output_dir, exist_ok=True)
+        return os.path.join(output_dir, os.path.basename(it["output_file_name"]))
+
+    def get_shard_run(self, dir_out, spider):
+        """Shard run of the spider writing to an output directory
+        :param dir_out: <string> output directory
+        :param spider: <scrapy.Spider> spider producing the items
+        :return: <ShardRun>
+        """
+        if dir_out not in self.runs:
+            self.runs[dir_out] = ShardRun(
+                dir_out,
+                spider.name,
+                arguments=get_spider_arguments(spider),
+                resumable=self.resumable,
+                run_id=get_crawl_id(spider),
+            )
+        return self.runs[dir_out]
+
+    def open_output(self, it, spider):
+        """Open output file for an item type
+        :param it: <dict> entry of itemsToProcess
+        :param spider: <scrapy.Spider> spider producing the items
+        :return: <dict> with file handle (or shard), csv writer, and buffered rows
+        """
+        header = [k for k in it["item"].fields.keys()]
+        fn = self.get_output_file_name(it, spider)
+        # check whether we allow to append to existing files
+        # resumed crawls always append to the output of previous runs
+        append = it["appendExisting"] or getattr(spider, "append_output", False)
+        if self.shards:
+            dir_out, name = os.path.split(fn)
+            if append:
+                adopt_output(dir_out, name)
+            run = self.get_shard_run(dir_out, spider)
+            run.open_shard(name, append)
+            # rows are written to the shard through a buffer to checksum them
+            buffer = io.StringIO()
+            dict_writer = csv.DictWriter(buffer, header)
+            dict_writer.writeheader()
+            run.write(name, buffer.getvalue(), 0)
+            buffer.seek(0)
+            buffer.truncate()
+            return {
+                "run": run,
+                "name": name,
+                "buffer": buffer,
+                "writer": dict_writer,
+                "rows": [],
+            }
+        if os.path.isfile(fn) and append:
+            # append to existing file
+            output_file = open(fn, "a", newline="", encoding="utf-8")
+            dict_writer = csv.DictWriter(output_file, header)
+        else:
+            output_file = open(fn, "w", newline="", encoding="utf-8")
+            dict_writer = csv.DictWriter(output_file, header)
+            dict_writer.writeheader()
+        return {"file": output_file, "file_name": fn, "writer": dict_writer, "rows": []}
+
+    def flush_output(self, output):
+        """Write buffered rows to disk
+        :param output: <dict> open output as returned by open_output
+        """
+        output["writer"].writerows(output["rows"])
+        if "run" in output:
+            output["run"].write(
+                output["name"], output["buffer"].getvalue(), len(output["rows"])
+            )
+            output["buffer"].seek(0)
+            output["buffer"].truncate()
+        else:
+            output["file"].flush()
+        output["rows"] = []
+
     def process_item(self, item, spider):
         for it in self.itemsToProcess:
             if isinstance(item, it["item"]):
-                adapter = dict(ItemAdapter(item))
-                it["rows"].append(adapter)
-                it["header"] = [k for k in item.fields.keys()]
+                output = self.outputs.get(it["item"])
+                if output is None:
+                    output = self.open_output(it, spider)
+                    self.outputs[it["item"]] = output
+                output["rows"].append(dict(ItemAdapter(item)))
+                if len(output["rows"]) >= self.flush_rows:
+                    self.flush_outputs(spider)
+        return item
+
+    def flush_outputs(self, spider):
+        """Write buffered rows of all item types to disk
+        For resumable crawls, the ledger of completed work is committed
+        only after the data have been written
+        :param spider: <scrapy.Spider> spider producing the items
+        """
+        for output in self.outputs.values():
+            self.flush_output(output)
+        for run in self.runs.values():
+            run.checkpoint()
+        if getattr(spider, "ledger", None) is not None:
+            spider.ledger.commit()
+
+    def process_carried_items(self, spider):
+        """Process items the spider carries forward from a previous crawl,
+        e.g., unchanged accounts in delta mode
+        :param spider: <scrapy.Spider> spider producing the items
+        """
+        if hasattr(spider, "get_carried_items"):
+            for item in spider.get_carried_items():
+                self.process_item(item, spider)
 
     def close_spider(self, spider):
-        for it in self.itemsToProcess:
-            if len(it["rows"]) == 0:
-                continue
-            # check whether we allow to append to existing files
-            if os.path.isfile(it["output_file_name"]) and it["appendExisting"]:
-                # append to existing file
-                with open(
-                    it["output_file_name"], "a", newline="", encoding="utf-8"
-                ) as output_file:
-                    dict_writer = csv.DictWriter(output_file, it["header"])
-                    dict_writer.writerows(it["rows"])
-            else:
-                with open(
-                    it["output_file_name"], "w", newline="", encoding="utf-8"
-                ) as output_file:
-                    dict_writer = csv.DictWriter(output_file, it["header"])
-                    dict_writer.writeheader()
-                    dict_writer.writerows(it["rows"])
+        self.process_carried_items(spider)
+        self.flush_outputs(spider)
+        written = {}  # output directory: names of tables written without shards
+        for output in self.outputs.values():
+            if "file" in output:
+                output["file"].close()
+                dir_out, name = os.path.split(output["file_name"])
+                written.setdefault(dir_out, []).append(os.path.splitext(name)[0])
+        self.outputs = {}
+        for dir_out, names in written.items():
+            record_sources(dir_out, names, "csv", get_crawl_id(spider))
+        # consolidation records the csv files it writes
+        for dir_out, run in self.runs.items():
+            run.close()
+            if self.consolidate:
+                results = consolidate_shards(dir_out, spider_name=spider.name)
+                for name, rows in results.items():
+                    spider.logger.info(
+                        "Consolidated %s: %d rows" % (os.path.join(dir_out, name), rows)
+                    )
+        self.runs = {}
+
+
+class EutlParquetPipeline(EutlScraperPipeline):
+    """Writes items to typed parquet files in batched row groups.
+
+    Each item type is written to a directory "<name>.parquet" in DIR_PARSED
+    which can be read as one table, e.g., pd.read_parquet(dir + "compliance.parquet").
+    Every run writes a new part file. For item types appending to existing data
+    previous parts are kept, for all others they are removed. Part files are
+    written under a name starting with "_" (ignored when reading the
+    directory) and renamed once complete, previous parts are only removed
+    then such that an interrupted run leaves the previous data intact.
+    """
+
+    def __init__(self, flush_rows=10000):
+        """
+        :param flush_rows: <int> number of rows per item type in one row group
+        """
+        super().__init__(flush_rows=flush_rows)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(flush_rows=crawler.settings.getint("PARQUET_ROW_GROUP_ROWS", 10000))
+
+    def open_output(self, it, spider):
+        dir_out = self.get_output_file_name(it, spider).replace(".csv", ".parquet")
+        os.makedirs(dir_out, exist_ok=True)
+        fn = os.path.join(
+            dir_out, "part-%s.parquet" % datetime.now().strftime("%Y%m%d%H%M%S%f")
+        )
+        fn_tmp = os.path.join(dir_out, "_" + os.path.basename(fn))
+        schema = get_arrow_schema(it["item"])
+        return {
+            "item": it["item"],
+            "writer": pq.ParquetWriter(fn_tmp, schema),
+            "schema": schema,
+            "file_name": fn,
+            "tmp_file_name": fn_tmp,
+            "append": it["appendExisting"] or getattr(spider, "append_output", False),
+            "rows": [],
+        }
+
+    def flush_output(self, output):
+        if len(output["rows"]) == 0:
+            return
+        columns = []
+        for field in output["schema"]:
+            dtype = output["item"].fields[field.name].get("dtype", "string")
+            columns.append(
+                pa.array(
+                    [
+                        convert_typed(row.get(field.name), dtype)
+                        for row in output["rows"]
+                    ],
+                    type=field.type,
+                )
+            )
+        output["writer"].write_table(
+            pa.Table.from_arrays(columns, schema=output["schema"])
+        )
+        output["rows"] = []
+
+    def close_spider(self, spider):
+        self.process_carried_items(spider)
+        self.flush_outputs(spider)
+        written = {}  # output directory: names of tables
+        for output in self.outputs.values():
+            output["writer"].close()
+            if not output["append"]:
+                dir_out = os.path.dirname(output["file_name"])
+                for fn in glob.glob(os.path.join(dir_out, "part-*.parquet")):
+                    os.remove(fn)
+            os.replace(output["tmp_file_name"], output["file_name"])
+            dir_table = os.path.dirname(output["file_name"])
+            written.setdefault(os.path.dirname(dir_table), []).append(
+                os.path.basename(dir_table).replace(".parquet", "")
+            )
+        self.outputs = {}
+        for dir_out, names in written.items():
+            record_sources(dir_out, names, "parquet", get_crawl_id(spider))
+
+
+class EutlSqlitePipeline(EutlScraperPipeline):
+    """Writes items to a sqlite staging database next to the csv files.
+
+    Each item type is written to a table named like its csv file, e.g.,
+    "compliance", in "staging.db" in DIR_PARSED (or the output_dir of the
+    spider). Columns are typed by the "dtype" of the item fields. Rows are
+    inserted in batches of SQLITE_BATCH_ROWS in one transaction each, the
+    database runs in WAL mode such that it can be read while the crawl
+    writes. Key columns (STAGING_INDEX_COLUMNS) are indexed when the spider
+    closes. Tables of item types not appending to existing data are
+    replaced. Once complete, the tables are recorded as the current data of
+    the crawl in the output directory (see eutl_scraper.shards.record_sources).
+    """
+
+    def __init__(self, flush_rows=5000):
+        """
+        :param flush_rows: <int> number of rows per item type inserted in one transaction
+        """
+        super().__init__(flush_rows=flush_rows)
+        self.conn = None
+        self.dir_out = None  # directory of the staging database
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(flush_rows=crawler.settings.getint("SQLITE_BATCH_ROWS", 5000))
+
+    def get_connection(self, spider):
+        """Connection to the staging database, opened with the first item
+        :param spider: <scrapy.Spider> spider producing the items
+        :return: <sqlite3.Connection>
+        """
+        if self.conn is None:
+            fn = os.path.join(
+                getattr(spider, "output_dir", None) or DIR_PARSED, "staging.db"
+            )
+            os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+            # spiders run side by side in one process share the database
+            self.conn = sqlite3.connect(fn, timeout=60)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.dir_out = os.path.dirname(fn)
+        return self.conn
+
+    def open_output(self, it, spider):
+        conn = self.get_connection(spider)
+        table = os.path.basename(it["output_file_name"]).replace(".csv", "")
+        fields = it["item"].fields
+        columns = list(fields.keys())
+        with conn:
+            if not (it["appendExisting"] or getattr(spider, "append_output", False)):
+                conn.execute('DROP TABLE IF EXISTS "%s"' % table)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS "%s" (%s)'
+                % (
+                    table,
+                    ", ".join(
+                        '"%s" %s' % (c, SQLITE_TYPES[fields[c].get("dtype", "string")])
+                        for c in columns
+                    ),
+                )
+            )
+        return {
+            "item": it["item"],
+            "table": table,
+            "columns": columns,
+            "insert": 'INSERT INTO "%s" (%s) VALUES (%s)'
+            % (
+                table,
+                ", ".join('"%s"' % c for c in columns),
+                ", ".join("?" for _ in columns),
+            ),
+            "rows": [],
+        }
+
+    def flush_output(self, output):
+        if len(output["rows"]) == 0:
+            return
+        fields = output["item"].fields
+        dtypes = [fields[c].get("dtype", "string") for c in output["columns"]]
+        # one transaction per batch
+        with self.conn:
+            self.conn.executemany(
+                output["insert"],
+                (
+                    [
+                        get_sqlite_value(convert_typed(row.get(c), dtype))
+                        for c, dtype in zip(output["columns"], dtypes)
+                    ]
+                    for row in output["rows"]
+                ),
+            )
+        output["rows"] = []
+
+    def close_spider(self, spider):
+        self.process_carried_items(spider)
+        self.flush_outputs(spider)
+        if self.conn is not None:
+            with self.conn:
+                for output in self.outputs.values():
+                    for c in STAGING_INDEX_COLUMNS:
+                        if c in output["columns"]:
+                            self.conn.execute(
+                                'CREATE INDEX IF NOT EXISTS "idx_%s_%s" ON "%s" ("%s")'
+                                % (output["table"], c, output["table"], c)
+                            )
+            self.conn.close()
+            self.conn = None
+            record_sources(
+                self.dir_out,
+                [output["table"] for output in self.outputs.values()],
+                "staging",
+                get_crawl_id(spider),
+            )
+        self.outputs = {}
+
+
+class TransactionBlockDedupePipeline:
+    """Drops transaction blocks that have been scraped before.
+
+    Transaction pages are occasionally downloaded twice. Their blocks then
+    get new block numbers, so duplicates are identified by a hash over all
+    other fields. Hashes are kept in a compact HashSet64. If the blocks are
+    appended to an existing output file, the blocks of that file are
+    loaded first such that overlapping crawls do not add duplicates either.
+    """
+
+    itemsToDedupe = [TransactionBlockItem, EsdTransactionBlockItem]
+    # fields not considered for the content of a block
+    ignore_fields = ["transactionBlock"]
+
+    def __init__(self, capacity=1 << 20):
+        """
+        :param capacity: <int> initial number of hashes per item type
+        """
+        self.capacity = capacity
+        self.seen = {}  # hash set per item type
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("BLOCK_DEDUPE_ENABLED", True):
+            raise NotConfigured
+        pipeline = cls(
+            capacity=crawler.settings.getint("BLOCK_DEDUPE_CAPACITY", 1 << 20)
+        )
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def get_fields(self, item_class):
+        """Fields defining the content of a block
+        :param item_class: <scrapy.Item> class of the item
+        :return: <list> of field names
+        """
+        return [f for f in item_class.fields if f not in self.ignore_fields]
+
+    def get_seen(self, item_class, spider):
+        """Hashes of the blocks seen so far, created with the first block
+        such that spiders without transaction blocks do not read the output
+        :param item_class: <scrapy.Item> class of the block item
+        :param spider: <scrapy.Spider> spider producing the items
+        :return: <HashSet64>
+        """
+        if item_class not in self.seen:
+            self.seen[item_class] = HashSet64(self.capacity)
+            it = [
+                x for x in EutlScraperPipeline.itemsToProcess if x["item"] == item_class
+            ][0]
+            fn = EutlScraperPipeline().get_output_file_name(it, spider)
+            append = it["appendExisting"] or getattr(spider, "append_output", False)
+            if append and os.path.isfile(fn):
+                self.load_existing(item_class, fn)
+        return self.seen[item_class]
+
+    def get_hash(self, item_class, values):
+        """Hash of the content of a block
+        Values are converted by the dtype of their fields such that blocks
+        read from csv files written by earlier versions (e.g., dates as
+        dd/mm/yyyy) hash like scraped blocks
+        :param item_class: <scrapy.Item> class of the item
+        :param values: <dict> or <ItemAdapter> field name: value
+        :return: <int>
+        """
+        return get_hash64(
+            [
+                convert_typed(
+                    values.get(c), item_class.fields[c].get("dtype", "string")
+                )
+                for c in self.get_fields(item_class)
+            ]
+        )
+
+    def load_existing(self, item_class, fn):
+        """Add blocks of an existing output file to the seen hashes
+        :param item_class: <scrapy.Item> class of the items in the file
+        :param fn: <string> path to csv file
+        """
+        seen = self.seen[item_class]
+        with open(fn, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                seen.add(self.get_hash(item_class, row))
+        self.stats.set_value("dedupe/%s_existing" % item_class.__name__, len(seen))
+
+    def process_item(self, item, spider):
+        for item_class in self.itemsToDedupe:
+            if isinstance(item, item_class):
+                h = self.get_hash(item_class, ItemAdapter(item))
+                if not self.get_seen(item_class, spider).add(h):
+                    self.stats.inc_value("dedupe/%s_dropped" % item_class.__name__)
+                    raise DropItem("Duplicated transaction block %s" % h)
+        return item
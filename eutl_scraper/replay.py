@@ -0,0 +1,208 @@
+import multiprocessing
+from collections import Counter
+from scrapy import Request
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DropItem
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.conf import build_component_list
+from scrapy.utils.misc import create_instance, load_object
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.spider import iterate_spider_output
+from eutl_scraper.archive import PageArchive
+from eutl_scraper.own_settings import DIR_ARCHIVE
+
+# spider and archive of a replay worker process
+_worker = {}
+
+
+def get_replay_settings(settings):
+    """Copy settings for replay. Features that depend on the running engine,
+    i.e., the job directory, the overview backlog and waiting for cached
+    installations, are disabled as no signals are sent in replay.
+    :param settings: <scrapy.settings.Settings>
+    :return: <scrapy.settings.Settings>
+    """
+    settings = settings.copy()
+    settings.set("JOBDIR", None, priority="cmdline")
+    settings.set("OVERVIEW_MAX_BACKLOG", 0, priority="cmdline")
+    settings.set("INSTALLATION_CACHE_SIZE", 0, priority="cmdline")
+    return settings
+
+
+def get_crawler(spider_cls, settings):
+    """Create crawler to set up spiders and pipelines without crawling
+    :param spider_cls: <scrapy.Spider> class of the spider to replay
+    :param settings: <scrapy.settings.Settings>
+    :return: <scrapy.crawler.Crawler>
+    """
+    crawler = Crawler(spider_cls, settings)
+    # stats and request fingerprinter, the crawler only creates them when crawling
+    crawler.stats = load_object(crawler.settings["STATS_CLASS"])(crawler)
+    crawler.request_fingerprinter = create_instance(
+        load_object(crawler.settings["REQUEST_FINGERPRINTER_CLASS"]),
+        settings=crawler.settings,
+        crawler=crawler,
+    )
+    return crawler
+
+
+def init_worker(spider_cls, spider_kwargs, dir_archive, settings):
+    """Initialize replay worker process
+    :param spider_cls: <scrapy.Spider> class of the spider to replay
+    :param spider_kwargs: <dict> arguments of the spider
+    :param dir_archive: <string> archive directory
+    :param settings: <scrapy.settings.Settings> replay settings
+    """
+    # spiders are set up as in the crawl, e.g., the delta index
+    crawler = get_crawler(spider_cls, settings)
+    crawler.spider = spider_cls.from_crawler(crawler, **spider_kwargs)
+    _worker["spider"] = crawler.spider
+    _worker["archive"] = PageArchive(dir_archive)
+
+
+def get_task(request):
+    """Convert request to a replay task that can be sent to worker processes
+    :param request: <scrapy.Request>
+    :return: <tuple> url, callback name, meta, cb_kwargs, dont_filter, method, body
+    """
+    callback = request.callback.__name__ if request.callback else "parse"
+    return (
+        request.url,
+        callback,
+        dict(request.meta),
+        dict(request.cb_kwargs),
+        request.dont_filter,
+        request.method,
+        request.body,
+    )
+
+
+def get_request(task):
+    """Convert replay task back to a request
+    :param task: <tuple> as created by get_task
+    :return: <scrapy.Request>
+    """
+    url, _, meta, cb_kwargs, dont_filter, method, body = task
+    return Request(
+        url,
+        method=method,
+        body=body,
+        meta=meta,
+        cb_kwargs=cb_kwargs,
+        dont_filter=dont_filter,
+    )
+
+
+def replay_task(task):
+    """Parse an archived page with the spider callback of the task
+    :param task: <tuple> as created by get_task
+    :return: <tuple> url, list of items (None if page is not archived),
+                list of new tasks
+    """
+    url, callback, _, cb_kwargs = task[:4]
+    spider = _worker["spider"]
+    request = get_request(task)
+    response = _worker["archive"].get_response(request)
+    if response is None:
+        return url, None, []
+    items, tasks = [], []
+    result = getattr(spider, callback)(response, **cb_kwargs)
+    for x in iterate_spider_output(result):
+        if isinstance(x, Request):
+            tasks.append(get_task(x))
+        else:
+            items.append(x)
+    return url, items, tasks
+
+
+def get_pipelines(crawler):
+    """Instantiate the item pipelines configured in the settings
+    :param crawler: <scrapy.crawler.Crawler>
+    :return: <list> of pipelines in processing order
+    """
+    pipelines = []
+    for path in build_component_list(crawler.settings.getwithbase("ITEM_PIPELINES")):
+        pipe_cls = load_object(path)
+        if hasattr(pipe_cls, "from_crawler"):
+            pipelines.append(pipe_cls.from_crawler(crawler))
+        else:
+            pipelines.append(pipe_cls())
+    return pipelines
+
+
+def replay(
+    spider_name,
+    dir_archive=None,
+    processes=None,
+    chunksize=20,
+    settings=None,
+    **spider_kwargs
+):
+    """Parse archived pages with the callbacks of a spider without network access.
+
+    Starting from the spider's start requests, archived pages are parsed in a
+    process pool level by level, i.e., all requests yielded by the callbacks
+    for pages of one level are replayed in the next level. Items are passed
+    through the configured item pipelines. Job directory and delta mode are not
+    supported in replay.
+    :param spider_name: <string> name of the spider, e.g., "accounts"
+    :param dir_archive: <string> archive directory, defaults to ARCHIVE_DIR setting
+    :param processes: <int> number of worker processes, defaults to number of cpus
+    :param chunksize: <int> number of pages sent to a worker at once
+    :param settings: <scrapy.settings.Settings> defaults to project settings
+    :param spider_kwargs: arguments of the spider (as passed by -a)
+    :return: <collections.Counter> with numbers of replayed pages, missing pages, and items
+    """
+    settings = get_replay_settings(settings or get_project_settings())
+    dir_archive = dir_archive or settings.get("ARCHIVE_DIR") or DIR_ARCHIVE
+    spider_cls = SpiderLoader.from_settings(settings).load(spider_name)
+    crawler = get_crawler(spider_cls, settings)
+    crawler.spider = spider = spider_cls.from_crawler(crawler, **spider_kwargs)
+    pipelines = get_pipelines(crawler)
+    for pipe in pipelines:
+        if hasattr(pipe, "open_spider"):
+            pipe.open_spider(spider)
+
+    stats = Counter()
+    seen = set()
+    tasks = []
+    for request in spider.start_requests():
+        seen.add(crawler.request_fingerprinter.fingerprint(request))
+        tasks.append(get_task(request))
+
+    with multiprocessing.Pool(
+        processes,
+        initializer=init_worker,
+        initargs=(spider_cls, spider_kwargs, dir_archive, settings),
+    ) as pool:
+        level = 0
+        while tasks:
+            print("Replay %s level %d: %d pages" % (spider_name, level, len(tasks)))
+            next_tasks = []
+            for url, items, new_tasks in pool.imap_unordered(
+                replay_task, tasks, chunksize
+            ):
+                if items is None:
+                    stats["missing"] += 1
+                    continue
+                stats["pages"] += 1
+                for item in items:
+                    stats["items"] += 1
+                    try:
+                        for pipe in pipelines:
+                            item = pipe.process_item(item, spider)
+                    except DropItem:
+                        stats["dropped"] += 1
+                # duplicate requests are filtered by fingerprint as in the crawl
+                for task in new_tasks:
+                    fp = crawler.request_fingerprinter.fingerprint(get_request(task))
+                    if fp not in seen or task[4]:
+                        seen.add(fp)
+                        next_tasks.append(task)
+            tasks = next_tasks
+            level += 1
+
+    for pipe in pipelines:
+        if hasattr(pipe, "close_spider"):
+            pipe.close_spider(spider)
+    return stats
@@ -0,0 +1,83 @@
+import os
+from scrapy.crawler import CrawlerProcess
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+from eutl_scraper.middlewares import get_failure_ledger_file
+from eutl_scraper.state import FailureLedger
+
+# spiders of a complete crawl of accounts, entitlements and effort sharing data
+DEFAULT_SPIDERS = [
+    "accounts",
+    "entitlements",
+    "esd_transactions",
+    "esd_allocations",
+    "esd_compliance",
+    "esd_entitlement",
+]
+
+
+def run_spiders(spider_names=None, global_concurrency=16, settings=None):
+    """Run several spiders side by side in one process.
+
+    All spiders start at once and share one budget of concurrent downloads
+    (see GlobalConcurrencyMiddleware) such that small spiders fill the
+    connections left by the large ones instead of running one after another.
+    :param spider_names: <list> of spider names, defaults to DEFAULT_SPIDERS
+    :param global_concurrency: <int> maximal number of concurrent downloads
+                    of all spiders
+    :param settings: <dict> settings overriding the project settings
+    :return: <dict> spider name: crawl stats
+    """
+    spider_names = spider_names or DEFAULT_SPIDERS
+    # load the project settings independent of the working directory
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "eutl_scraper.settings")
+    project_settings = get_project_settings()
+    project_settings.set("GLOBAL_CONCURRENT_REQUESTS", global_concurrency)
+    if settings:
+        project_settings.setdict(settings, priority="cmdline")
+    if project_settings.get("JOBDIR"):
+        raise ValueError("Spiders run together can not share one JOBDIR")
+
+    process = CrawlerProcess(project_settings)
+    crawlers = {}
+    for name in spider_names:
+        crawler = process.create_crawler(name)
+        crawlers[name] = crawler
+        process.crawl(crawler)
+    print("Start spiders %s" % ", ".join(spider_names))
+    process.start()
+    return {name: crawler.stats.get_stats() for name, crawler in crawlers.items()}
+
+
+def retry_failed(spider_names=None, global_concurrency=16, settings=None):
+    """Request the failures recorded in the failure ledger again.
+
+    Spiders with recorded failures (see FailureLedgerMiddleware) are run with
+    FAILURE_REPLAY such that only the failed requests are downloaded and
+    their items are appended to the existing output.
+    :param spider_names: <list> of spider names, defaults to all spiders with failures
+    :param global_concurrency: <int> maximal number of concurrent downloads
+                    of all spiders
+    :param settings: <dict> settings overriding the project settings
+    :return: <dict> spider name: crawl stats
+    """
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "eutl_scraper.settings")
+    project_settings = get_project_settings()
+    if settings:
+        project_settings.setdict(settings, priority="cmdline")
+    ledger = FailureLedger(get_failure_ledger_file(project_settings))
+    failed = ledger.get_spiders()
+    ledger.close()
+    # the ledger also holds failures of other routines, e.g., link_accounts
+    spiders = SpiderLoader.from_settings(project_settings).list()
+    spider_names = [
+        name for name in spider_names or failed if name in failed and name in spiders
+    ]
+    if not spider_names:
+        print("No failed requests to retry")
+        return {}
+    return run_spiders(
+        spider_names,
+        global_concurrency=global_concurrency,
+        settings=dict(settings or {}, FAILURE_REPLAY=True),
+    )
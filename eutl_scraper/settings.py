@@ -7,6 +7,8 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+from eutl_scraper.dupefilters import DUPEFILTER_CAPACITY
+
 BOT_NAME = "eutl_scraper"
 
 SPIDER_MODULES = ["eutl_scraper.spiders"]
@@ -14,7 +16,11 @@ NEWSPIDER_MODULE = "eutl_scraper.spiders"
 
 DOWNLOAD_DELAY = 0.1
 RETRY_TIMES = 3
-CONCURRENT_REQUESTS = 15
+# exponential backoff (in seconds) for retries of unavailable EUTL pages
+RETRY_BACKOFF_BASE = 5
+RETRY_BACKOFF_MAX = 120
+# upper bound of concurrent requests, the concurrency is adapted by AimdThrottle
+CONCURRENT_REQUESTS = 32
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 # USER_AGENT = 'eutl_scraper (+http://www.yourdomain.com)'
@@ -47,28 +53,120 @@ CONCURRENT_REQUESTS = 15
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-# SPIDER_MIDDLEWARES = {
-#    'eutl_scraper.middlewares.EutlScraperSpiderMiddleware': 543,
-# }
+SPIDER_MIDDLEWARES = {
+    #    'eutl_scraper.middlewares.EutlScraperSpiderMiddleware': 543,
+    # parse CPU time per callback for the telemetry
+    "eutl_scraper.middlewares.TelemetrySpiderMiddleware": 950,
+    # replaces the start requests by failed requests with FAILURE_REPLAY
+    "eutl_scraper.middlewares.FailureReplayMiddleware": 50,
+}
+
+# request further overview pages of paginated spiders only while fewer requests
+# wait in the scheduler (keeps scheduler memory bounded), 0 requests all at once
+OVERVIEW_MAX_BACKLOG = 1000
+
+# number of installations whose items are cached to serve other accounts
+# linking the same installation without downloading it again, 0 disables
+INSTALLATION_CACHE_SIZE = 2000
+
+# map accounts linked in transaction blocks to their account ID (TransactionSpider)
+# resolved accounts are stored in ACCOUNT_ID_MAP_FILE (default in DIR_STATE of
+# own_settings.py) and not looked up again in later runs
+ACCOUNT_ID_MAP_ENABLED = True
+ACCOUNT_ID_MAP_FILE = None
+
+# requests failing after all retries are recorded in FAILURE_LEDGER_FILE (default
+# failures.db in DIR_STATE of own_settings.py) and requested again in up to
+# FAILURE_SWEEP_ROUNDS sweeps once the crawl has drained, 0 only records them
+FAILURE_LEDGER_ENABLED = True
+FAILURE_LEDGER_FILE = None
+FAILURE_SWEEP_ROUNDS = 1
+# request only the failed requests recorded in the ledger and append their items
+# to the existing output, e.g., scrapy crawl accounts -s FAILURE_REPLAY=True
+FAILURE_REPLAY = False
+
+# parse only the tables of a page the spider callbacks read (spider attribute
+# slice_tables) instead of the complete page with layout and navigation markup
+TABLE_SLICE_ENABLED = True
+
+# request fingerprints are kept in a memory mapped file (in JOBDIR if given)
+DUPEFILTER_CLASS = "eutl_scraper.dupefilters.DiskDupeFilter"
+# initial number of fingerprint slots (8 bytes each), grows when half full
+DUPEFILTER_CAPACITY = DUPEFILTER_CAPACITY
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
-    "eutl_scraper.middlewares.CustomRetryMiddleware": 123
+    # below the retry middlewares (123 and 550) to see failures after all retries
+    "eutl_scraper.middlewares.FailureLedgerMiddleware": 100,
+    "eutl_scraper.middlewares.CustomRetryMiddleware": 123,
+    # below HttpCompressionMiddleware (590) to archive decompressed bodies
+    "eutl_scraper.middlewares.ArchiveMiddleware": 580,
+    # below ArchiveMiddleware such that the complete pages are archived
+    "eutl_scraper.middlewares.TableSliceMiddleware": 570,
+    # closest to the download such that cached and archived pages take no slot
+    "eutl_scraper.middlewares.GlobalConcurrencyMiddleware": 950,
     #    'eutl_scraper.middlewares.EutlScraperDownloaderMiddleware': 543,
 }
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-# }
+EXTENSIONS = {
+    #    'scrapy.extensions.telnet.TelnetConsole': None,
+    "eutl_scraper.extensions.AimdThrottle": 500,
+    "eutl_scraper.extensions.CrawlTelemetry": 510,
+}
+# adapt concurrency to overload pages of the EUTL:
+# additive increase on clean responses, multiplicative decrease on overload
+AIMD_ENABLED = True
+AIMD_START_CONCURRENCY = 8
+AIMD_MIN_CONCURRENCY = 1
+AIMD_INCREASE = 1
+AIMD_DECREASE_FACTOR = 0.5
+# export crawl metrics (json lines and Prometheus text file) every TELEMETRY_INTERVAL seconds
+# default directory is DIR_TELEMETRY in own_settings.py
+TELEMETRY_ENABLED = True
+TELEMETRY_DIR = None
+TELEMETRY_INTERVAL = 60
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
+    "eutl_scraper.pipelines.TransactionBlockDedupePipeline": 200,
     "eutl_scraper.pipelines.EutlScraperPipeline": 300,
+    # typed parquet output in addition to csv
+    # "eutl_scraper.pipelines.EutlParquetPipeline": 310,
+    # sqlite staging database (data/parsed/staging.db) in addition to csv
+    # "eutl_scraper.pipelines.EutlSqlitePipeline": 320,
 }
+# maximal number of concurrent downloads of all spiders run together in one
+# process by eutl_scraper.runner, 0 disables the shared limit
+GLOBAL_CONCURRENT_REQUESTS = 0
+# drop transaction blocks downloaded twice (identical content but new block number)
+BLOCK_DEDUPE_ENABLED = True
+# initial capacity of the hash set per block type, grows when half full
+BLOCK_DEDUPE_CAPACITY = 1048576
+# number of rows per item type buffered before being written to csv
+CSV_FLUSH_ROWS = 1000
+# number of rows per row group in parquet files
+PARQUET_ROW_GROUP_ROWS = 10000
+# number of rows per item type inserted in one transaction into the staging database
+SQLITE_BATCH_ROWS = 5000
+# write the csv output of each run to its own shards (data/parsed/shards/<run>/) with
+# a manifest of rows and checksums, see eutl_scraper.shards
+SHARD_OUTPUT = True
+# merge the shards into the csv files when the spider closes, otherwise run
+# main_consolidate_shards.py
+SHARD_CONSOLIDATE = True
+# compliance deadline (month-day) for emissions of the previous year
+# compliance years with deadline after the previous crawl are refreshed in delta mode
+DELTA_COMPLIANCE_DEADLINE = "09-30"
+# archive raw pages (see eutl_scraper.archive), default directory is DIR_ARCHIVE in own_settings.py
+ARCHIVE_ENABLED = False
+ARCHIVE_DIR = None
+ARCHIVE_COMMIT_PAGES = 100
+# serve archived pages from the archive instead of downloading them
+ARCHIVE_REPLAY = False
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
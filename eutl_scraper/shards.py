@@ -0,0 +1,494 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+MANIFEST = "manifest.json"
+LOCK = "consolidate.lock"
+OUTPUTS = "outputs.json"  # size and checksum of the consolidated output files
+SOURCES = "sources.json"  # sinks of the crawl that wrote each table last
+CHUNK_SIZE = 1 << 20  # bytes read at once when verifying and merging shards
+
+
+def get_shard_dir(dir_out):
+    """Directory with the shards of all runs writing to an output directory
+    :param dir_out: <string> output directory, e.g., DIR_PARSED
+    :return: <string>
+    """
+    return os.path.join(dir_out, "shards")
+
+
+def write_json(fn, data):
+    """Write json file atomically, i.e., to a temporary file that replaces
+    the file once it is complete
+    :param fn: <string> path to json file
+    :param data: <dict> data to write
+    """
+    fn_tmp = fn + ".tmp"
+    with open(fn_tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(fn_tmp, fn)
+
+
+def get_run_id(name):
+    """Unique, chronologically sortable identifier of a run
+    :param name: <string> name of the spider
+    :return: <string>
+    """
+    return "%s_%s_%d" % (datetime.now().strftime("%Y%m%d%H%M%S%f"), name, os.getpid())
+
+
+class ShardRun:
+    """Output shards of one run of a spider.
+
+    Each output file of the run is written to its own shard in
+    "shards/<run id>/" of the output directory, first as "<name>.tmp" which
+    is renamed to "<name>" once the run has finished. The manifest of the run
+    records the spider, its arguments, and for each shard whether it appends
+    to or replaces previous data, the number of rows, and the size and
+    checksum of the data written. It is updated atomically at every
+    checkpoint, so a crashed run leaves a manifest covering the data written
+    up to its last checkpoint.
+    """
+
+    def __init__(
+        self, dir_out, spider_name, arguments=None, resumable=False, run_id=None
+    ):
+        """
+        :param dir_out: <string> output directory
+        :param spider_name: <string> name of the spider
+        :param arguments: <dict> arguments of the spider
+        :param resumable: <boolean> the run can be resumed (job directory), i.e.,
+                    the data of a crashed run are continued by the next run
+        :param run_id: <string> identifier of the run as created by get_run_id,
+                    defaults to a new identifier
+        """
+        self.run_id = run_id or get_run_id(spider_name)
+        self.dir_run = os.path.join(get_shard_dir(dir_out), self.run_id)
+        os.makedirs(self.dir_run)
+        self.shards = {}
+        self.manifest = {
+            "run": self.run_id,
+            "spider": spider_name,
+            "arguments": arguments or {},
+            "resumable": resumable,
+            "status": "running",
+            "started": datetime.now().isoformat(),
+            "finished": None,
+            "files": {},
+        }
+        self.checkpoint()
+
+    def open_shard(self, name, append):
+        """Open shard for an output file
+        :param name: <string> name of the output file, e.g., "accounts.csv"
+        :param append: <boolean> shard appends to the previous data of the file
+        """
+        self.shards[name] = {
+            "file": open(
+                os.path.join(self.dir_run, name + ".tmp"),
+                "w",
+                newline="",
+                encoding="utf-8",
+            ),
+            "sha256": hashlib.sha256(),
+            "append": append,
+            "rows": 0,
+            "bytes": 0,
+        }
+
+    def write(self, name, text, rows):
+        """Write data to a shard
+        :param name: <string> name of the output file
+        :param text: <string> csv text
+        :param rows: <int> number of data rows in text
+        """
+        shard = self.shards[name]
+        data = text.encode("utf-8")
+        shard["file"].write(text)
+        shard["sha256"].update(data)
+        shard["bytes"] += len(data)
+        shard["rows"] += rows
+
+    def checkpoint(self, finished=False):
+        """Write shards to disk and update the manifest
+        :param finished: <boolean> shards are complete and have been renamed
+        """
+        for name, shard in self.shards.items():
+            if not finished:
+                shard["file"].flush()
+                os.fsync(shard["file"].fileno())
+            self.manifest["files"][name] = {
+                "file": name if finished else name + ".tmp",
+                "append": shard["append"],
+                "rows": shard["rows"],
+                "bytes": shard["bytes"],
+                "sha256": shard["sha256"].hexdigest(),
+            }
+        write_json(os.path.join(self.dir_run, MANIFEST), self.manifest)
+
+    def close(self):
+        """Finish the run, i.e., rename the shards and mark the run complete"""
+        self.checkpoint()
+        for name, shard in self.shards.items():
+            shard["file"].close()
+            os.replace(
+                os.path.join(self.dir_run, name + ".tmp"),
+                os.path.join(self.dir_run, name),
+            )
+        self.manifest["status"] = "complete"
+        self.manifest["finished"] = datetime.now().isoformat()
+        self.checkpoint(finished=True)
+
+
+def read_manifests(dir_out):
+    """Manifests of all runs writing to an output directory
+    :param dir_out: <string> output directory
+    :return: <list> of manifests in order of the start of the runs
+    """
+    dir_shards = get_shard_dir(dir_out)
+    if not os.path.isdir(dir_shards):
+        return []
+    manifests = []
+    for run_id in os.listdir(dir_shards):
+        fn = os.path.join(dir_shards, run_id, MANIFEST)
+        if os.path.isfile(fn):
+            with open(fn, encoding="utf-8") as f:
+                manifests.append(json.load(f))
+    return sorted(manifests, key=lambda x: (x["started"], x["run"]))
+
+
+def get_shard_chains(manifests):
+    """Shards making up each output file
+    A shard replacing previous data starts a new chain, appending shards are
+    added to the chain. Runs that did not finish are only used if they can be
+    resumed, i.e., with the data up to their last checkpoint.
+    :param manifests: <list> of manifests as returned by read_manifests
+    :return: <dict> name of output file: list of (run id, shard) tuples
+    """
+    chains = {}
+    for manifest in manifests:
+        if manifest["status"] != "complete" and not manifest["resumable"]:
+            continue
+        for name, shard in manifest["files"].items():
+            if shard["append"]:
+                chains.setdefault(name, []).append((manifest["run"], shard))
+            else:
+                chains[name] = [(manifest["run"], shard)]
+    return chains
+
+
+def read_shard(dir_out, run_id, shard):
+    """Stream the verified data of a shard
+    Only the data recorded in the manifest are read. A shard not matching its
+    checksum raises a ValueError once it has been read.
+    :param dir_out: <string> output directory
+    :param run_id: <string> identifier of the run
+    :param shard: <dict> shard as recorded in the manifest
+    :return: <generator> of header line and chunks of data rows (bytes)
+    """
+    fn = os.path.join(get_shard_dir(dir_out), run_id, shard["file"])
+    sha256 = hashlib.sha256()
+    with open(fn, "rb") as f:
+        header = f.readline(shard["bytes"])
+        sha256.update(header)
+        yield header
+        remaining = shard["bytes"] - len(header)
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            sha256.update(data)
+            remaining -= len(data)
+            yield data
+    if remaining > 0 or sha256.hexdigest() != shard["sha256"]:
+        raise ValueError("Shard %s does not match its manifest" % fn)
+
+
+@contextmanager
+def lock_output(dir_out, timeout=600):
+    """Lock an output directory against concurrent consolidation
+    :param dir_out: <string> output directory
+    :param timeout: <int> seconds after which a lock is taken as stale
+    """
+    fn = os.path.join(get_shard_dir(dir_out), LOCK)
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    while True:
+        try:
+            fd = os.open(fn, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(fn) > timeout:
+                    os.remove(fn)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(fn)
+
+
+def read_outputs(dir_out):
+    """Size and checksum of the output files as written by the last
+    consolidation (or adoption) of each file
+    :param dir_out: <string> output directory
+    :return: <dict> name of output file: {"bytes", "sha256", "mtime", "started"}
+    """
+    fn = os.path.join(get_shard_dir(dir_out), OUTPUTS)
+    if not os.path.isfile(fn):
+        return {}
+    with open(fn, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_output(dir_out, name, size, sha256, started):
+    """Record size and checksum of an output file that has just been written
+    :param dir_out: <string> output directory
+    :param name: <string> name of the output file
+    :param size: <int> size in bytes
+    :param sha256: <string> hex digest of the sha256 checksum
+    :param started: <string> start of the last run with data in the file
+    """
+    outputs = read_outputs(dir_out)
+    outputs[name] = {
+        "bytes": size,
+        "sha256": sha256,
+        "mtime": os.stat(os.path.join(dir_out, name)).st_mtime_ns,
+        "started": started,
+    }
+    write_json(os.path.join(get_shard_dir(dir_out), OUTPUTS), outputs)
+
+
+def read_sources(dir_out):
+    """Sinks of the crawl that wrote each table last
+    :param dir_out: <string> output directory
+    :return: <dict> name of table: {"run", "sinks", "written"}
+    """
+    fn = os.path.join(get_shard_dir(dir_out), SOURCES)
+    if not os.path.isfile(fn):
+        return {}
+    with open(fn, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_sources(dir_out, names, sink, run_id):
+    """Record that a sink has completely written tables. Sinks of the same
+    crawl (run) are recorded together, a later crawl replaces them, such that
+    readers know which sinks hold the current data of a table.
+    :param dir_out: <string> output directory
+    :param names: <list: string> names of the tables, e.g., "compliance"
+    :param sink: <string> "csv", "parquet", or "staging"
+    :param run_id: <string> identifier of the crawl as created by get_run_id
+    """
+    if not names:
+        return
+    with lock_output(dir_out):
+        sources = read_sources(dir_out)
+        for name in names:
+            source = sources.get(name)
+            if source is None or source["run"] != run_id:
+                source = sources[name] = {"run": run_id, "sinks": []}
+            if sink not in source["sinks"]:
+                source["sinks"].append(sink)
+            source["written"] = datetime.now().isoformat()
+        write_json(os.path.join(get_shard_dir(dir_out), SOURCES), sources)
+
+
+def get_sha256(fn):
+    """sha256 checksum of a file
+    :param fn: <string> path to file
+    :return: <string> hex digest
+    """
+    sha256 = hashlib.sha256()
+    with open(fn, "rb") as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+def is_foreign(dir_out, name, manifests, outputs):
+    """Check whether an output file holds data not in the shards, i.e., it
+    has been written without shards or changed since it was consolidated,
+    e.g., by windows.merge_csv. The checksum is only computed if the size
+    matches but the modification time does not.
+    :param dir_out: <string> output directory
+    :param name: <string> name of the output file
+    :param manifests: <list> of manifests as returned by read_manifests
+    :param outputs: <dict> as returned by read_outputs
+    :return: <boolean>
+    """
+    fn = os.path.join(dir_out, name)
+    if not os.path.isfile(fn):
+        return False
+    if name not in outputs:
+        return not any(name in m["files"] for m in manifests)
+    output = outputs[name]
+    stat = os.stat(fn)
+    if stat.st_size != output["bytes"]:
+        return True
+    if stat.st_mtime_ns == output["mtime"]:
+        return False
+    return get_sha256(fn) != output["sha256"]
+
+
+def adopt_file(dir_out, name, outputs):
+    """Copy an output file to a new shard replacing all previous shards of the
+    file. The caller has to hold the lock of the output directory.
+    :param dir_out: <string> output directory
+    :param name: <string> name of the output file
+    :param outputs: <dict> as returned by read_outputs
+    """
+    fn = os.path.join(dir_out, name)
+    run = ShardRun(dir_out, "existing")
+    # the existing data replace the shards of the runs consolidated into the
+    # file and precede those of later runs, for files written without shards
+    # that are the runs started after the file has been written
+    if name in outputs:
+        run.manifest["started"] = outputs[name]["started"]
+    else:
+        run.manifest["started"] = datetime.fromtimestamp(
+            os.path.getmtime(fn)
+        ).isoformat()
+    run.open_shard(name, append=False)
+    with open(fn, newline="", encoding="utf-8") as f:
+        rows = sum(1 for _ in csv.reader(f)) - 1
+        f.seek(0)
+        for text in iter(lambda: f.read(CHUNK_SIZE), ""):
+            run.write(name, text, 0)
+    run.shards[name]["rows"] = max(rows, 0)
+    shard = run.shards[name]
+    run.close()
+    record_output(
+        dir_out,
+        name,
+        shard["bytes"],
+        shard["sha256"].hexdigest(),
+        run.manifest["started"],
+    )
+
+
+def adopt_output(dir_out, name):
+    """Take over the data of an output file not in the shards, i.e., written
+    without shards or changed since it was consolidated, as the first shard
+    of the file such that runs appending to it keep its data
+    :param dir_out: <string> output directory
+    :param name: <string> name of the output file, e.g., "transactionBlocks.csv"
+    """
+    with lock_output(dir_out):
+        outputs = read_outputs(dir_out)
+        if is_foreign(dir_out, name, read_manifests(dir_out), outputs):
+            adopt_file(dir_out, name, outputs)
+
+
+def is_crashed(manifest, manifests):
+    """Check whether a run has crashed, i.e., it did not finish but a later
+    run of the same spider did
+    :param manifest: <dict> manifest of the run
+    :param manifests: <list> of manifests as returned by read_manifests
+    :return: <boolean>
+    """
+    if manifest["status"] == "complete":
+        return False
+    return any(
+        m["spider"] == manifest["spider"]
+        and m["status"] == "complete"
+        and (m["started"], m["run"]) > (manifest["started"], manifest["run"])
+        for m in manifests
+    )
+
+
+def consolidate_shards(dir_out, spider_name=None, prune=True):
+    """Merge the shards of all runs into the output files
+    Each output file is written to a temporary file that replaces the
+    existing file once it is complete. Output files changed since they were
+    consolidated are adopted first such that their data are kept.
+    :param dir_out: <string> output directory
+    :param spider_name: <string> only consolidate files written by this spider,
+                    defaults to all files
+    :param prune: <boolean> remove finished runs not used by any output file
+                    and crashed runs whose data are not used (not resumable or
+                    superseded)
+    :return: <dict> name of output file: number of rows
+    """
+    results = {}
+    written = {}  # output file: last run with data in it
+    with lock_output(dir_out):
+        manifests = read_manifests(dir_out)
+        outputs = read_outputs(dir_out)
+        names = [
+            name
+            for name in get_shard_chains(manifests)
+            if spider_name is None
+            or any(m["spider"] == spider_name and name in m["files"] for m in manifests)
+        ]
+        adopted = [
+            name for name in names if is_foreign(dir_out, name, manifests, outputs)
+        ]
+        for name in adopted:
+            adopt_file(dir_out, name, outputs)
+        if adopted:
+            manifests = read_manifests(dir_out)
+        chains = get_shard_chains(manifests)
+        spiders = {m["run"]: m["spider"] for m in manifests}
+        starts = {m["run"]: m["started"] for m in manifests}
+        for name in names:
+            chain = chains[name]
+            if spider_name is not None and all(
+                spiders[run_id] != spider_name for run_id, _ in chain
+            ):
+                continue
+            fn = os.path.join(dir_out, name)
+            header = None
+            sha256 = hashlib.sha256()
+            size = 0
+            try:
+                with open(fn + ".tmp", "wb") as f_out:
+                    for run_id, shard in chain:
+                        if shard["bytes"] == 0:
+                            continue
+                        chunks = read_shard(dir_out, run_id, shard)
+                        shard_header = next(chunks)
+                        if header is None:
+                            header = shard_header
+                            chunks = itertools.chain([header], chunks)
+                        elif shard_header != header:
+                            raise ValueError(
+                                "Header of shard %s/%s differs from %s"
+                                % (run_id, name, fn)
+                            )
+                        for data in chunks:
+                            f_out.write(data)
+                            sha256.update(data)
+                            size += len(data)
+            except Exception:
+                # keep the existing output file
+                os.remove(fn + ".tmp")
+                raise
+            os.replace(fn + ".tmp", fn)
+            record_output(dir_out, name, size, sha256.hexdigest(), starts[chain[-1][0]])
+            results[name] = sum(shard["rows"] for _, shard in chain)
+            written[name] = chain[-1][0]
+
+        if prune:
+            used = set(run_id for chain in chains.values() for run_id, _ in chain)
+            for manifest in manifests:
+                if manifest["run"] in used:
+                    continue
+                if manifest["status"] == "complete" or is_crashed(manifest, manifests):
+                    shutil.rmtree(os.path.join(get_shard_dir(dir_out), manifest["run"]))
+    # the csv files hold the data of the runs that wrote them last
+    for run_id in set(written.values()):
+        names = [os.path.splitext(x)[0] for x, r in written.items() if r == run_id]
+        record_sources(dir_out, names, "csv", run_id)
+    return results
@@ -1,73 +1,210 @@
+import re
 import scrapy
+from collections import OrderedDict
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from scrapy.loader import ItemLoader
 from eutl_scraper.items import AccountItem, ContactItem
 from eutl_scraper.items import InstallationItem, ComplianceItem, SurrenderingDetailsItem
+from eutl_scraper.items._utils import get_typed_item
+from eutl_scraper.delta import DeltaIndex, normalize
+from eutl_scraper.middlewares import RetryDelayed
+from eutl_scraper.own_settings import DIR_PARSED
+from ._paginated import PaginatedSpider
+from ._extraction import (
+    TableGrid,
+    get_first,
+    get_strings,
+    ALL_TEXT,
+    CLASSICTEXT_SPANS,
+    FONT_HEAD_TEXT,
+    INPUT_VALUE,
+    LINK_HREF,
+    LINK_SPAN_TEXT,
+    LISTLINKS,
+    SPAN_HEAD_TEXT,
+    SPAN_TEXT,
+    SUP_TEXT,
+    TABLES_BY_ID,
+    TITLELIST,
+)
+from urllib.parse import parse_qs, urlparse
+import os
 
 
-class AccountSpider(scrapy.Spider):
+class AccountSpider(PaginatedSpider):
+    """Spider for accounts, installations, compliance, and surrendered units.
+
+    In delta mode (-a delta=<directory with previously parsed data>) accounts
+    shown unchanged in the overview are not downloaded again. Their
+    installations are only refreshed if they have an open compliance year.
+    Data of unchanged accounts and installations are carried forward from the
+    previous files into the new output.
+
+    Installations are linked from all their current and former operator
+    accounts. With INSTALLATION_CACHE_SIZE, the installation and surrender
+    pages are only downloaded for the first of these accounts. Their items
+    are cached and repeated with the account's identifier and urls for the
+    other accounts.
+    """
+
     name = "accounts"
-    next_page_number = 1  # zero indexed
-    max_pages = None
     # 30
     # 1416
     start_urls = [
         "https://ec.europa.eu/clima/ets/account.do?languageCode=en&accountHolder=&searchType=account&currentSortSettings=&resultList.currentPageNumber=0&nextList=Next>"
     ]
+    slice_tables = [
+        "tblAccountSearchResult",
+        "tblAccountGeneralInfo",
+        "tblAccountContactInfo",
+        "tblChildDetails",
+    ]
+    delta = None  # directory with previously parsed data for delta mode
+    delta_index = None
+    # deeper pages are requested first such that accounts are completed
+    # before further accounts are requested (overview pages have priority 0)
+    priority_account = 10
+    priority_installation = 20
+    priority_surrender = 30
+    installation_cache = None  # items of installations by installationID
+    installations_pending = None  # installations with pages being downloaded
+    installation_cache_size = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # accounts and installations carried forward or parsed in delta mode
+        self.carried_accounts = set()
+        self.carried_installations = set()
+        self.parsed_installations = set()
+        # surrender pages still to be parsed per installation page, the
+        # installation and its account are completed once all are parsed
+        self.surrenders_open = {}
 
-    def parse(self, response):
-        # update maximum number of pages (corrected for 0 indexing)
-        if not self.max_pages:
-            self.max_pages = (
-                int(
-                    response.css("input[name='resultList.lastPageNumber']").attrib[
-                        "value"
-                    ]
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if spider.delta:
+            if os.path.realpath(spider.delta) == os.path.realpath(DIR_PARSED):
+                raise ValueError(
+                    "Previous data for delta mode have to be moved out of %s"
+                    % DIR_PARSED
                 )
-                - 1
+            spider.delta_index = DeltaIndex(
+                spider.delta,
+                compliance_deadline=crawler.settings.get(
+                    "DELTA_COMPLIANCE_DEADLINE", "09-30"
+                ),
             )
+        spider.installation_cache_size = crawler.settings.getint(
+            "INSTALLATION_CACHE_SIZE", 0
+        )
+        if spider.installation_cache_size > 0:
+            spider.installation_cache = OrderedDict()
+            spider.installations_pending = {}
+            crawler.signals.connect(
+                spider.release_pending_installations, signal=signals.spider_idle
+            )
+        return spider
+
+    def get_page_url(self, page_number):
+        return (
+            "https://ec.europa.eu/clima/ets/account.do?languageCode=en&accountHolder=&searchType=account&currentSortSettings=&resultList.currentPageNumber=%d&nextList=Next>"
+            % page_number
+        )
+
+    def parse_overview(self, response):
+        if self.delta_index is not None:
+            headers = response.css("table#tblAccountSearchResult>tr:nth-child(2)>td")
+            headers = [normalize(" ".join(h.css("::text").getall())) for h in headers]
 
         # extract links to detail pages from table
         for r in response.css("table#tblAccountSearchResult>tr")[2:]:
             url = response.urljoin(r.css("a.listlink").attrib["href"])
-            yield response.follow(url, callback=self.parse_accountDetails)
+            # skip accounts completed in a previous run of a resumed crawl
+            accountID = parse_qs(urlparse(url).query).get("accountID", [None])[0]
+            if accountID is not None and self.is_completed("account", accountID):
+                continue
+            # in delta mode, skip accounts unchanged since the previous crawl
+            if self.delta_index is not None and accountID is not None:
+                overview = {
+                    h: " ".join(td.css("::text").getall())
+                    for h, td in zip(headers, r.css("td"))
+                }
+                if not self.delta_index.is_changed(accountID, overview):
+                    yield from self.carry_forward_account(response, accountID)
+                    continue
+                self.crawler.stats.inc_value("delta/accounts_followed")
+            yield response.follow(
+                url,
+                callback=self.parse_accountDetails,
+                dont_filter=self.is_recovering,
+                priority=self.priority_account,
+            )
 
-        # navigate to next page of account overview
-        next_page = (
-            "https://ec.europa.eu/clima/ets/account.do?languageCode=en&accountHolder=&searchType=account&currentSortSettings=&resultList.currentPageNumber=%d&nextList=Next>"
-            % self.next_page_number
+    def carry_forward_account(self, response, accountID):
+        """Take unchanged account from previous data and refresh its
+        installation if it has an open compliance year
+        :param response: <scrapy.http.Response> of the overview page
+        :param accountID: <string> account identifier
+        """
+        self.carried_accounts.add(accountID)
+        self.crawler.stats.inc_value("delta/accounts_carried")
+        account = self.delta_index.accounts[accountID]
+        installationID = self.delta_index.get_installation_id(account)
+        if installationID is None:
+            return
+        if not self.delta_index.is_open(installationID):
+            self.carried_installations.add(installationID)
+            return
+        self.crawler.stats.inc_value("delta/installations_refreshed")
+        yield from self.request_installation(
+            response,
+            account["installationURL"],
+            accountID,
+            account["registryCode"],
+            installationID,
         )
-        if self.next_page_number <= self.max_pages:
-            self.next_page_number += 1
-            if self.next_page_number % 100 == 0:
-                print(
-                    "Process account overview page %d of %d"
-                    % (self.next_page_number, self.max_pages)
-                )
-            yield response.follow(next_page, callback=self.parse)
+
+    def get_carried_items(self):
+        """Items of unchanged accounts and installations carried forward
+        from the previous crawl in delta mode
+        :return: <generator> of items
+        """
+        if self.delta_index is None:
+            return
+        installations = self.carried_installations - self.parsed_installations
+        carried = [
+            ("accounts.csv", AccountItem, "accountID", self.carried_accounts),
+            ("contacts.csv", ContactItem, "accountID", self.carried_accounts),
+            ("installations.csv", InstallationItem, "installationID", installations),
+            ("compliance.csv", ComplianceItem, "installationID", installations),
+            (
+                "surrendering.csv",
+                SurrenderingDetailsItem,
+                "installationID",
+                installations,
+            ),
+        ]
+        for name, item_class, key, keys in carried:
+            for row in self.delta_index.iter_rows(name, key, keys):
+                yield get_typed_item(item_class, row)
 
     def parse_accountDetails(self, response):
-        # # determine correct field for company registration and commitment period field
-        # td_commitmentPeriod = 8
-        # td_companyRegistration = 9
-        # for i, f in enumerate(
-        #     response.css(
-        #         "table#tblAccountGeneralInfo>tr:nth-child(2)>td>span.titlelist::text"
-        #     ).getall()
-        # ):
-        #     if f.strip() == "Company Registration No":
-        #         td_companyRegistration = i + 1
-        #     elif f.strip() == "Commitment Period":
-        #         td_commitmentPeriod = i + 1
+        root = response.selector.root
+        accountID = (get_first(INPUT_VALUE, root, name="accountID") or "").strip()
+        if self.is_completed("account", accountID):
+            return
+        registryCode = get_strings(INPUT_VALUE, root, name="registryCode")
+
+        # locate account tables once
+        general = TableGrid.by_id(root, "tblAccountGeneralInfo")
+        contact = TableGrid.by_id(root, "tblAccountContactInfo")
 
         # get table headers
-        headers = list(
-            map(
-                lambda x: x.strip(),
-                response.css(
-                    "table#tblAccountGeneralInfo>tr:nth-child(2)>td>span.titlelist::text"
-                ).getall(),
-            )
-        )
+        headers = [
+            t.strip() for c in general.get_row(2) for t in get_strings(TITLELIST, c)
+        ]
 
         map_headers = {
             "Account Type": "accountType",
@@ -82,69 +219,20 @@ class AccountSpider(scrapy.Spider):
             "Authorised trading venue or central counterparty": "authorizedTradingVenue",
         }
         # parse account details
-        l = ItemLoader(item=AccountItem(), response=response)
+        l = ItemLoader(
+            item=AccountItem(), selector=response.selector, response=response
+        )
         l.add_value("accountURL", response.url)
-        l.add_css("accountID", "input[name='accountID']::attr(value)")
-        l.add_css("accountName", "font.bordertbheadfont::text")
-        l.add_css("registryCode", "input[name='registryCode']::attr(value)")
+        l.add_value("accountID", accountID)
+        l.add_value("accountName", get_strings(FONT_HEAD_TEXT, root))
+        l.add_value("registryCode", registryCode)
         for i, h in enumerate(headers):
             item_name = map_headers[h]
             if item_name == "installationID":
-                l.add_css(
-                    item_name,
-                    f"table#tblAccountGeneralInfo>tr:nth-child({i+1})>td:nth-child(3)>a>span::text",
-                )
-                l.add_css(
-                    "installationURL",
-                    f"table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child({i+1})>a::attr(href)",
-                )
+                l.add_value(item_name, general.get_texts(3, i + 1, LINK_SPAN_TEXT))
+                l.add_value("installationURL", general.get_texts(3, i + 1, LINK_HREF))
             else:
-                l.add_css(
-                    item_name,
-                    f"table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child({i+1})>span.classictext::text",
-                )
-        # l.add_css(
-        #     "accountType",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(1)>span.classictext::text",
-        # )
-        # l.add_css(
-        #     "registry",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(2)>span.classictext::text",
-        # )
-        # l.add_css(
-        #     "installationID",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(3)>a>span::text",
-        # )
-        # l.add_css(
-        #     "installationURL",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(3)>a::attr(href)",
-        # )
-        # l.add_css(
-        #     "accountHolderName",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(4)>span.classictext::text",
-        # )
-        # l.add_css(
-        #     "status",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(5)>span.classictext::text",
-        # )
-        # l.add_css(
-        #     "openingDate",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(6)>span.classictext::text",
-        # )
-        # l.add_css(
-        #     "closingDate",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(7)>span.classictext::text",
-        # )
-        # l.add_css(
-        #     "commitmentPeriod",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(%d)>span.classictext::text"
-        #     % td_commitmentPeriod,
-        # )
-        # l.add_css(
-        #     "companyRegistrationNumber",
-        #     "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(%d)>span.classictext::text"
-        #     % td_companyRegistration,
-        # )
+                l.add_value(item_name, general.get_texts(3, i + 1))
         yield l.load_item()
 
         # parse contact details
@@ -162,62 +250,228 @@ class AccountSpider(scrapy.Spider):
             "telephone2",
             "eMail",
         ]
-        l = ItemLoader(item=ContactItem(), response=response)
+        l = ItemLoader(
+            item=ContactItem(), selector=response.selector, response=response
+        )
         l.add_value("accountURL", response.url)
-        l.add_css("accountID", "input[name='accountID']::attr(value)")
+        l.add_value("accountID", accountID)
         for i, c in enumerate(columns[1:]):
-            l.add_css(
-                c,
-                "table#tblAccountContactInfo>tr:nth-child(3)>td:nth-child(%d)>span.classictext::text"
-                % (i + 1),
-            )
+            l.add_value(c, contact.get_texts(3, i + 1))
         yield l.load_item()
 
         # in case of operator account, parse installation information
-        installationURL = response.css(
-            "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(3)>a::attr(href)"
-        ).get()
+        installationURL = get_first(LINK_HREF, general.get_cell(3, 3))
 
-        if installationURL:
+        if not installationURL:
+            self.mark_completed("account", accountID)
+        else:
             installationURL = response.urljoin(installationURL.strip())
-            accountID = (
-                response.css("input[name='accountID']::attr(value)").get().strip()
+            registryCode = registryCode[0].strip()
+            installationID = get_first(LINK_SPAN_TEXT, general.get_cell(3, 3)).strip()
+            installationID = registryCode + "_" + installationID
+            # the account is completed once its installation has been parsed
+            yield from self.request_installation(
+                response, installationURL, accountID, registryCode, installationID
             )
-            registryCode = (
-                response.css("input[name='registryCode']::attr(value)").get().strip()
+
+    def request_installation(
+        self, response, url, accountID, registryCode, installationID
+    ):
+        """Request the installation of an account or take it from the cache
+        :param response: <scrapy.http.Response> of the page linking the installation
+        :param url: <string> url of the installation page
+        :param accountID: <string> account identifier
+        :param registryCode: <string> registry of the account
+        :param installationID: <string> installation identifier with registry code
+        :return: <generator> of requests and items
+        """
+        request = response.follow(
+            url,
+            callback=self.parse_installation,
+            errback=self.installation_failed,
+            dont_filter=self.is_recovering,
+            priority=self.priority_installation,
+            meta={
+                "accountID": accountID,
+                "registryCode": registryCode,
+                "installationID": installationID,
+            },
+        )
+        if self.installation_cache is None:
+            yield request
+            return
+        if installationID in self.installation_cache:
+            self.installation_cache.move_to_end(installationID)
+            self.crawler.stats.inc_value("installation_cache/hits")
+            yield from self.get_cached_installation(installationID, request)
+            return
+        pending = self.installations_pending.get(installationID)
+        if pending is not None:
+            # wait for the pages requested for another account
+            pending["waiting"].append(request)
+            self.crawler.stats.inc_value("installation_cache/waits")
+            return
+        self.installations_pending[installationID] = {
+            "accountID": accountID,
+            "items": [],
+            "open": 1,  # number of pages being downloaded
+            "failed": False,
+            "waiting": [],  # requests of other accounts linking the installation
+        }
+        yield request
+
+    def get_pending_installation(self, response):
+        """Pending installation the page has been requested for
+        :param response: <scrapy.http.Response> of an installation or surrender page
+        :return: <dict> or None if the page is not cached
+        """
+        if self.installations_pending is None:
+            return None
+        pending = self.installations_pending.get(response.meta.get("installationID"))
+        if pending is None or pending["accountID"] != response.meta.get("accountID"):
+            return None
+        return pending
+
+    def collect_installation_pages(self, response, results):
+        """Add items to the pending installation of the page and count
+        requests for further pages
+        :param response: <scrapy.http.Response> of an installation or surrender page
+        :param results: <iterable> of items and requests of the page
+        :return: <generator> of items and requests
+        """
+        pending = self.get_pending_installation(response)
+        for x in results:
+            if pending is not None:
+                if isinstance(x, scrapy.Request):
+                    pending["open"] += 1
+                else:
+                    pending["items"].append(x)
+            yield x
+        if pending is not None:
+            yield from self.release_installation_page(
+                response.meta.get("installationID")
             )
-            installationID = (
-                response.css(
-                    "table#tblAccountGeneralInfo>tr:nth-child(3)>td:nth-child(3)>a>span::text"
-                )
-                .get()
-                .strip()
+
+    def release_installation_page(self, installationID):
+        """Mark one page of a pending installation as processed. Once all
+        pages are processed, the installation is cached and the accounts
+        waiting for it get its items.
+        :param installationID: <string> installation identifier with registry code
+        :return: <generator> of items and requests
+        """
+        pending = self.installations_pending[installationID]
+        pending["open"] -= 1
+        if pending["open"] > 0:
+            return
+        del self.installations_pending[installationID]
+        if pending["failed"]:
+            # accounts waiting for the installation download it themselves
+            self.crawler.stats.inc_value(
+                "installation_cache/fallbacks", len(pending["waiting"])
             )
-            installationID = registryCode + "_" + installationID
-            yield response.follow(
-                installationURL,
-                callback=self.parse_installation,
-                meta={
-                    "accountID": accountID,
-                    "registryCode": registryCode,
-                    "installationID": installationID,
-                },
+            yield from pending["waiting"]
+            return
+        self.installation_cache[installationID] = pending["items"]
+        if len(self.installation_cache) > self.installation_cache_size:
+            self.installation_cache.popitem(last=False)
+        for request in pending["waiting"]:
+            yield from self.get_cached_installation(installationID, request)
+
+    def get_cached_installation(self, installationID, request):
+        """Items of a cached installation for another account
+        :param installationID: <string> installation identifier with registry code
+        :param request: <scrapy.Request> request of the installation page of the account
+        :return: <generator> of items
+        """
+        accountID = request.meta["accountID"]
+        for item in self.installation_cache[installationID]:
+            item = item.copy()
+            for field in item:
+                if field == "accountID":
+                    item[field] = accountID
+                elif field == "installationURL":
+                    item[field] = request.url
+                elif field.endswith("URL") and item[field]:
+                    item[field] = re.sub(
+                        r"(?<=[?&]accountID=)[^&]*", accountID, item[field]
+                    )
+            yield item
+        if self.delta_index is not None:
+            self.parsed_installations.add(installationID)
+        self.mark_completed("installation", request.url)
+        self.mark_completed("account", accountID)
+
+    def installation_failed(self, failure):
+        if failure.check(RetryDelayed):
+            # the request is retried later
+            return
+        installationID = failure.request.meta.get("installationID")
+        pending = self.installations_pending and self.installations_pending.get(
+            installationID
+        )
+        if pending and pending["accountID"] == failure.request.meta.get("accountID"):
+            pending["failed"] = True
+            yield from self.release_installation_page(installationID)
+
+    def has_pending_work(self):
+        """Check whether overview pages are held back or accounts wait for
+        installations being downloaded for other accounts
+        :return: <boolean>
+        """
+        return super().has_pending_work() or bool(self.installations_pending)
+
+    def release_pending_installations(self, spider):
+        """Let accounts download installations of pending installations that
+        did not complete, e.g., because a page was dropped"""
+        if not self.installations_pending:
+            return
+        for pending in self.installations_pending.values():
+            self.crawler.stats.inc_value(
+                "installation_cache/fallbacks", len(pending["waiting"])
             )
+            for request in pending["waiting"]:
+                self.crawler.engine.crawl(request)
+        self.installations_pending.clear()
+        raise DontCloseSpider
 
     def parse_installation(self, response):
-        # determine whether it is an aircraft or maritime account
-        isAircraft = (
-            "Aircraft" in response.css("span.bordertbheadfont::text").get().strip()
-        )
-        isMaritime = (
-            "Maritime" in response.css("span.bordertbheadfont::text").get().strip()
+        if self.delta_index is not None:
+            self.parsed_installations.add(response.meta.get("installationID"))
+        # installations are linked from all their (former) operator accounts
+        # and parsed for each account, so completion is recorded per page
+        if self.is_completed("installation", response.url):
+            self.mark_completed("account", response.meta.get("accountID"))
+            pending = self.get_pending_installation(response)
+            if pending is not None:
+                pending["failed"] = True
+                yield from self.release_installation_page(
+                    response.meta.get("installationID")
+                )
+            return
+        yield from self.collect_installation_pages(
+            response, self.extract_installation(response)
         )
 
+    def extract_installation(self, response):
+        root = response.selector.root
+
+        # determine whether it is an aircraft or maritime account
+        title = get_first(SPAN_HEAD_TEXT, root).strip()
+        isAircraft = "Aircraft" in title
+        isMaritime = "Maritime" in title
+
         # get tables with installation details
-        tables = response.css("table#tblChildDetails")
+        # first table nests the details and the address table,
+        # second table nests the compliance tables
+        tables = [TableGrid(t) for t in TABLES_BY_ID(root, id="tblChildDetails")]
+        details, address = (
+            tables[0].get_nested(["tr", "td", "table"]) + [TableGrid(None)] * 2
+        )[:2]
 
         # Installation details: general
-        l = ItemLoader(item=InstallationItem(), selector=tables[0], response=response)
+        l = ItemLoader(
+            item=InstallationItem(), selector=response.selector, response=response
+        )
         l.add_value("installationURL", response.url)
         l.add_value(
             "installationID", response.meta.get("installationID")
@@ -265,11 +519,7 @@ class AccountSpider(scrapy.Spider):
                 "lastYearOfEmissions",
             ]
         for i, c in enumerate(cols[1:]):
-            l.add_css(
-                c,
-                "tr>td>table:nth-child(1)>tr:nth-child(3)>td:nth-child(%i)>span.classictext::text"
-                % (i + 2),
-            )
+            l.add_value(c, details.get_texts(3, i + 2))
 
         # Installation details: address
         if isMaritime:
@@ -294,70 +544,68 @@ class AccountSpider(scrapy.Spider):
                 "activity",
             ]
         for i, c in enumerate(cols):
-            l.add_css(
-                c,
-                "tr>td>table:nth-child(2)>tr:nth-child(3)>td:nth-child(%i)>span.classictext::text"
-                % (i + 1),
-            )
+            l.add_value(c, address.get_texts(3, i + 1))
         yield l.load_item()
 
         # Compliance information
         # need to take care of possible compliance over CHETS
         # thus, there might be two compliance tables for aircrafts
-        complianceTables = tables[1].css("tr>td>div>table")
+        complianceTables = tables[1].get_nested(["tr", "td", "div", "table"])
         etsSystems = ["EUETS", "CHETS"]
+        # column of each compliance field
+        # compliance code is parsed into code and update flag
+        cols = {
+            "verified": 4,
+            "surrendered": 5,
+            "surrenderedCumulative": 6,
+            "verifiedCumulative": 7,
+            "complianceCode": 8,
+            "complianceCodeUpdated": 8,
+        }
+        n_surrender = 0
         for i, table in enumerate(complianceTables):
-            rows = table.css("tr")
-            for row in rows[2:]:
+            for row in range(3, len(table.rows) + 1):
                 try:
-                    year = (
-                        row.css("td:nth-child(2)>span.classictext::text").get().strip()
-                    )
-                    year = int(year)
+                    year = int(table.get_texts(row, 2)[0].strip())
                 except:
                     continue
-                l = ItemLoader(item=ComplianceItem(), selector=row, response=response)
+                l = ItemLoader(
+                    item=ComplianceItem(), selector=response.selector, response=response
+                )
                 l.add_value("installationID", response.meta.get("installationID"))
                 l.add_value("installationURL", response.url)
                 l.add_value("reportedInSystem", etsSystems[i])
-                l.add_css("phase", "td:nth-child(1)>span.classictext::text")
-                l.add_css("year", "td:nth-child(2)>span.classictext::text")
+                l.add_value("phase", table.get_texts(row, 1))
+                l.add_value("year", table.get_texts(row, 2))
                 # extract the different allocation values
-                for td in row.css("td:nth-child(3)>span.classictext"):
-                    stars = td.css("sup::text").get()
+                for td in CLASSICTEXT_SPANS(table.get_cell(row, 3)):
+                    stars = get_first(SUP_TEXT, td)
                     if stars == "****":
-                        l.add_value("allocation10c", td.css("::text").get().strip())
+                        l.add_value("allocation10c", get_first(ALL_TEXT, td).strip())
                     elif stars == "*****":
                         l.add_value(
-                            "allocationNewEntrance", td.css("::text").get().strip()
+                            "allocationNewEntrance", get_first(ALL_TEXT, td).strip()
                         )
                     else:
-                        l.add_value("allocationFree", td.css("::text").get())
-                l.add_css("verified", "td:nth-child(4)>span.classictext::text")
-                l.add_css("surrendered", "td:nth-child(5)>span.classictext::text")
-                l.add_css(
-                    "surrenderedCumulative", "td:nth-child(6)>span.classictext::text"
-                )
-                l.add_css(
-                    "verifiedCumulative", "td:nth-child(7)>span.classictext::text"
-                )
-                l.add_css("complianceCode", "td:nth-child(8)>span.classictext::text")
-                l.add_css(
-                    "complianceCodeUpdated", "td:nth-child(8)>span.classictext::text"
-                )
+                        l.add_value("allocationFree", get_first(ALL_TEXT, td))
+                for c, col in cols.items():
+                    l.add_value(c, table.get_texts(row, col))
                 yield l.load_item()
 
             # Extract surrendering details but not for the CH table (links to same information)
             if i > 0:
                 continue
-            links = table.css("a.listlink")
-            for link in links:
-                text = link.css("span::text").get().strip()
+            for link in LISTLINKS(table.table):
+                text = get_first(SPAN_TEXT, link).strip()
                 if text.startswith("Details on Surrendered Units"):
-                    url = response.urljoin(link.attrib["href"])
+                    url = response.urljoin(link.get("href"))
+                    n_surrender += 1
                     yield response.follow(
                         url,
                         callback=self.parse_surrendered_details,
+                        errback=self.installation_failed,
+                        priority=self.priority_surrender,
+                        dont_filter=self.is_recovering,
                         meta={
                             "accountID": response.meta.get("accountID"),
                             "registryCode": response.meta.get("registryCode"),
@@ -367,7 +615,34 @@ class AccountSpider(scrapy.Spider):
                         },
                     )
 
+        if n_surrender > 0:
+            self.surrenders_open[response.url] = n_surrender
+        else:
+            self.mark_completed("installation", response.url)
+            self.mark_completed("account", response.meta.get("accountID"))
+
     def parse_surrendered_details(self, response):
+        yield from self.collect_installation_pages(
+            response, self.extract_surrendered_details(response)
+        )
+        self.release_surrender_page(response)
+
+    def release_surrender_page(self, response):
+        """Mark one surrender page of an installation page as parsed. Once all
+        are parsed, the installation and its account are completed.
+        :param response: <scrapy.http.Response> of the surrender page
+        """
+        installationURL = response.meta.get("installationURL")
+        if installationURL not in self.surrenders_open:
+            return
+        self.surrenders_open[installationURL] -= 1
+        if self.surrenders_open[installationURL] > 0:
+            return
+        del self.surrenders_open[installationURL]
+        self.mark_completed("installation", installationURL)
+        self.mark_completed("account", response.meta.get("accountID"))
+
+    def extract_surrendered_details(self, response):
         rows = response.css("table#tblChildDetails>tr>td>table>tr>td>div>table>tr")
         cols = [
             "originatingRegistry",
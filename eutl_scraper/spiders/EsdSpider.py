@@ -1,4 +1,3 @@
-import scrapy
 from scrapy.loader import ItemLoader
 from eutl_scraper.items import (
     EsdTransactionItem,
@@ -6,19 +5,18 @@ from eutl_scraper.items import (
     EsdTransactionBlockItem,
 )
 import urllib.parse
-import sys
 
 from eutl_scraper.items.esdItems import EsdComplianceItem, EsdEntitlementItem
+from ._paginated import PaginatedSpider
+from ._extraction import TableExtractor, CLASSICTEXT_FONT
 
 
-class EsdTransactionSpider(scrapy.Spider):
+class EsdTransactionSpider(PaginatedSpider):
     name = "esd_transactions"
-    next_page_number = 1  # zero indexed
-    max_pages = None
-    accountIdentifiersMapped = []
     # 30000
     start_urls = []
     url_transaction_overview = "https://ec.europa.eu/clima/ets/esdTransactions.do"
+    slice_tables = ["tblTransactionSearchResult", "tblTransactionBlocksInformation"]
     params_transaction_search = {}
 
     def __init__(self, start_date="", end_date="", **kwargs):
@@ -57,18 +55,12 @@ class EsdTransactionSpider(scrapy.Spider):
         ]
         super().__init__(**kwargs)  # python3
 
-    def parse(self, response):
-        # update maximum number of pages (corrected for 0 indexing)
-        if not self.max_pages:
-            self.max_pages = (
-                int(
-                    response.css("input[name='resultList.lastPageNumber']").attrib[
-                        "value"
-                    ]
-                )
-                - 1
-            )
+    def get_page_url(self, page_number):
+        params = dict(self.params_transaction_search)
+        params["resultList.currentPageNumber"] = page_number
+        return f"{self.url_transaction_overview}?{urllib.parse.urlencode(params)}"
 
+    def parse_overview(self, response):
         # get table with transaction overview and process each row
         rows = response.css("table#tblTransactionSearchResult>tr")
         cols = [
@@ -90,43 +82,38 @@ class EsdTransactionSpider(scrapy.Spider):
             l = ItemLoader(item=EsdTransactionItem(), selector=row, response=response)
             for i, c in enumerate(cols):
                 l.add_css(c, f"td:nth-child({i+1})>span.classictext::text")
-                transactionID = (
-                    row.css("td:nth-child(1)>span.classictext::text").get().strip()
-                )
-                transactionType = (
-                    row.css("td:nth-child(2)>span.classictext::text").get().strip()
-                )
-                transactionDate = (
-                    row.css("td:nth-child(3)>span.classictext::text").get().strip()
-                )
-                # extraction of link to transaction blocks and parse page
-                url = response.urljoin(row.css("a.listlink::attr(href)").get())
-                yield response.follow(
-                    url,
-                    callback=self.parse_transaction_blocks,
-                    meta={
-                        "transactionID": transactionID,
-                        "transactionDate": transactionDate,
-                        "transactionType": transactionType,
-                        "transactionURL": url,
-                        "isFirstPage": True,
-                    },
-                )
+            transactionID = (
+                row.css("td:nth-child(1)>span.classictext::text").get().strip()
+            )
+            transactionType = (
+                row.css("td:nth-child(2)>span.classictext::text").get().strip()
+            )
+            transactionDate = (
+                row.css("td:nth-child(3)>span.classictext::text").get().strip()
+            )
+            # extraction of link to transaction blocks and parse page
+            # one request per transaction, previously one per column
+            url = response.urljoin(row.css("a.listlink::attr(href)").get())
+            self.inc_stats("esd_transactions/block_requests")
+            yield response.follow(
+                url,
+                callback=self.parse_transaction_blocks,
+                meta={
+                    "transactionID": transactionID,
+                    "transactionDate": transactionDate,
+                    "transactionType": transactionType,
+                    "transactionURL": url,
+                    "isFirstPage": True,
+                },
+            )
             yield l.load_item()
 
-        # navigate to next page of transaction overview
-        self.params_transaction_search["resultList.currentPageNumber"] = (
-            self.next_page_number
-        )
-        next_page = f"{self.url_transaction_overview}?{urllib.parse.urlencode(self.params_transaction_search)}"
-        if self.next_page_number <= self.max_pages:
-            self.next_page_number += 1
-            if (self.next_page_number - 1) % 100 == 0:
-                print(
-                    "Process transaction overview %d of %d"
-                    % (self.next_page_number, self.max_pages)
-                )
-            yield response.follow(next_page, callback=self.parse)
+    def get_request_stats(self, request):
+        # first pages of transaction blocks as requested per overview row
+        if request.callback == self.parse_transaction_blocks and request.meta.get(
+            "isFirstPage", True
+        ):
+            return "esd_transactions/block_requests"
 
     def parse_transaction_blocks(self, response):
         isFirstPage = response.meta.get("isFirstPage", True)
@@ -183,98 +170,85 @@ class EsdTransactionSpider(scrapy.Spider):
                     )
 
 
-class EsdAllocationSpider(scrapy.Spider):
+class EsdAllocationSpider(PaginatedSpider):
     name = "esd_allocations"
-    next_page_number = 1  # zero indexed
-    max_pages = None
     base_url = "https://ec.europa.eu/clima/ets/esdAllocations.do"
-    params_search = {
-        "languageCode": "en",
-        "esdRegistry": -1,
-        "esdYear": "",
-        "search": "Search",
-        "currentSortSettings": "",
-        "resultList.currentPageNumber": 0,
-        "nextList": "Next>",
-    }
-
-    start_urls = [f"{base_url}?{urllib.parse.urlencode(params_search)}"]
 
     def __init__(self, **kwargs):
+        # search parameters are set per instance such that spiders can run
+        # side by side in one process (see eutl_scraper.runner)
+        self.params_search = {
+            "languageCode": "en",
+            "esdRegistry": -1,
+            "esdYear": "",
+            "search": "Search",
+            "currentSortSettings": "",
+            "resultList.currentPageNumber": 0,
+            "nextList": "Next>",
+        }
+        self.start_urls = [
+            f"{self.base_url}?{urllib.parse.urlencode(self.params_search)}"
+        ]
         super().__init__(**kwargs)
 
-    def parse(self, response):
-        if not self.max_pages:
-            self.max_pages = (
-                int(
-                    response.css("input[name='resultList.lastPageNumber']").attrib[
-                        "value"
-                    ]
-                )
-                - 1
-            )
-
-        cols = [
+    def get_page_url(self, page_number):
+        params = dict(self.params_search)
+        params.pop("search", None)
+        params["resultList.currentPageNumber"] = page_number
+        return f"{self.base_url}?{urllib.parse.urlencode(params)}"
+
+    # result table is extracted in one pass
+    extractor = TableExtractor(
+        EsdAllocationItem,
+        "tblAllocations",
+        [
             "memberState",
             "year",
             "accountStatus",
             "accountIdentifier",
             "allocated",
-        ]
+        ],
+        text=CLASSICTEXT_FONT,
+    )
+
+    slice_tables = [extractor.table_id]
+
+    def parse_overview(self, response):
+        yield from self.extractor.extract(response)
 
-        rows = response.css("table#tblAllocations>tr")
-        for row in rows[2:]:
-            l = ItemLoader(item=EsdAllocationItem(), selector=row, response=response)
-            for i, c in enumerate(cols):
-                l.add_css(c, f"td:nth-child({i+1})>font.classictext::text")
-            yield l.load_item()
 
-        # navigate to next page of transaction overview
-        self.params_search.pop("search", None)
-        self.params_search["resultList.currentPageNumber"] = self.next_page_number
-        next_page = f"{self.base_url}?{urllib.parse.urlencode(self.params_search)}"
-        if self.next_page_number <= self.max_pages:
-            self.next_page_number += 1
-            if (self.next_page_number - 1) % 100 == 0:
-                print(
-                    "Process transaction overview %d of %d"
-                    % (self.next_page_number, self.max_pages)
-                )
-            yield response.follow(next_page, callback=self.parse)
-
-
-class EsdComplianceSpider(scrapy.Spider):
+class EsdComplianceSpider(PaginatedSpider):
     name = "esd_compliance"
-    next_page_number = 1  # zero indexed
-    max_pages = None
     base_url = "https://ec.europa.eu/clima/ets/transactionsCompliance.do"
-    params_search = {
-        "languageCode": "en",
-        "esdRegistry": -1,
-        "esdYear": "",
-        "search": "Search",
-        "currentSortSettings": "",
-        "resultList.currentPageNumber": 0,
-        "nextList": "Next>",
-    }
-
-    start_urls = [f"{base_url}?{urllib.parse.urlencode(params_search)}"]
 
     def __init__(self, **kwargs):
+        # search parameters are set per instance such that spiders can run
+        # side by side in one process (see eutl_scraper.runner)
+        self.params_search = {
+            "languageCode": "en",
+            "esdRegistry": -1,
+            "esdYear": "",
+            "search": "Search",
+            "currentSortSettings": "",
+            "resultList.currentPageNumber": 0,
+            "nextList": "Next>",
+        }
+        self.start_urls = [
+            f"{self.base_url}?{urllib.parse.urlencode(self.params_search)}"
+        ]
         super().__init__(**kwargs)
 
-    def parse(self, response):
-        if not self.max_pages:
-            self.max_pages = (
-                int(
-                    response.css("input[name='resultList.lastPageNumber']").attrib[
-                        "value"
-                    ]
-                )
-                - 1
-            )
-
-        cols = [
+    def get_page_url(self, page_number):
+        params = dict(self.params_search)
+        params.pop("search", None)
+        params["resultList.currentPageNumber"] = page_number
+        return f"{self.base_url}?{urllib.parse.urlencode(params)}"
+
+    # result table is extracted in one pass
+    extractor = TableExtractor(
+        EsdComplianceItem,
+        "tblComplianceDashboard",
+        [
             "memberState",
             "year",
             "accountStatus",
@@ -286,68 +260,55 @@ class EsdComplianceSpider(scrapy.Spider):
             "surrenderedCredits",
             "balance",
             "compliance",
-        ]
+        ],
+        text=CLASSICTEXT_FONT,
+    )
 
-        rows = response.css("table#tblComplianceDashboard>tr")
-        for row in rows[2:]:
-            l = ItemLoader(item=EsdComplianceItem(), selector=row, response=response)
-            for i, c in enumerate(cols):
-                l.add_css(c, f"td:nth-child({i+1})>font.classictext::text")
-            yield l.load_item()
+    slice_tables = [extractor.table_id]
 
-        # navigate to next page of transaction overview
-        self.params_search.pop("search", None)
-        self.params_search["resultList.currentPageNumber"] = self.next_page_number
-        next_page = f"{self.base_url}?{urllib.parse.urlencode(self.params_search)}"
-        if self.next_page_number <= self.max_pages:
-            self.next_page_number += 1
-            if (self.next_page_number - 1) % 100 == 0:
-                print(
-                    "Process transaction overview %d of %d"
-                    % (self.next_page_number, self.max_pages)
-                )
-            yield response.follow(next_page, callback=self.parse)
-
-
-class EsdEntitlementSpider(scrapy.Spider):
+    def parse_overview(self, response):
+        yield from self.extractor.extract(response)
+
+
+class EsdEntitlementSpider(PaginatedSpider):
     name = "esd_entitlement"
-    next_page_number = 1  # zero indexed
-    max_pages = None
     base_url = "https://ec.europa.eu/clima/ets/transactionsEntitlements.do"
-    params_search = {
-        "languageCode": "en",
-        "startDate": "",
-        "endDate": "",
-        "transactionStatusCode": 4,
-        "transactionId": "",
-        "suppTransactionTypeCode": -1,
-        "transferringEsdRegistryCode": -1,
-        "acquiringEsdRegistryCode": -1,
-        "transferringEsdYear": "",
-        "acquiringEsdYear": "",
-        "search": "Search",
-        "currentSortSettings": "",
-        "resultList.currentPageNumber": 0,
-        "nextList": "Next>",
-    }
-
-    start_urls = [f"{base_url}?{urllib.parse.urlencode(params_search)}"]
 
     def __init__(self, **kwargs):
+        # search parameters are set per instance such that spiders can run
+        # side by side in one process (see eutl_scraper.runner)
+        self.params_search = {
+            "languageCode": "en",
+            "startDate": "",
+            "endDate": "",
+            "transactionStatusCode": 4,
+            "transactionId": "",
+            "suppTransactionTypeCode": -1,
+            "transferringEsdRegistryCode": -1,
+            "acquiringEsdRegistryCode": -1,
+            "transferringEsdYear": "",
+            "acquiringEsdYear": "",
+            "search": "Search",
+            "currentSortSettings": "",
+            "resultList.currentPageNumber": 0,
+            "nextList": "Next>",
+        }
+        self.start_urls = [
+            f"{self.base_url}?{urllib.parse.urlencode(self.params_search)}"
+        ]
         super().__init__(**kwargs)
 
-    def parse(self, response):
-        if not self.max_pages:
-            self.max_pages = (
-                int(
-                    response.css("input[name='resultList.lastPageNumber']").attrib[
-                        "value"
-                    ]
-                )
-                - 1
-            )
-
-        cols = [
+    def get_page_url(self, page_number):
+        params = dict(self.params_search)
+        params.pop("search", None)
+        params["resultList.currentPageNumber"] = page_number
+        return f"{self.base_url}?{urllib.parse.urlencode(params)}"
+
+    # result table is extracted in one pass
+    extractor = TableExtractor(
+        EsdEntitlementItem,
+        "tblEsdTransactions",
+        [
             "transactionID",
             "transactionType",
             "transactionDate",
@@ -357,24 +318,11 @@ class EsdEntitlementSpider(scrapy.Spider):
             "acquiringYear",
             "transactionStatus",
             "amount",
-        ]
+        ],
+        text=CLASSICTEXT_FONT,
+    )
 
-        rows = response.css("table#tblEsdTransactions>tr")
-        for row in rows[2:]:
-            l = ItemLoader(item=EsdEntitlementItem(), selector=row, response=response)
-            for i, c in enumerate(cols):
-                l.add_css(c, f"td:nth-child({i+1})>font.classictext::text")
-            yield l.load_item()
+    slice_tables = [extractor.table_id]
 
-        # navigate to next page of transaction overview
-        self.params_search.pop("search", None)
-        self.params_search["resultList.currentPageNumber"] = self.next_page_number
-        next_page = f"{self.base_url}?{urllib.parse.urlencode(self.params_search)}"
-        if self.next_page_number <= self.max_pages:
-            self.next_page_number += 1
-            if (self.next_page_number - 1) % 100 == 0:
-                print(
-                    "Process transaction overview %d of %d"
-                    % (self.next_page_number, self.max_pages)
-                )
-            yield response.follow(next_page, callback=self.parse)
+    def parse_overview(self, response):
+        yield from self.extractor.extract(response)
@@ -1,19 +1,20 @@
-import scrapy
 from scrapy.loader import ItemLoader
 from eutl_scraper.items import TransactionItem, TransactionBlockItem, AccountIDMapItem
 import urllib.parse
 import csv, os
-import sys
+from eutl_scraper.own_settings import DIR_STATE
+from eutl_scraper.middlewares import RetryDelayed
+from eutl_scraper.state import AccountIdCache
+from ._paginated import PaginatedSpider
 
 
-class TransactionSpider(scrapy.Spider):
+class TransactionSpider(PaginatedSpider):
     name = "transactions"
-    next_page_number = 1  # zero indexed
-    max_pages = None
-    accountIdentifiersMapped = []
+    account_ids = None  # AccountIdCache mapping account identifiers to account IDs
     # 30000
     start_urls = []
     url_transaction_overview = "https://ec.europa.eu/clima/ets/transaction.do"
+    slice_tables = ["tblTransactionSearchResult", "tblTransactionBlocksInformation"]
     params_transaction_search = {}
 
     def __init__(
@@ -25,6 +26,7 @@ class TransactionSpider(scrapy.Spider):
         :param end_date: <str> end date for transaction search
                             has to be string of format "dd/mm/yyyy"
         :param fn_accountIdentifiers: <str> file name of already existing account identifiers
+                            (csv with columns accountIdentifier and accountID)
         """
         self.params_transaction_search = {
             "languageCode": "en",
@@ -52,31 +54,39 @@ class TransactionSpider(scrapy.Spider):
             f"{self.url_transaction_overview}?{urllib.parse.urlencode(self.params_transaction_search)}"
         ]
 
-        # update the list of already existing account identifiers
-        # no longer maintained but left for illustrations
-        if False:
-            if fn_accountIdentifiers is not None and os.path.isfile(
-                fn_accountIdentifiers
-            ):
-                with open(fn_accountIdentifiers, mode="r") as csv_file:
-                    csv_reader = csv.DictReader(csv_file)
-                    for row in csv_reader:
-                        self.accountIdentifiersMapped.append(row["accountIdentifier"])
+        self.fn_accountIdentifiers = fn_accountIdentifiers
         super().__init__(**kwargs)  # python3
 
-    def parse(self, response):
-        # update maximum number of pages (corrected for 0 indexing)
-        if not self.max_pages:
-            self.max_pages = (
-                int(
-                    response.css("input[name='resultList.lastPageNumber']").attrib[
-                        "value"
-                    ]
-                )
-                - 1
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # accounts linked in transactions are mapped to their account ID
+        # accounts mapped in previous runs are not looked up again
+        if crawler.settings.getbool("ACCOUNT_ID_MAP_ENABLED"):
+            fn = crawler.settings.get("ACCOUNT_ID_MAP_FILE") or os.path.join(
+                DIR_STATE, "accountIdMap.db"
             )
-            # self.max_pages = 0
+            os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+            spider.account_ids = AccountIdCache(fn)
+            # update the map with already existing account identifiers
+            if spider.fn_accountIdentifiers is not None and os.path.isfile(
+                spider.fn_accountIdentifiers
+            ):
+                with open(spider.fn_accountIdentifiers, mode="r") as csv_file:
+                    csv_reader = csv.DictReader(csv_file)
+                    spider.account_ids.load(
+                        (row["accountIdentifier"], row["accountID"])
+                        for row in csv_reader
+                        if row.get("accountID")
+                    )
+        return spider
 
+    def get_page_url(self, page_number):
+        params = dict(self.params_transaction_search)
+        params["resultList.currentPageNumber"] = page_number
+        return f"{self.url_transaction_overview}?{urllib.parse.urlencode(params)}"
+
+    def parse_overview(self, response):
         # get table with transaction overview and process each row
         rows = response.css("table#tblTransactionSearchResult>tr")
         cols = [
@@ -99,51 +109,45 @@ class TransactionSpider(scrapy.Spider):
         for row in rows[2:]:
             l = ItemLoader(item=TransactionItem(), selector=row, response=response)
             for i, c in enumerate(cols):
-                transactionID = (
-                    row.css("td:nth-child(1)>span.classictext::text").get().strip()
-                )
-                transactionDate = (
-                    row.css("td:nth-child(3)>span.classictext::text").get().strip()
-                )
-                transactionType = (
-                    row.css("td:nth-child(2)>span.classictext::text").get().strip()
-                )
-                transferringRegistry = (
-                    row.css("td:nth-child(5)>span.classictext::text").get().strip()
-                )
-                acquiringRegistry = (
-                    row.css("td:nth-child(10)>span.classictext::text").get().strip()
-                )
                 l.add_css(c, f"td:nth-child({i+1})>span.classictext::text")
-                # extraction of link to transaction blocks and parse page
-                url = response.urljoin(row.css("a.listlink::attr(href)").get())
-                yield response.follow(
-                    url,
-                    callback=self.parse_transaction_blocks,
-                    meta={
-                        "transactionID": transactionID,
-                        "transactionDate": transactionDate,
-                        "transactionType": transactionType,
-                        "transferringRegistry": transferringRegistry,
-                        "acquiringRegistry": acquiringRegistry,
-                    },
-                )
+            transactionID = (
+                row.css("td:nth-child(1)>span.classictext::text").get().strip()
+            )
+            transactionDate = (
+                row.css("td:nth-child(3)>span.classictext::text").get().strip()
+            )
+            transactionType = (
+                row.css("td:nth-child(2)>span.classictext::text").get().strip()
+            )
+            transferringRegistry = (
+                row.css("td:nth-child(5)>span.classictext::text").get().strip()
+            )
+            acquiringRegistry = (
+                row.css("td:nth-child(10)>span.classictext::text").get().strip()
+            )
+            # extraction of link to transaction blocks and parse page
+            # one request per transaction, previously one per column
+            url = response.urljoin(row.css("a.listlink::attr(href)").get())
+            self.inc_stats("transactions/block_requests")
+            yield response.follow(
+                url,
+                callback=self.parse_transaction_blocks,
+                meta={
+                    "transactionID": transactionID,
+                    "transactionDate": transactionDate,
+                    "transactionType": transactionType,
+                    "transferringRegistry": transferringRegistry,
+                    "acquiringRegistry": acquiringRegistry,
+                },
+            )
             yield l.load_item()
 
-        # navigate to next page of transaction overview
-        self.params_transaction_search["resultList.currentPageNumber"] = (
-            self.next_page_number
-        )
-        next_page = f"{self.url_transaction_overview}?{urllib.parse.urlencode(self.params_transaction_search)}"
-        # "https://ec.europa.eu/clima/ets/transaction.do?languageCode=en&startDate=&endDate=&transactionStatus=4&fromCompletionDate=&toCompletionDate=&transactionID=&transactionType=-1&suppTransactionType=-1&originatingRegistry=-1&destinationRegistry=-1&originatingAccountType=-1&destinationAccountType=-1&originatingAccountIdentifier=&destinationAccountIdentifier=&originatingAccountHolder=&destinationAccountHolder=&currentSortSettings=&resultList.currentPageNumber=%d&nextList=Next>" % self.next_page_number
-        if self.next_page_number <= self.max_pages:
-            self.next_page_number += 1
-            if (self.next_page_number - 1) % 100 == 0:
-                print(
-                    "Process transaction overview %d of %d"
-                    % (self.next_page_number, self.max_pages)
-                )
-            yield response.follow(next_page, callback=self.parse)
+    def get_request_stats(self, request):
+        # first pages of transaction blocks as requested per overview row
+        if request.callback == self.parse_transaction_blocks and request.meta.get(
+            "isFirstPage", True
+        ):
+            return "transactions/block_requests"
 
     def parse_transaction_blocks(self, response):
         block_number = response.meta.get("block_number", 0)
@@ -186,22 +190,7 @@ class TransactionSpider(scrapy.Spider):
                 "td:nth-child(6)>span.classictext::text",
             )
             l.add_value("transferringRegistry", response.meta["transferringRegistry"])
-            # for the moment deactivate creation of account mapping here.
-            # will be added as routine after table creation
-            if False:
-                url = row.css("td:nth-child(5)>a.resultlink::attr(href)").get()
-                if url:
-                    url = response.urljoin(url)
-                    idx = (
-                        row.css("td:nth-child(6)>span.classictext::text").get().strip()
-                    )
-                    if idx not in self.accountIdentifiersMapped:
-                        self.accountIdentifiersMapped.append(idx)
-                        yield response.follow(
-                            url,
-                            callback=self.get_account_id_map,
-                            meta={"accountIdentifier": idx},
-                        )
+            yield from self.request_account_id(response, row, 5)
             # link and name to acquiring account
             # link and name to transferring account
             # we need to check whether it is a link or not
@@ -221,22 +210,7 @@ class TransactionSpider(scrapy.Spider):
                 "acquiringAccountIdentifier", "td:nth-child(8)>span.classictext::text"
             )
             l.add_value("acquiringRegistry", response.meta["acquiringRegistry"])
-            # for the moment deactivate creation of account mapping here.
-            # will be added as routine after table creation
-            if False:
-                url = row.css("td:nth-child(7)>a.resultlink::attr(href)").get()
-                if url:
-                    url = response.urljoin(url)
-                    idx = (
-                        row.css("td:nth-child(8)>span.classictext::text").get().strip()
-                    )
-                    if idx not in self.accountIdentifiersMapped:
-                        self.accountIdentifiersMapped.append(idx)
-                        yield response.follow(
-                            url,
-                            callback=self.get_account_id_map,
-                            meta={"accountIdentifier": idx},
-                        )
+            yield from self.request_account_id(response, row, 7)
             l.add_css("lulucfActivity", "td:nth-child(9)>span.classictext::text")
             l.add_css("projectID", "td:nth-child(10)>span.classictext::text")
             l.add_css("projectTrack", "td:nth-child(11)>span.classictext::text")
@@ -269,6 +243,31 @@ class TransactionSpider(scrapy.Spider):
                         },
                     )
 
+    def request_account_id(self, response, row, col):
+        """Request the account page of an account linked in a transaction block
+        unless its account ID is known or being looked up
+        :param response: <scrapy.http.Response> of the transaction block page
+        :param row: <scrapy.Selector> of the table row
+        :param col: <int> column with the account link, followed by the identifier
+        """
+        if self.account_ids is None:
+            return
+        url = row.css(f"td:nth-child({col})>a.resultlink::attr(href)").get()
+        idx = row.css(f"td:nth-child({col + 1})>span.classictext::text").get()
+        if not url or not idx:
+            return
+        idx = idx.strip()
+        if self.account_ids.should_request(idx):
+            self.inc_stats("account_ids/requested")
+            yield response.follow(
+                response.urljoin(url),
+                callback=self.get_account_id_map,
+                errback=self.account_id_failed,
+                meta={"accountIdentifier": idx},
+            )
+        else:
+            self.inc_stats("account_ids/known")
+
     def get_account_id_map(self, response):
         l = ItemLoader(AccountIDMapItem(), response=response)
         l.add_value("accountIdentifier", response.meta.get("accountIdentifier"))
@@ -276,6 +275,33 @@ class TransactionSpider(scrapy.Spider):
         # if accountID create the map. if not remove from list and try again later
         if accountID:
             l.add_value("accountID", accountID.strip())
+            if self.account_ids is not None:
+                self.account_ids.resolve(
+                    response.meta.get("accountIdentifier"), accountID.strip()
+                )
             yield l.load_item()
-        else:
-            self.accountIdentifiersMapped.remove(response.meta.get("accountIdentifier"))
+        elif self.account_ids is not None:
+            self.account_ids.release(response.meta.get("accountIdentifier"))
+
+    def account_id_failed(self, failure):
+        if failure.check(RetryDelayed):
+            # the request is retried later
+            return
+        self.account_ids.release(failure.request.meta.get("accountIdentifier"))
+
+    def get_carried_items(self):
+        """Account ID map of accounts resolved in previous runs such that the
+        output contains the complete map
+        :return: <generator> of items
+        """
+        # appended output, e.g., of a replay of failed requests, already
+        # holds the map of previous runs
+        if self.account_ids is None or self.append_output:
+            return
+        for identifier, accountID in self.account_ids.previous.items():
+            yield AccountIDMapItem(accountIdentifier=identifier, accountID=accountID)
+
+    def closed(self, reason):
+        super().closed(reason)
+        if self.account_ids is not None:
+            self.account_ids.close()
@@ -0,0 +1,212 @@
+from itemloaders.common import wrap_loader_context
+from itemloaders.processors import Identity, MapCompose, TakeFirst
+from lxml.etree import XPath
+from eutl_scraper.items._utils import strip_values
+
+
+def has_class(name):
+    """XPath condition equivalent to the css class selector ".name"
+    :param name: <string> class name
+    :return: <string>
+    """
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+
+# XPath expressions compiled once and evaluated on the lxml tree of a response
+INPUT_VALUE = XPath("//input[@name=$name]/@value")
+TABLES_BY_ID = XPath("//table[@id=$id]")
+FONT_HEAD_TEXT = XPath("//font[%s]/text()" % has_class("bordertbheadfont"))
+SPAN_HEAD_TEXT = XPath("//span[%s]/text()" % has_class("bordertbheadfont"))
+CLASSICTEXT_SPANS = XPath("./span[%s]" % has_class("classictext"))
+CLASSICTEXT = XPath("./span[%s]/text()" % has_class("classictext"))
+CLASSICTEXT_FONT = XPath("./font[%s]/text()" % has_class("classictext"))
+TITLELIST = XPath("./span[%s]/text()" % has_class("titlelist"))
+LINK_HREF = XPath("./a/@href")
+LINK_SPAN_TEXT = XPath("./a/span/text()")
+LISTLINKS = XPath(".//a[%s]" % has_class("listlink"))
+SPAN_TEXT = XPath("descendant-or-self::span/text()")
+SUP_TEXT = XPath(".//sup/text()")
+ALL_TEXT = XPath("descendant-or-self::text()")
+
+
+def get_strings(xpath, element, **kwargs):
+    """Evaluate compiled XPath returning strings
+    :param xpath: <lxml.etree.XPath> compiled expression
+    :param element: <lxml.etree.Element> context element, None gives no result
+    :return: <list> of strings
+    """
+    if element is None:
+        return []
+    return [str(x) for x in xpath(element, **kwargs)]
+
+
+def get_first(xpath, element, **kwargs):
+    """First string result of compiled XPath
+    :return: <string> or None if there is no result
+    """
+    result = get_strings(xpath, element, **kwargs)
+    return result[0] if result else None
+
+
+def get_children(element, tag):
+    """Child elements as counted by the css selector :nth-child
+    :param element: <lxml.etree.Element> parent element
+    :param tag: <string> tag of children to keep, others are set to None
+    :return: <list> of child elements
+    """
+    return [c if c.tag == tag else None for c in element if isinstance(c.tag, str)]
+
+
+class TableGrid:
+    """Rows and cells of a table located in a single pass.
+
+    Cells are addressed like "tr:nth-child(row)>td:nth-child(col)", i.e.,
+    with one based positions among the element children of table and row.
+    """
+
+    def __init__(self, table):
+        """
+        :param table: <lxml.etree.Element> table element or None for an empty grid
+        """
+        self.table = table
+        self.rows = []
+        if table is None:
+            return
+        for row in get_children(table, "tr"):
+            self.rows.append([] if row is None else get_children(row, "td"))
+
+    @classmethod
+    def by_id(cls, root, id):
+        """Grid of the first table with given id
+        :param root: <lxml.etree.Element> document root, e.g., response.selector.root
+        :param id: <string> id of the table
+        :return: <TableGrid>
+        """
+        tables = TABLES_BY_ID(root, id=id)
+        return cls(tables[0] if tables else None)
+
+    def get_row(self, row):
+        """Cells of a row
+        :param row: <int> one based row position
+        :return: <list> of cell elements
+        """
+        if row > len(self.rows):
+            return []
+        return self.rows[row - 1]
+
+    def get_cell(self, row, col):
+        """Cell element
+        :param row: <int> one based row position
+        :param col: <int> one based column position
+        :return: <lxml.etree.Element> or None if there is no such cell
+        """
+        cells = self.get_row(row)
+        if col > len(cells):
+            return None
+        return cells[col - 1]
+
+    def get_texts(self, row, col, xpath=CLASSICTEXT):
+        """Texts of a cell, by default of its span.classictext children
+        :param row: <int> one based row position
+        :param col: <int> one based column position
+        :param xpath: <lxml.etree.XPath> compiled expression relative to the cell
+        :return: <list> of strings
+        """
+        return get_strings(xpath, self.get_cell(row, col))
+
+    def get_nested(self, path):
+        """Grids of tables nested in the first cell of the table reached by
+        following child tags, e.g., ["tr", "td", "div", "table"]
+        :param path: <list> of tags of child elements
+        :return: <list> of TableGrid
+        """
+        elements = [] if self.table is None else [self.table]
+        for tag in path:
+            elements = [c for e in elements for c in e if c.tag == tag]
+        return [TableGrid(e) for e in elements]
+
+
+def is_plain_field(field):
+    """Check whether a field only strips its value and takes the first one
+    :param field: <scrapy.Field> field definition of an item
+    :return: <boolean>
+    """
+    proc_in = field.get("input_processor")
+    proc_out = field.get("output_processor")
+    return (
+        isinstance(proc_in, MapCompose)
+        and proc_in.functions == (strip_values,)
+        and isinstance(proc_out, TakeFirst)
+    )
+
+
+def take_first_stripped(values):
+    """Equivalent of MapCompose(strip_values) followed by TakeFirst()
+    :param values: <list> of strings
+    :return: <string> first non-empty stripped value or None
+    """
+    for x in values:
+        x = x.strip()
+        if x:
+            return x
+    return None
+
+
+class TableExtractor:
+    """Extracts one item per row of a purely tabular page.
+
+    The table is read into column arrays in one pass. Fields that only strip
+    their value are set directly, the item loader processors of all other
+    fields are applied to the cell texts.
+    """
+
+    def __init__(self, item_class, table_id, cols, text=CLASSICTEXT, first_row=3):
+        """
+        :param item_class: <scrapy.Item> class of the extracted items
+        :param table_id: <string> id of the table
+        :param cols: <list> of item fields in column order
+        :param text: <lxml.etree.XPath> compiled expression for the texts of a cell
+        :param first_row: <int> one based position of the first row with data
+        """
+        self.item_class = item_class
+        self.table_id = table_id
+        self.cols = cols
+        self.text = text
+        self.first_row = first_row
+        self.plain = [is_plain_field(item_class.fields[c]) for c in cols]
+
+    def get_columns(self, grid):
+        """Texts of all data cells by column
+        :param grid: <TableGrid> of the table
+        :return: <list> of columns, each a list with the texts of each row's cell
+        """
+        rows = grid.rows[self.first_row - 1 :]
+        return [
+            [get_strings(self.text, r[i] if i < len(r) else None) for r in rows]
+            for i in range(len(self.cols))
+        ]
+
+    def extract(self, response):
+        """Items of all data rows
+        :param response: <scrapy.http.Response> of the page
+        :return: <generator> of items
+        """
+        grid = TableGrid.by_id(response.selector.root, self.table_id)
+        columns = self.get_columns(grid)
+        context = {"response": response}
+        for n in range(len(grid.rows[self.first_row - 1 :])):
+            item = self.item_class()
+            for c, plain, column in zip(self.cols, self.plain, columns):
+                if plain:
+                    value = take_first_stripped(column[n])
+                else:
+                    field = self.item_class.fields[c]
+                    proc_in = field.get("input_processor", Identity())
+                    proc_out = field.get("output_processor", Identity())
+                    proc_in = wrap_loader_context(proc_in, context)
+                    # like ItemLoader, fields without input values are not set
+                    values = proc_in(column[n])
+                    value = proc_out(values) if values else None
+                if value is not None:
+                    item[c] = value
+            yield item
@@ -0,0 +1,236 @@
+import os
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from eutl_scraper.state import CrawlLedger
+
+
+class PaginatedSpider(scrapy.Spider):
+    """Base class for spiders crawling the paginated EUTL result lists.
+
+    The first overview page provides the number of the last result page. All
+    remaining overview pages are requested at once and processed under the
+    configured concurrency instead of following the "Next" link page by page.
+
+    Subclasses implement:
+        get_page_url(page_number): url of a (zero indexed) overview page
+        parse_overview(response): items and requests from one overview page
+
+    If the crawl runs with a job directory (-s JOBDIR=<dir>), scrapy persists
+    the pending requests and completed work is recorded in a ledger in that
+    directory. A restarted crawl then skips completed work and appends to the
+    existing output.
+
+    With OVERVIEW_MAX_BACKLOG, further overview pages are only requested
+    while fewer requests wait in the scheduler. Detail requests yielded by
+    overview pages should get a higher priority such that they are finished
+    before new overview pages are processed.
+    """
+
+    max_pages = None  # zero indexed number of the last overview page
+    ledger = None  # record of completed work, only used with a job directory
+    append_output = False  # append items to existing output files
+    max_backlog = None  # maximal number of waiting requests to request overview pages
+    pending_pages = None  # iterator of overview pages not yet requested
+    slice_tables = None  # ids of the tables read by callbacks, see TableSliceMiddleware
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        jobdir = crawler.settings.get("JOBDIR")
+        if jobdir:
+            os.makedirs(jobdir, exist_ok=True)
+            spider.ledger = CrawlLedger(os.path.join(jobdir, "ledger.db"))
+            spider.append_output = spider.ledger.is_resumed
+        spider.max_backlog = crawler.settings.getint("OVERVIEW_MAX_BACKLOG", 0) or None
+        if spider.max_backlog is not None:
+            crawler.signals.connect(
+                spider.top_up_overview_pages, signal=signals.response_received
+            )
+            crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        # requests counted by the spider are also counted once they reach the
+        # scheduler, i.e., without those dropped by middlewares
+        crawler.signals.connect(
+            spider.count_scheduled_request, signal=signals.request_scheduled
+        )
+        crawler.signals.connect(
+            spider.count_dropped_request, signal=signals.request_dropped
+        )
+        return spider
+
+    @property
+    def is_recovering(self):
+        """True if the previous run of a resumed crawl was not shut down
+        cleanly. Its request queue is lost, so uncompleted work is requested
+        again bypassing the duplicate filter."""
+        return self.ledger is not None and self.ledger.was_interrupted
+
+    def is_completed(self, kind, key):
+        """Check whether work has been completed in a previous run
+        :param kind: <string> kind of work, e.g., "page"
+        :param key: identifier of work
+        :return: <boolean>
+        """
+        return self.ledger is not None and self.ledger.is_completed(kind, key)
+
+    def mark_completed(self, kind, key):
+        """Record work as completed
+        :param kind: <string> kind of work, e.g., "page"
+        :param key: identifier of work
+        """
+        if self.ledger is not None:
+            self.ledger.mark_completed(kind, key)
+
+    def inc_stats(self, key, count=1):
+        """Increase crawl stats, ignored if the spider does not run in a crawl
+        :param key: <string> name of the stats value
+        :param count: <int> increment
+        """
+        crawler = getattr(self, "crawler", None)
+        if crawler is not None and crawler.stats is not None:
+            crawler.stats.inc_value(key, count)
+
+    def get_request_stats(self, request):
+        """Name of the stats counting requests of a kind, e.g., requests of
+        transaction blocks, overwrite in spiders counting requests
+        :param request: <scrapy.Request>
+        :return: <string> name of the stats value, None if not counted
+        """
+        return None
+
+    def count_scheduled_request(self, request, spider):
+        """Count request passed to the scheduler (request_scheduled signal)
+        :param request: <scrapy.Request>
+        :param spider: <scrapy.Spider>
+        """
+        key = self.get_request_stats(request) if spider is self else None
+        if key is not None:
+            self.inc_stats(key + "_scheduled")
+
+    def count_dropped_request(self, request, spider):
+        """Count request rejected by the scheduler, e.g., as duplicate
+        (request_dropped signal)
+        :param request: <scrapy.Request>
+        :param spider: <scrapy.Spider>
+        """
+        key = self.get_request_stats(request) if spider is self else None
+        if key is not None:
+            self.inc_stats(key + "_dropped")
+
+    def closed(self, reason):
+        if self.ledger is not None:
+            self.ledger.close()
+
+    def get_page_url(self, page_number):
+        """Url of the overview page
+        :param page_number: <int> zero indexed number of overview page
+        :return: <str> url of the overview page
+        """
+        raise NotImplementedError
+
+    def parse_overview(self, response):
+        """Parse the content of one overview page
+        :param response: <scrapy.http.Response> of the overview page
+        """
+        raise NotImplementedError
+
+    def get_max_pages(self, response):
+        """Extract the number of the last overview page (corrected for 0 indexing)
+        :param response: <scrapy.http.Response> of the first overview page
+        :return: <int> zero indexed number of last page
+        """
+        last_page = response.css("input[name='resultList.lastPageNumber']")
+        if not last_page:
+            return 0
+        return int(last_page.attrib["value"]) - 1
+
+    def get_overview_request(self, page_number):
+        """Request of an overview page
+        :param page_number: <int> zero indexed number of overview page
+        :return: <scrapy.Request>
+        """
+        return scrapy.Request(
+            self.get_page_url(page_number),
+            callback=self.parse,
+            cb_kwargs={"page_number": page_number},
+            dont_filter=self.is_recovering,
+        )
+
+    def request_overview_pages(self, response):
+        """Request all remaining overview pages, or as many as the backlog
+        allows if the crawl runs with OVERVIEW_MAX_BACKLOG
+        :param response: <scrapy.http.Response> of the first overview page
+        """
+        # after an interruption all pages are parsed again to recover
+        # requests for uncompleted detail pages
+        self.pending_pages = (
+            page_number
+            for page_number in range(1, self.max_pages + 1)
+            if not self.is_completed("page", page_number) or self.is_recovering
+        )
+        yield from self.next_overview_pages()
+
+    def get_backlog(self):
+        """Number of requests waiting in the scheduler
+        :return: <int> or None if the spider does not run in a crawl
+        """
+        engine = getattr(getattr(self, "crawler", None), "engine", None)
+        if engine is None or engine.slot is None:
+            return None
+        return len(engine.slot.scheduler)
+
+    def next_overview_pages(self):
+        """Requests of further overview pages as allowed by the backlog
+        :return: <generator> of requests
+        """
+        backlog = self.get_backlog()
+        if self.max_backlog is None or backlog is None:
+            n = None
+        else:
+            n = self.max_backlog - backlog
+        while n is None or n > 0:
+            # pages may have been exhausted by a top-up while this generator
+            # was suspended
+            if self.pending_pages is None:
+                return
+            page_number = next(self.pending_pages, None)
+            if page_number is None:
+                self.pending_pages = None
+                return
+            yield self.get_overview_request(page_number)
+            if n is not None:
+                n -= 1
+
+    def top_up_overview_pages(self, *args, **kwargs):
+        """Schedule further overview pages once the backlog has gone down"""
+        for request in self.next_overview_pages():
+            self.crawler.engine.crawl(request)
+
+    def has_pending_work(self):
+        """Check whether the spider still holds back requests, e.g., overview
+        pages not yet requested because of the backlog
+        :return: <boolean>
+        """
+        return self.pending_pages is not None
+
+    def spider_idle(self, spider):
+        if spider is self and self.pending_pages is not None:
+            self.top_up_overview_pages()
+            raise DontCloseSpider
+
+    def parse(self, response, page_number=0):
+        # first overview page: get number of pages and request all remaining pages
+        # other pages replayed from the failure ledger are parsed on their own
+        if self.max_pages is None and page_number == 0:
+            self.max_pages = self.get_max_pages(response)
+            yield from self.request_overview_pages(response)
+
+        if self.is_completed("page", page_number) and not self.is_recovering:
+            return
+        if page_number % 100 == 0 and self.max_pages is not None:
+            print(
+                "Process %s overview page %d of %d"
+                % (self.name, page_number, self.max_pages)
+            )
+        yield from self.parse_overview(response)
+        self.mark_completed("page", page_number)
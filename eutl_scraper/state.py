@@ -0,0 +1,285 @@
+import json
+import sqlite3
+from datetime import datetime
+
+
+class CrawlLedger:
+    """Persistent record of completed crawl work.
+
+    Completed work is stored as (kind, key) pairs, e.g., ("account", "90574"),
+    in a sqlite database so that a restarted crawl can skip it. The ledger
+    also records whether the previous run was shut down cleanly. If not, the
+    request queue persisted by scrapy is incomplete and uncompleted work has
+    to be requested again.
+    New entries are only written to disk by commit(). The item pipeline
+    commits the ledger after it has written the scraped items to disk, such
+    that work is not recorded as completed before its data is saved.
+    """
+
+    def __init__(self, fn):
+        """
+        :param fn: <string> path to sqlite database
+        """
+        self.conn = sqlite3.connect(fn)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS completed "
+            "(kind TEXT, key TEXT, PRIMARY KEY (kind, key))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, clean INTEGER)"
+        )
+        last_run = self.conn.execute(
+            "SELECT clean FROM runs ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        self.is_resumed = last_run is not None
+        self.was_interrupted = last_run is not None and not last_run[0]
+        self.run_id = self.conn.execute("INSERT INTO runs (clean) VALUES (0)").lastrowid
+        self.conn.commit()
+
+        # keep completed keys in memory for fast lookups
+        self.completed = {}
+        for kind, key in self.conn.execute("SELECT kind, key FROM completed"):
+            self.completed.setdefault(kind, set()).add(key)
+
+    def is_completed(self, kind, key):
+        """Check whether work has been completed
+        :param kind: <string> kind of work, e.g., "account"
+        :param key: identifier of work
+        :return: <boolean>
+        """
+        return str(key) in self.completed.get(kind, ())
+
+    def mark_completed(self, kind, key):
+        """Record work as completed
+        :param kind: <string> kind of work, e.g., "account"
+        :param key: identifier of work
+        """
+        key = str(key)
+        keys = self.completed.setdefault(kind, set())
+        if key in keys:
+            return
+        keys.add(key)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO completed (kind, key) VALUES (?, ?)", (kind, key)
+        )
+
+    def commit(self):
+        """Write new entries to disk"""
+        self.conn.commit()
+
+    def close(self):
+        """Commit all entries and mark the run as cleanly shut down"""
+        self.conn.execute("UPDATE runs SET clean = 1 WHERE id = ?", (self.run_id,))
+        self.conn.commit()
+        self.conn.close()
+
+
+class AccountIdCache:
+    """Persistent map of account identifiers to account IDs.
+
+    Transactions refer to accounts by their identifier (e.g., "EU-100-5001234-0-0")
+    while the account data use the account ID of the EUTL. Resolved pairs are
+    kept in a dictionary and stored in a sqlite database such that accounts
+    are only looked up once across runs. Identifiers being looked up are kept
+    in a set so that concurrent transactions do not request them again.
+    The database is shared by parallel crawls (e.g., of date windows), so
+    every change is committed immediately to not hold its write lock.
+    """
+
+    def __init__(self, fn):
+        """
+        :param fn: <string> path to sqlite database
+        """
+        self.conn = sqlite3.connect(fn, timeout=30)
+        # readers and the writer of parallel crawls do not block each other
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS account_ids "
+            "(accountIdentifier TEXT PRIMARY KEY, accountID TEXT)"
+        )
+        self.conn.commit()
+        self.previous = dict(
+            self.conn.execute("SELECT accountIdentifier, accountID FROM account_ids")
+        )  # pairs resolved in previous runs
+        self.resolved = dict(self.previous)
+        self.pending = set()
+
+    def __len__(self):
+        return len(self.resolved)
+
+    def get(self, identifier):
+        """Account ID of an account identifier
+        :param identifier: <string> account identifier
+        :return: <string> or None if not resolved
+        """
+        return self.resolved.get(identifier)
+
+    def should_request(self, identifier):
+        """Check whether an account has to be looked up and mark it as being
+        looked up
+        :param identifier: <string> account identifier
+        :return: <boolean> True if neither resolved nor being looked up
+        """
+        if identifier in self.resolved or identifier in self.pending:
+            return False
+        self.pending.add(identifier)
+        return True
+
+    def resolve(self, identifier, accountID):
+        """Store the account ID of an account identifier
+        :param identifier: <string> account identifier
+        :param accountID: <string> account ID
+        """
+        self.pending.discard(identifier)
+        self.resolved[identifier] = accountID
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO account_ids (accountIdentifier, accountID) "
+                "VALUES (?, ?)",
+                (identifier, accountID),
+            )
+
+    def load(self, pairs):
+        """Add pairs resolved elsewhere, e.g., an existing account map
+        :param pairs: <iterable> of (account identifier, account ID)
+        """
+        new = {}
+        for identifier, accountID in pairs:
+            if self.resolved.get(identifier) != accountID:
+                new[identifier] = accountID
+            self.previous[identifier] = accountID
+        self.resolved.update(new)
+        # in one short transaction
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO account_ids (accountIdentifier, accountID) "
+                "VALUES (?, ?)",
+                new.items(),
+            )
+
+    def release(self, identifier):
+        """Account could not be resolved, allow to look it up again
+        :param identifier: <string> account identifier
+        """
+        self.pending.discard(identifier)
+
+    def close(self):
+        self.conn.close()
+
+
+class FailureLedger:
+    """Persistent record of requests that failed after all retries.
+
+    Failed requests are stored per spider with url, callback, errback, meta,
+    and cb_kwargs in a sqlite database such that they can be requested again
+    in a later run without crawling everything again. Entries are removed once
+    a request succeeds. Failures are rare, so every change is committed
+    immediately.
+    """
+
+    def __init__(self, fn):
+        """
+        :param fn: <string> path to sqlite database
+        """
+        self.conn = sqlite3.connect(fn, timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures "
+            "(spider TEXT, url TEXT, callback TEXT, errback TEXT, meta TEXT, "
+            "cb_kwargs TEXT, priority INTEGER, reason TEXT, attempts INTEGER, "
+            "failed_at TEXT, PRIMARY KEY (spider, url, callback))"
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM failures").fetchone()[0]
+
+    def record(
+        self,
+        spider,
+        url,
+        callback,
+        reason,
+        errback=None,
+        meta=None,
+        cb_kwargs=None,
+        priority=0,
+    ):
+        """Record a failed request, the number of attempts of a request that
+        failed before is increased
+        :param spider: <string> name of the spider, e.g., "accounts"
+        :param url: <string> url of the request
+        :param callback: <string> name of the spider callback
+        :param reason: <string> reason of the failure
+        :param errback: <string> name of the spider errback or None
+        :param meta: <dict> json serializable meta data of the request
+        :param cb_kwargs: <dict> json serializable callback arguments
+        :param priority: <int> priority of the request
+        """
+        self.conn.execute(
+            "INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT (spider, url, callback) DO UPDATE SET "
+            "reason = excluded.reason, attempts = attempts + 1, "
+            "failed_at = excluded.failed_at",
+            (
+                spider,
+                url,
+                callback,
+                errback,
+                json.dumps(meta or {}),
+                json.dumps(cb_kwargs or {}),
+                priority,
+                reason,
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+        self.conn.commit()
+
+    def resolve(self, spider, url, callback):
+        """Remove a request that succeeded
+        :param spider: <string> name of the spider
+        :param url: <string> url of the request
+        :param callback: <string> name of the spider callback
+        :return: <boolean> True if the request was recorded as failed
+        """
+        cursor = self.conn.execute(
+            "DELETE FROM failures WHERE spider = ? AND url = ? AND callback = ?",
+            (spider, url, callback),
+        )
+        self.conn.commit()
+        return cursor.rowcount > 0
+
+    def get_failures(self, spider):
+        """Failed requests of a spider
+        :param spider: <string> name of the spider
+        :return: <list> of dicts with url, callback, errback, meta, cb_kwargs,
+                    priority, reason, and attempts
+        """
+        rows = self.conn.execute(
+            "SELECT url, callback, errback, meta, cb_kwargs, priority, reason, "
+            "attempts FROM failures WHERE spider = ? ORDER BY failed_at",
+            (spider,),
+        )
+        return [
+            {
+                "url": url,
+                "callback": callback,
+                "errback": errback,
+                "meta": json.loads(meta),
+                "cb_kwargs": json.loads(cb_kwargs),
+                "priority": priority,
+                "reason": reason,
+                "attempts": attempts,
+            }
+            for url, callback, errback, meta, cb_kwargs, priority, reason, attempts in rows
+        ]
+
+    def get_spiders(self):
+        """Names of spiders with failed requests
+        :return: <list> of strings
+        """
+        return [x[0] for x in self.conn.execute("SELECT DISTINCT spider FROM failures")]
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -1,9 +1,13 @@
+import os
 import requests
 import time
 import pandas as pd
 import re
+from urllib.parse import urlencode
 from zipfile import ZipFile
 from .mappings import map_unitType_inv, map_registryCode_inv
+from .own_settings import DIR_STATE
+from .state import FailureLedger
 
 
 def parse_ec_transactions(
@@ -122,9 +126,20 @@ def parse_ec_transactions(
     return df
 
 
-def link_accounts(dir_in, df=None, tries=3, wait=5, use_existing=False):
+def link_accounts(
+    dir_in,
+    df=None,
+    tries=3,
+    wait=5,
+    use_existing=False,
+    sweep_wait=60,
+    fn_failures=None,
+):
     """Linking of account identifiers used in the transaction data and
        those used in the account database
+       Accounts that fail to link are tried again once all other accounts are
+       linked. Accounts still failing are recorded in the failure ledger and
+       are linked again by the next run with use_existing=True.
     :param dir_in: <string> path to input data directory with data scraped
     :param df: <pd.DataFrame> with transaction data. If provided, data will not
                 be loaded from file
@@ -133,6 +148,10 @@ def link_accounts(dir_in, df=None, tries=3, wait=5, use_existing=False):
     :param use_existing: <bool> if True
         Existing account mapping is used and only missing account identifiers
         are linked
+    :param sweep_wait: <int> number of seconds to wait before failed accounts
+        are tried again, None to not try them again
+    :param fn_failures: <string> path to failure ledger, defaults to failures.db
+        in DIR_STATE
     """
     fn_mapping = dir_in + "account_mapping.csv"
     dir_out = dir_in + "transactionBlocks.csv"
@@ -189,29 +208,69 @@ def link_accounts(dir_in, df=None, tries=3, wait=5, use_existing=False):
             not in x
         )
 
-    # loop over all accountIdentifier and extract associated accountID
-    res = {}
-
-    for i, accIdentifierDB in enumerate(acc_id_db):
-        if i % 100 == 0:
-            print(
-                "Link accountIdentifier %s (%d/%d)"
-                % (accIdentifierDB, i, len(acc_id_db))
-            )
-        # prepare query getting data from accountIdentifier
+    def get_query(accIdentifierDB):
+        """Query of the account page of an account identifier
+        :param accIdentifierDB: <string> account identifier
+        """
         query = dict(base_qry)
         query["registryCode"] = accIdentifierDB.split("_")[0]
         query["accountIdentifier"] = str(accIdentifierDB.split("_")[-1])
-        # download page
-        content = download_file(
-            base_url, parms=query, tries=tries, wait=wait, test_success=is_success
-        )
+        return query
+
+    def link(identifiers):
+        """Extract the accountID of account identifiers
+        :param identifiers: <list> of account identifiers
+        :return: <list> of account identifiers that failed to link
+        """
+        failed = []
+        for i, accIdentifierDB in enumerate(identifiers):
+            if i % 100 == 0:
+                print(
+                    "Link accountIdentifier %s (%d/%d)"
+                    % (accIdentifierDB, i, len(identifiers))
+                )
+            # download page
+            content = download_file(
+                base_url,
+                parms=get_query(accIdentifierDB),
+                tries=tries,
+                wait=wait,
+                test_success=is_success,
+            )
+
+            accountID = get_linked_accountID(content)
+            if accountID is not None:
+                res[accIdentifierDB] = accountID
+            else:
+                failed.append(accIdentifierDB)
+        return failed
 
-        accountID = get_linked_accountID(content)
-        if accountID is not None:
-            res[accIdentifierDB] = accountID
-        else:
-            print("\tFailed to link transaction account: %s" % accIdentifierDB)
+    # loop over all accountIdentifier and extract associated accountID
+    res = {}
+    failed = link(acc_id_db)
+    if failed and sweep_wait is not None:
+        # try failed accounts again after the load of the server has dropped
+        print("Link %d failed accounts again in %d seconds" % (len(failed), sweep_wait))
+        time.sleep(sweep_wait)
+        failed = link(failed)
+
+    # record failed accounts in the failure ledger
+    fn_failures = fn_failures or os.path.join(DIR_STATE, "failures.db")
+    os.makedirs(os.path.dirname(os.path.abspath(fn_failures)), exist_ok=True)
+    ledger = FailureLedger(fn_failures)
+    for failure in ledger.get_failures("link_accounts"):
+        if failure["meta"].get("accountIdentifierDB") in res:
+            ledger.resolve("link_accounts", failure["url"], failure["callback"])
+    for accIdentifierDB in failed:
+        print("\tFailed to link transaction account: %s" % accIdentifierDB)
+        ledger.record(
+            "link_accounts",
+            base_url + urlencode(get_query(accIdentifierDB)),
+            "get_linked_accountID",
+            "account page without accountID",
+            meta={"accountIdentifierDB": accIdentifierDB},
+        )
+    ledger.close()
 
     # for security save the account mapping
     df_map = pd.DataFrame(
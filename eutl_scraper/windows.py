@@ -0,0 +1,220 @@
+import csv
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from eutl_scraper.hashset import HashSet64, get_hash64
+from eutl_scraper.own_settings import DIR_PARSED
+from eutl_scraper.pipelines import EutlScraperPipeline
+from eutl_scraper.shards import get_run_id, record_sources
+
+# files written by the spiders that can be crawled in date windows
+WINDOW_OUTPUTS = {
+    "transactions": ["transactions.csv", "transactionBlocks.csv", "accountIdMap.csv"],
+    "esd_transactions": ["esdTransactions.csv", "esdTransactionBlocks.csv"],
+}
+# columns identifying duplicated rows, all columns if not given
+# each window writes the complete account ID map known when it started
+WINDOW_OUTPUT_KEYS = {"accountIdMap.csv": ["accountIdentifier"]}
+DATE_FORMAT = "%d/%m/%Y"  # date format of the transaction search
+
+
+def get_date_windows(start_date, end_date, window_days=365):
+    """Split date range into consecutive, non-overlapping windows
+    :param start_date: <string> first date of range, format "dd/mm/yyyy"
+    :param end_date: <string> last date of range, format "dd/mm/yyyy"
+    :param window_days: <int> number of days per window
+    :return: <list> of (start_date, end_date) tuples in format "dd/mm/yyyy"
+    """
+    start = datetime.strptime(start_date, DATE_FORMAT)
+    end = datetime.strptime(end_date, DATE_FORMAT)
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start.strftime(DATE_FORMAT), window_end.strftime(DATE_FORMAT)))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def crawl_window(spider_name, start_date, end_date, dir_window):
+    """Crawl one date window in a separate scrapy process
+    :param spider_name: <string> name of the spider
+    :param start_date: <string> first date of window, format "dd/mm/yyyy"
+    :param end_date: <string> last date of window, format "dd/mm/yyyy"
+    :param dir_window: <string> output directory of the window
+    :return: <int> return code of the scrapy process
+    """
+    # start from empty directory as transaction files are appended to
+    if os.path.isdir(dir_window):
+        shutil.rmtree(dir_window)
+    os.makedirs(dir_window)
+    print("Start %s from %s to %s" % (spider_name, start_date, end_date))
+    cmd = [
+        sys.executable,
+        "-m",
+        "scrapy",
+        "crawl",
+        spider_name,
+        "-a",
+        "start_date=%s" % start_date,
+        "-a",
+        "end_date=%s" % end_date,
+        "-a",
+        "output_dir=%s" % dir_window,
+        "-s",
+        "TELEMETRY_DIR=%s" % dir_window,
+        "-L",
+        "INFO",
+        "--logfile",
+        os.path.join(dir_window, "crawl.log"),
+    ]
+    # run from project root such that scrapy finds the project settings
+    cwd = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    returncode = subprocess.run(cmd, cwd=cwd).returncode
+    print(
+        "Finished %s from %s to %s (return code %d)"
+        % (spider_name, start_date, end_date, returncode)
+    )
+    return returncode
+
+
+def get_key_columns(header, key):
+    """Function selecting the key columns of a csv row
+    :param header: <list> column names of the csv file
+    :param key: <list> names of the key columns
+    :return: <function> mapping a row to the list of its key values
+    """
+    missing = [c for c in key if c not in header]
+    if missing:
+        raise ValueError("Key columns %s not in header %s" % (missing, header))
+    idx = [header.index(c) for c in key]
+    return lambda row: [row[i] for i in idx]
+
+
+def merge_csv(fns_in, fn_out, append=False, key=None):
+    """Merge csv files with identical header skipping duplicated rows
+    :param fns_in: <list> of paths of files to merge
+    :param fn_out: <string> path of merged file
+    :param append: <boolean> append to existing output, rows already in
+                    the output are skipped
+    :param key: <list> columns identifying duplicated rows, defaults to all
+                    columns, the first row of each key is kept
+    :return: <tuple> number of written rows, number of duplicated rows
+    """
+    # 64 bit hashes in a flat array, a set of python objects takes several GB
+    # for the rows of all transaction blocks
+    seen = HashSet64()
+    header = None
+    get_key = lambda row: row
+    if append and os.path.isfile(fn_out):
+        with open(fn_out, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is not None and key is not None:
+                get_key = get_key_columns(header, key)
+            for row in reader:
+                seen.add(get_hash64(get_key(row)))
+    n_written, n_duplicated = 0, 0
+    mode = "a" if header is not None else "w"
+    with open(fn_out, mode, newline="", encoding="utf-8") as f_out:
+        writer = csv.writer(f_out)
+        for fn in fns_in:
+            if not os.path.isfile(fn):
+                continue
+            with open(fn, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                fn_header = next(reader, None)
+                if fn_header is None:
+                    continue
+                if header is None:
+                    header = fn_header
+                    writer.writerow(header)
+                    if key is not None:
+                        get_key = get_key_columns(header, key)
+                elif fn_header != header:
+                    raise ValueError("Header of %s differs from %s" % (fn, fn_out))
+                for row in reader:
+                    if not seen.add(get_hash64(get_key(row))):
+                        n_duplicated += 1
+                        continue
+                    writer.writerow(row)
+                    n_written += 1
+    return n_written, n_duplicated
+
+
+def crawl_date_windows(
+    spider_name,
+    start_date,
+    end_date,
+    window_days=365,
+    max_workers=4,
+    dir_out=DIR_PARSED,
+    dir_windows=None,
+):
+    """Crawl transactions in date windows using parallel scrapy processes and
+    merge the output of all windows.
+
+    Output files are merged in the same way the pipeline writes them, i.e.,
+    transactions and transaction blocks are appended to existing files while
+    ESD transactions and the account ID map are replaced. Rows appearing in
+    more than one window (or already in the existing output) are written once,
+    accounts of the account ID map once per account identifier.
+    :param spider_name: <string> "transactions" or "esd_transactions"
+    :param start_date: <string> first date of range, format "dd/mm/yyyy"
+    :param end_date: <string> last date of range, format "dd/mm/yyyy"
+    :param window_days: <int> number of days per window
+    :param max_workers: <int> maximal number of parallel scrapy processes
+    :param dir_out: <string> directory of the merged output
+    :param dir_windows: <string> directory for the output of the windows,
+                    defaults to sub-directory "windows" of dir_out
+    :return: <dict> output file: (number of written rows, number of duplicates)
+    """
+    if spider_name not in WINDOW_OUTPUTS:
+        raise ValueError("Spider %s can not be crawled in windows" % spider_name)
+    dir_windows = dir_windows or os.path.join(dir_out, "windows", spider_name)
+    windows = get_date_windows(start_date, end_date, window_days=window_days)
+    dirs_window = [
+        os.path.join(dir_windows, "%s_%s" % (s.replace("/", ""), e.replace("/", "")))
+        for s, e in windows
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        returncodes = list(
+            executor.map(
+                lambda x: crawl_window(spider_name, x[0][0], x[0][1], x[1]),
+                zip(windows, dirs_window),
+            )
+        )
+    failed = [w for w, rc in zip(windows, returncodes) if rc != 0]
+    if failed:
+        raise RuntimeError("Crawl failed for windows %s" % failed)
+
+    # merge output of windows in chronological order
+    appendExisting = {
+        os.path.basename(it["output_file_name"]): it["appendExisting"]
+        for it in EutlScraperPipeline.itemsToProcess
+    }
+    results = {}
+    for fn in WINDOW_OUTPUTS[spider_name]:
+        fns_window = [os.path.join(d, fn) for d in dirs_window]
+        # e.g., no account ID map if switched off, keep the existing file
+        if not any(os.path.isfile(x) for x in fns_window):
+            print("Skipped %s: not written by any window" % fn)
+            continue
+        results[fn] = merge_csv(
+            fns_window,
+            os.path.join(dir_out, fn),
+            append=appendExisting[fn],
+            key=WINDOW_OUTPUT_KEYS.get(fn),
+        )
+        print("Merged %s: %d rows, %d duplicates skipped" % ((fn,) + results[fn]))
+    # only the csv files hold the merged data
+    record_sources(
+        dir_out,
+        [os.path.splitext(fn)[0] for fn in results],
+        "csv",
+        get_run_id(spider_name),
+    )
+    return results
@@ -0,0 +1,12 @@
+from eutl_scraper.own_settings import DIR_PARSED
+from eutl_scraper.shards import consolidate_shards
+
+if __name__ == "__main__":
+    # merge the output shards of all runs into the csv files in ./data/parsed/
+    # e.g., after crawls run with SHARD_CONSOLIDATE=False
+    dir_out = DIR_PARSED
+
+    print("###### Consolidate shards in %s" % dir_out)
+    results = consolidate_shards(dir_out)
+    for name, rows in results.items():
+        print("###### %s: %d rows" % (name, rows))
@@ -0,0 +1,20 @@
+from eutl_scraper.runner import run_spiders, DEFAULT_SPIDERS
+
+if __name__ == "__main__":
+    # crawl accounts, entitlements, and effort sharing data in one process
+    # all spiders share one budget of concurrent downloads
+    spider_names = DEFAULT_SPIDERS
+    global_concurrency = 16
+
+    print("###### Crawl %s" % ", ".join(spider_names))
+    stats = run_spiders(spider_names, global_concurrency=global_concurrency)
+    for name, s in stats.items():
+        print(
+            "###### %s: %d pages, %d items (%s)"
+            % (
+                name,
+                s.get("response_received_count", 0),
+                s.get("item_scraped_count", 0),
+                s.get("finish_reason"),
+            )
+        )
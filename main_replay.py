@@ -0,0 +1,14 @@
+from eutl_scraper.replay import replay
+
+if __name__ == "__main__":
+    # re-parse the archived pages of a spider without downloading them
+    # pages have to be archived before by crawling with -s ARCHIVE_ENABLED=True
+    spider_name = "accounts"
+    dir_archive = "./data/archive/"
+
+    print("###### Replay archived pages of spider %s" % spider_name)
+    stats = replay(spider_name, dir_archive=dir_archive)
+    print(
+        "###### Replayed %d pages with %d items (%d pages not archived)"
+        % (stats["pages"], stats["items"], stats["missing"])
+    )
@@ -0,0 +1,19 @@
+from eutl_scraper.runner import retry_failed
+
+if __name__ == "__main__":
+    # request pages that failed in previous crawls again (recorded in the
+    # failure ledger, data/state/failures.db), items are appended to the output
+    global_concurrency = 4
+
+    print("###### Retry failed requests")
+    stats = retry_failed(global_concurrency=global_concurrency)
+    for name, s in stats.items():
+        print(
+            "###### %s: %d of %d failed requests recovered, %d items"
+            % (
+                name,
+                s.get("failures/recovered", 0),
+                s.get("failures/replayed", 0),
+                s.get("item_scraped_count", 0),
+            )
+        )
@@ -0,0 +1,20 @@
+from eutl_scraper.windows import crawl_date_windows
+
+if __name__ == "__main__":
+    # crawl transactions in yearly windows using parallel scrapy processes
+    # the output of all windows is merged into ./data/parsed/
+    spider_name = "transactions"  # or "esd_transactions"
+    start_date = "01/01/2005"
+    end_date = "31/12/2021"
+    window_days = 365
+    max_workers = 4
+
+    print("###### Crawl %s in date windows" % spider_name)
+    crawl_date_windows(
+        spider_name,
+        start_date,
+        end_date,
+        window_days=window_days,
+        max_workers=max_workers,
+        dir_out="./data/parsed/",
+    )
@@ -0,0 +1,55 @@
+import os
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from eutl_scraper.items import ComplianceItem, InstallationItem
+from eutl_scraper.spiders.AccountSpider import AccountSpider
+from eutl_scraper.state import CrawlLedger
+
+DIR_FIXTURES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures"
+)
+URL_INSTALLATION = "https://ec.europa.eu/clima/ets/ohaDetails.do?accountID=90574&action=all&languageCode=en"
+META_INSTALLATION = {
+    "accountID": "90574",
+    "registryCode": "DE",
+    "installationID": "DE_202",
+}
+
+
+def get_response(fn, url, meta):
+    with open(os.path.join(DIR_FIXTURES, fn), "rb") as f:
+        body = f.read()
+    return HtmlResponse(
+        url=url, body=body, encoding="utf-8", request=Request(url, meta=meta)
+    )
+
+
+def test_parse_installation_without_crawler(tmp_path):
+    # spiders built directly, e.g., by the benchmarks or the replay of
+    # archived pages, have the state otherwise set up in from_crawler
+    spider = AccountSpider()
+    spider.ledger = CrawlLedger(str(tmp_path / "ledger.db"))
+    response = get_response("installation.html", URL_INSTALLATION, META_INSTALLATION)
+    results = list(spider.parse_installation(response))
+
+    items = [x for x in results if not isinstance(x, Request)]
+    assert sum(isinstance(x, InstallationItem) for x in items) == 1
+    assert any(isinstance(x, ComplianceItem) for x in items)
+    requests = [x for x in results if isinstance(x, Request)]
+    assert len(requests) == 1
+    assert requests[0].meta["installationURL"] == URL_INSTALLATION
+
+    # the installation is only completed once its surrender page is parsed
+    assert spider.surrenders_open == {URL_INSTALLATION: 1}
+    assert not spider.is_completed("installation", URL_INSTALLATION)
+    surrender = HtmlResponse(
+        url=requests[0].url,
+        body=b"<html><body></body></html>",
+        encoding="utf-8",
+        request=requests[0],
+    )
+    list(spider.parse_surrendered_details(surrender))
+    assert spider.surrenders_open == {}
+    assert spider.is_completed("installation", URL_INSTALLATION)
+    assert spider.is_completed("account", "90574")
+    spider.ledger.close()
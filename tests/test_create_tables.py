@@ -0,0 +1,36 @@
+import pytest
+from eutl_data_augmentation.create_tables import get_parsed_source
+from eutl_scraper.shards import record_sources
+
+
+def write_parsed(dir_in, name):
+    (dir_in / (name + ".csv")).write_text("installationID\nAT_1\n")
+    (dir_in / (name + ".parquet")).mkdir()
+    (dir_in / (name + ".parquet") / "part-1.parquet").write_bytes(b"")
+
+
+def test_source_of_the_last_crawl_is_read(tmp_path):
+    dir_in = str(tmp_path) + "/"
+    for name in ["installations", "entitlements"]:
+        write_parsed(tmp_path, name)
+    # data without record are read from the csv files
+    assert get_parsed_source(dir_in, ["installations"]) == "csv"
+
+    # the csv pipeline closes after the parquet pipeline of the same crawl
+    record_sources(dir_in, ["installations", "entitlements"], "parquet", "run_1")
+    record_sources(dir_in, ["installations", "entitlements"], "csv", "run_1")
+    assert get_parsed_source(dir_in, ["installations", "entitlements"]) == "parquet"
+
+    # a later crawl without the parquet pipeline
+    record_sources(dir_in, ["entitlements"], "csv", "run_2")
+    assert get_parsed_source(dir_in, ["installations"]) == "parquet"
+    assert get_parsed_source(dir_in, ["installations", "entitlements"]) == "csv"
+    assert get_parsed_source(dir_in, ["entitlements"], source="parquet") == "parquet"
+
+
+def test_missing_source_of_the_last_crawl(tmp_path):
+    dir_in = str(tmp_path) + "/"
+    write_parsed(tmp_path, "installations")
+    record_sources(dir_in, ["installations"], "staging", "run_1")
+    with pytest.raises(FileNotFoundError):
+        get_parsed_source(dir_in, ["installations"])
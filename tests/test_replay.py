@@ -0,0 +1,29 @@
+from scrapy import Request
+from scrapy.utils.project import get_project_settings
+from eutl_scraper.replay import get_crawler, get_replay_settings, get_request, get_task
+from eutl_scraper.spiders.AccountSpider import AccountSpider
+
+
+def test_replay_spider_is_set_up_by_crawler():
+    settings = get_project_settings()
+    settings.set("JOBDIR", "unused")
+    crawler = get_crawler(AccountSpider, get_replay_settings(settings))
+    spider = AccountSpider.from_crawler(crawler)
+    assert spider.crawler is crawler
+    assert spider.ledger is None
+    assert spider.surrenders_open == {}
+
+
+def test_tasks_are_deduplicated_by_fingerprint():
+    crawler = get_crawler(AccountSpider, get_replay_settings(get_project_settings()))
+    url = "https://ec.europa.eu/clima/ets/oha.do"
+    requests = [
+        Request(url, method="POST", body=b"page=0", cb_kwargs={"page": 0}),
+        Request(url, method="POST", body=b"page=1", cb_kwargs={"page": 1}),
+    ]
+    tasks = [get_task(request) for request in requests]
+    restored = [get_request(task) for task in tasks]
+    assert [r.body for r in restored] == [b"page=0", b"page=1"]
+    assert [r.cb_kwargs for r in restored] == [{"page": 0}, {"page": 1}]
+    fingerprints = {crawler.request_fingerprinter.fingerprint(r) for r in restored}
+    assert len(fingerprints) == 2
@@ -0,0 +1,17 @@
+from eutl_scraper.state import AccountIdCache
+
+
+def test_account_id_caches_share_database(tmp_path):
+    # crawls of date windows run in parallel processes on the same database
+    fn = str(tmp_path / "accountIdMap.db")
+    cache_1, cache_2 = AccountIdCache(fn), AccountIdCache(fn)
+    assert cache_1.should_request("EU-100-1")
+    cache_1.resolve("EU-100-1", "1")
+    cache_2.resolve("EU-100-2", "2")
+    cache_2.load([("EU-100-3", "3"), ("EU-100-2", "2")])
+
+    cache = AccountIdCache(fn)
+    assert cache.previous == {"EU-100-1": "1", "EU-100-2": "2", "EU-100-3": "3"}
+    assert not cache.should_request("EU-100-3")
+    for x in [cache, cache_1, cache_2]:
+        x.close()
@@ -0,0 +1,30 @@
+from scrapy import Request, signals
+from scrapy.utils.project import get_project_settings
+from eutl_scraper.replay import get_crawler
+from eutl_scraper.spiders.TransactionSpider import TransactionSpider
+
+
+def test_block_requests_reaching_the_scheduler_are_counted():
+    settings = get_project_settings()
+    settings.set("ACCOUNT_ID_MAP_ENABLED", False)
+    crawler = get_crawler(TransactionSpider, settings)
+    spider = TransactionSpider.from_crawler(crawler)
+    url = "https://ec.europa.eu/clima/ets/singleTransaction.do?transactionID=EU1"
+    first = Request(url, callback=spider.parse_transaction_blocks)
+    next_page = Request(
+        url + "&page=1",
+        callback=spider.parse_transaction_blocks,
+        meta={"isFirstPage": False},
+    )
+    overview = Request(url, callback=spider.parse_overview)
+
+    for request in [first, first, next_page, overview]:
+        crawler.signals.send_catch_log(
+            signals.request_scheduled, request=request, spider=spider
+        )
+    # the duplicate is rejected by the scheduler
+    crawler.signals.send_catch_log(
+        signals.request_dropped, request=first, spider=spider
+    )
+    assert crawler.stats.get_value("transactions/block_requests_scheduled") == 2
+    assert crawler.stats.get_value("transactions/block_requests_dropped") == 1
@@ -0,0 +1,39 @@
+import csv
+from eutl_scraper.windows import merge_csv
+
+
+def write_csv(fn, rows):
+    with open(fn, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+
+
+def read_csv(fn):
+    with open(fn, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_merge_account_id_maps_by_identifier(tmp_path):
+    header = ["accountIdentifier", "accountID"]
+    fn_1, fn_2 = str(tmp_path / "1.csv"), str(tmp_path / "2.csv")
+    fn_out = str(tmp_path / "accountIdMap.csv")
+    write_csv(fn_1, [header, ["EU-100-1", "1"], ["EU-100-2", "2"]])
+    write_csv(fn_2, [header, ["EU-100-2", "2"], ["EU-100-3", "3"]])
+    write_csv(fn_out, [header, ["EU-100-0", "0"]])
+
+    assert merge_csv([fn_1, fn_2], fn_out, key=["accountIdentifier"]) == (3, 1)
+    assert read_csv(fn_out) == [
+        header,
+        ["EU-100-1", "1"],
+        ["EU-100-2", "2"],
+        ["EU-100-3", "3"],
+    ]
+
+
+def test_merge_appends_rows_not_in_output(tmp_path):
+    header = ["transactionID", "amount"]
+    fn_in, fn_out = str(tmp_path / "1.csv"), str(tmp_path / "transactions.csv")
+    write_csv(fn_in, [header, ["T1", "10"], ["T2", "20"]])
+    write_csv(fn_out, [header, ["T1", "10"]])
+
+    assert merge_csv([fn_in], fn_out, append=True) == (1, 1)
+    assert read_csv(fn_out) == [header, ["T1", "10"], ["T2", "20"]]